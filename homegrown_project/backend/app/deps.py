@@ -2,6 +2,9 @@ from . import database
 
 
 def get_db():
+    # Sync on purpose: the ORM is synchronous, so FastAPI runs opening and closing the
+    # session in its threadpool instead of on the event loop. Queries made inside an
+    # `async def` route still block the loop, so keep those short.
     db = database.SessionLocal()
     try:
         yield db
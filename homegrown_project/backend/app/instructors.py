@@ -1,5 +1,40 @@
-from dataclasses import dataclass
-from typing import Dict, Optional
+"""Instructor personas, loaded from prompt files instead of living in code.
+
+Each `*.md`/`*.txt` file under `HOMEGROWN_PERSONAS_DIR` (default `app/personas`; several
+directories may be joined with `os.pathsep`) is one persona. An optional header names it
+and the agents it teaches for:
+
+    ---
+    id: tera_byte1
+    display_name: Tera Byte
+    agents: tera_byte
+    routing: quiz_answer=small, code_review=large
+    ---
+    ### ROLE: Tera Byte ...
+
+Without a header the file name is the id. `routing` overrides the model routing policy
+(`HOMEGROWN_LLM_ROUTING`, see services/model_router.py) for this persona's turns. The registry rescans file mtimes at most every
+`HOMEGROWN_PERSONAS_RECHECK_SECONDS` and swaps in the new set atomically; a directory that
+fails to parse keeps the previous personas.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from .services.llm_service import estimate_tokens
+from .services.model_router import parse_policy
+from .services.prompt_cache import prompt_cache
+
+
+logger = logging.getLogger(__name__)
+
+PERSONA_EXTENSIONS = (".md", ".txt")
+HEADER_FIELDS = ("id", "display_name", "agents", "routing")
 
 
 @dataclass(frozen=True)
@@ -7,121 +42,194 @@ class InstructorPersona:
     id: str
     display_name: str
     system_instructions: str
+    agent_ids: Tuple[str, ...] = ()
+    # Content hash; changes whenever the instructions or header change.
+    version: str = ""
+    token_count: int = 0
+    source: Optional[str] = None
+    # Turn kind -> tier or model name, on top of the global routing policy.
+    routing: Dict[str, str] = field(default_factory=dict)
+
+
+class PersonaError(ValueError):
+    pass
+
+
+def parse_persona_file(path: str, text: str) -> InstructorPersona:
+    header: Dict[str, str] = {}
+    body = text
+    if text.startswith("---\n"):
+        end = text.find("\n---\n", 4)
+        if end == -1:
+            raise PersonaError(f"{path}: unterminated header")
+        for line in text[4:end].splitlines():
+            if not line.strip():
+                continue
+            name, sep, value = line.partition(":")
+            name = name.strip()
+            if not sep or name not in HEADER_FIELDS:
+                raise PersonaError(f"{path}: bad header line {line!r}")
+            header[name] = value.strip()
+        body = text[end + len("\n---\n"):]
+
+    instructions = body.strip()
+    if not instructions:
+        raise PersonaError(f"{path}: persona has no instructions")
+
+    persona_id = header.get("id") or os.path.splitext(os.path.basename(path))[0]
+    agent_ids = tuple(a.strip() for a in header.get("agents", "").split(",") if a.strip())
+    try:
+        routing = parse_policy(header.get("routing", ""))
+    except ValueError as e:
+        raise PersonaError(f"{path}: {e}")
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(repr((persona_id, agent_ids, sorted(routing.items()))).encode("utf-8"))
+    digest.update(instructions.encode("utf-8"))
+
+    return InstructorPersona(
+        id=persona_id,
+        display_name=header.get("display_name") or persona_id,
+        system_instructions=instructions,
+        agent_ids=agent_ids,
+        version=digest.hexdigest(),
+        token_count=estimate_tokens(instructions),
+        source=path,
+        routing=routing,
+    )
+
+
+def _default_dirs() -> List[str]:
+    configured = os.getenv("HOMEGROWN_PERSONAS_DIR")
+    if configured:
+        return [d for d in configured.split(os.pathsep) if d]
+    return [os.path.join(os.path.dirname(os.path.abspath(__file__)), "personas")]
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    personas: Dict[str, InstructorPersona]
+    by_agent: Dict[str, InstructorPersona]
+    fingerprint: Tuple[Tuple[str, int, int], ...]
+
+
+class PersonaRegistry:
+    """Personas parsed from prompt files, swapped as a whole when the files change.
+
+    Readers grab the current snapshot reference, so a reload never exposes a half-built
+    set. Only agents whose persona text changed get their rendered prompts dropped;
+    provider prefix handles are keyed by prefix hash, so unchanged personas keep theirs
+    and changed ones simply miss.
+    """
+
+    def __init__(self, dirs: List[str], recheck_seconds: float):
+        self.dirs = dirs
+        self.recheck_seconds = recheck_seconds
+        self.reloads = 0
+        self.reload_errors = 0
+        self._snapshot = _Snapshot(personas={}, by_agent={}, fingerprint=())
+        self._checked_at: Optional[float] = None
+        self._failed_fingerprint = None
+        self._lock = threading.Lock()
+
+    def _files(self) -> List[str]:
+        paths = []
+        for directory in self.dirs:
+            if not os.path.isdir(directory):
+                continue
+            for root, _, files in os.walk(directory):
+                paths.extend(os.path.join(root, name) for name in files if name.endswith(PERSONA_EXTENSIONS))
+        return sorted(paths)
+
+    def _fingerprint(self, paths: List[str]) -> Tuple[Tuple[str, int, int], ...]:
+        stamps = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            stamps.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(stamps)
+
+    def _build(self, fingerprint) -> _Snapshot:
+        personas: Dict[str, InstructorPersona] = {}
+        by_agent: Dict[str, InstructorPersona] = {}
+        for path, _, _ in fingerprint:
+            with open(path, encoding="utf-8") as f:
+                persona = parse_persona_file(path, f.read())
+            if persona.id in personas:
+                raise PersonaError(f"{path}: duplicate persona id '{persona.id}' (also in {personas[persona.id].source})")
+            personas[persona.id] = persona
+            for agent_id in persona.agent_ids:
+                if agent_id in by_agent:
+                    raise PersonaError(f"{path}: agent '{agent_id}' already uses persona '{by_agent[agent_id].id}'")
+                by_agent[agent_id] = persona
+        return _Snapshot(personas=personas, by_agent=by_agent, fingerprint=fingerprint)
+
+    def reload(self, force: bool = False) -> bool:
+        """Rescan the persona files; returns True if a new set was swapped in."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            fingerprint = self._fingerprint(self._files())
+            previous = self._snapshot
+            if not force and fingerprint in (previous.fingerprint, self._failed_fingerprint):
+                return False
+            try:
+                snapshot = self._build(fingerprint)
+            except (OSError, UnicodeDecodeError, PersonaError) as e:
+                # Remember the broken state so it is reported once, not on every recheck.
+                self._failed_fingerprint = fingerprint
+                self.reload_errors += 1
+                logger.error("Persona reload failed, keeping the previous personas: %s", e)
+                return False
+            self._snapshot, self._failed_fingerprint = snapshot, None
+            self.reloads += 1
+
+        changed_agents = {
+            agent_id
+            for agent_id in previous.by_agent.keys() | snapshot.by_agent.keys()
+            if getattr(previous.by_agent.get(agent_id), "version", None)
+            != getattr(snapshot.by_agent.get(agent_id), "version", None)
+        }
+        for agent_id in changed_agents:
+            prompt_cache.invalidate(agent_id=agent_id)
+        if previous.fingerprint and changed_agents:
+            logger.info("Reloaded personas for agents: %s", ", ".join(sorted(changed_agents)))
+        return True
+
+    def _current(self) -> _Snapshot:
+        checked_at = self._checked_at
+        if checked_at is None or time.monotonic() - checked_at >= self.recheck_seconds:
+            self.reload()
+        return self._snapshot
+
+    def get(self, persona_id: str) -> Optional[InstructorPersona]:
+        return self._current().personas.get(persona_id)
+
+    def for_agent(self, agent_id: str) -> Optional[InstructorPersona]:
+        return self._current().by_agent.get(agent_id)
+
+    def all(self) -> List[InstructorPersona]:
+        return list(self._current().personas.values())
+
+    def snapshot(self) -> dict:
+        personas = self._snapshot.personas.values()
+        return {
+            "personas": len(personas),
+            "tokens": sum(p.token_count for p in personas),
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+        }
 
 
-PERSONAS: Dict[str, InstructorPersona] = {
-    "daisy_dollars1": InstructorPersona(
-        id="daisy_dollars1",
-        display_name="Daisy Dollars-Personal Finance 101",
-        system_instructions=(
-            "### ROLE: Daisy Dollars (The Personal Finance Tutor)\n\n"
-            "You are **Daisy Dollars**, an enthusiastic, supportive, and highly relatable personal finance mentor. "
-            "You believe that financial literacy is the ultimate superpower for independence. "
-            "You speak like a savvy older sibling or a cool mentor—using high-school-relevant analogies (thrifting, gas money, first jobs) "
-            "while keeping things professional enough for a homeschool elective.\n\n"
-            "### CORE DIRECTIVES (DO NOT CHANGE):\n\n"
-            "1. **Student-Centric Journey:** You are teaching a high schooler. Every lesson must feel practical and empowering, never like a boring lecture.\n"
-            "2. **The \"Mentor\" Rule:** Never just lecture. Keep responses concise and **always** end with a thought-provoking or check-in question to keep the conversation flowing.\n"
-            "3. **Jargon-Free Zone:** If you must use a technical term (e.g., *Amortization* or *Compound Interest*), you must define it simply in plain English before moving on.\n"
-            "4. **Tone:** Upbeat, encouraging, and \"in-the-know.\" Use emojis like 💸, ✨, 🚗, 🏦.\n"
-            "5. **Safety & Guidance:** If the student asks about high-risk behaviors (like gambling or \"get rich quick\" schemes), gently redirect them to long-term wealth building and risk management.\n\n"
-            "### TEACHING STYLE:\n\n"
-            "* **Relatability First:** Use examples that matter to a teenager: saving for a first car, managing a debit card, understanding subscription costs, or saving for life after graduation.\n"
-            "* **Active Learning:** Use a \"Zero-Based Budget\" approach for financial planning exercises.\n"
-            "* **Celebration:** When the student understands a concept or passes a quiz, celebrate! (e.g., \"Boom! You're a total Money Boss! 💅\").\n\n"
-            "---\n\n"
-            "### CURRENT COURSE CONTEXT:\n\n"
-            "**Course Name:** Personal Finance 101: How to Manage Your Money.\n"
-            "**Student Level:** High School (Homeschool Elective)\n"
-            "**Current Goal:** Master the 4 core modules to achieve financial independence.\n"
-            "**Assessment Rules:**\n\n"
-            "* **Daily Mini-Quizzes:** 10 multiple-choice questions at the end of each daily segment. Do not provide answers until the student responds. Gently correct errors. 7 out 0f 10 is passing.\n"
-            "* **Post-Module Exams:** 20 questions. The student **must** pass to proceed to the next module. 17 out of 20 is passing.\n"
-            "* **The Final \"Money Boss\" Test:** A 50-question comprehensive exam (mix of MCQ and situational word problems) to certify course completion. 45 out of 50 is passing.\n\n"
-            "**Module 1: The Hustle & The Budget**\n\n"
-            "* **Goal:** Understand paychecks, taxes (Gross vs. Net), and setting up a zero-based budget.\n"
-            "* **Daisy’s Tip:** \"Gross pay is the dream, Net pay is the reality. Let’s make sure your reality still buys you tacos!\"\n\n"
-            "**Module 2: Banking & Growing Money**\n\n"
-            "* **Goal:** Checking vs. Savings accounts, the 'magic' of compound interest, and the 'Why/How' of emergency funds.\n\n"
-            "**Module 3: Credit & Borrowing**\n\n"
-            "* **Goal:** How credit cards actually work (they aren't free money!), building a credit score, and spotting debt traps.\n\n"
-            "**Module 4: Future Big Moves**\n\n"
-            "* **Goal:** The math behind buying a car (insurance, gas, maintenance) and financial planning for life after high school.\n\n"
-            "---\n\n"
-            "### STARTING THE CONVERSATION:\n\n"
-            "1. **Intro:** \"Hi there! I'm Daisy, your personal finance tutor! I'm so excited to help you become a total pro with your money.\"\n"
-            "2. **Identification:** Ask for the student's name and briefly explain the four modules you'll be covering over the next month.\n"
-            "3. **The \"Ready\" Check:** Ask if they are ready to begin.\n"
-            "4. **The Hook:** Once they say yes, ask: **\"What is your biggest financial goal right now? (Are we talking saving for a car, college, or just having more spending money for the weekend?)\"**\n"
-            "5. **Wait** for their response before launching into Module 1.\n\n"
-            "---\n\n"
-            "Is there anything else you'd like to tweak in the curriculum or the assessment rules before you deploy this?"
-        ),
-    ),
-
-    "tera_byte1": InstructorPersona(
-        id="tera_byte1",
-        display_name="Tera Byte-HTML Hero: Your First Website in an Hour!",
-        system_instructions=(
-            "### ROLE: Tera Byte (The Coding Mentor)\n"
-            "You are Tera Byte, a sentient, enthusiastic, and slightly 'glitchy' AI coding tutor. "
-            "You live inside the computer and believe that code is the closest thing humans have to magic. "
-            "You speak in tech-vernacular and gaming metaphors (e.g., 'leveling up,' 'spawning errors,' 'AFK').\n\n"
-            "### CORE DIRECTIVES (DO NOT CHANGE):\n"
-            "1.  **Environment First:** You MUST assume the student is using **Visual Studio Code (VS Code)**. "
-            "You will guide them on the install process after determining what OS they are using, as well as on using "
-            "the Integrated Terminal, Extensions (Live Server, Python), and Folder Management.\n"
-            "2.  **The 'Senior Dev' Rule:** Never just fix the code. If there is a bug, ask the student to read the error message first. "
-            "Guide them to the solution; do not spoon-feed it.\n"
-            "3.  **Tone:** Encouraging, high-energy, and geeky. Use emojis like 👾, 💻, 🚀.\n"
-            "4.  **Safety:** If a student wants to build something malicious (e.g., a password stealer), gently redirect them to 'White Hat' "
-            "security concepts instead. If the student tries to veer off topic, such as asking about harmful or irrelevant topics, gently redirect "
-            "them back to the topic at hand.\n\n"
-            "### TEACHING STYLE:\n"
-            "-   **Explain Like I'm 12:** Use analogies. Variables are 'boxes.' Loops are 'chores the robot does for you.'\n"
-            "-   **Celebration:** When code works, celebrate! (e.g., 'WOOT! Compiled successfully! 🎉').\n"
-            "-   **Debugging:** Treat bugs as 'Boss Battles.' They aren't failures; they are challenges to beat.\n\n"
-            "---\n"
-            "### CURRENT COURSE CONTEXT (EDIT THIS SECTION FOR NEW CLASSES):\n"
-            "**Course Name:** HTML Hero: Your First Website in an Hour!\n"
-            "**Student Level:** Beginner (ages 10-12 years)\n"
-            "**Current Goal:** From blank screen to live page. VS Code Skills: Extensions (Live Server), File Explorer.\n"
-            "**Prompt:** There are 4 modules. The student will take a 10 question quiz at the end of each module the ensure they are retaining the information. "
-            "The quizes should be fun but challenging. The student must score 7 correct out of 10 before they can proceed to the next module. For any incorrect "
-            "answers, gently guide the student to the correct one. If they do not score a passing grade, still guide them to the connect answers, but the student "
-            "must retake the quiz. The quiz should include the questions the student got wrong the first time, but change up the other questions as well to prevent "
-            "passing by sheer memorization. At the end of the course, the student must pass a 20 question exam in addition to submitting working code for their fina "
-            "project (in this case, a basic web page) to achieve course completion. The same rules apply to the final exam as the module quizzes, except the student "
-            "needs 17 out of 20 to pass.\n"
-            "Module 0: Setup (The Launchpad)\n\n"
-            "Goal: Install VS Code and the 'Live Server' extension.\n\n"
-            "Tera's Tip: 'Think of Live Server like a magic mirror. As soon as you save, the mirror updates!'\n\n"
-            "Module 1: The Skeleton (HTML Tags)\n\n"
-            "Goal: Create index.html. Write a Headline (h1) and a Paragraph (p).\n\n"
-            "Action: Student types ! and hits Tab in VS Code to generate the boilerplate (Emmet abbreviation).\n\n"
-            "Module 2: The Style (Inline CSS)\n\n"
-            "Goal: Change the background color and text color.\n\n"
-            "Action: style=\"background-color: black; color: lime;\" (The 'Hacker' aesthetic).\n\n"
-            "Module 3: The Image (Assets)\n\n"
-            "Goal: Drag an image file into the VS Code folder sidebar. Link it with <img>.\n\n"
-            "Deliverable: A 'Digital Business Card' with their name, a bio, and a funny picture."
-        ),
-    ),
-}
-
-
-AGENT_ID_TO_PERSONA_ID: Dict[str, str] = {
-    "daisy_dollars": "daisy_dollars1",
-    "tera_byte": "tera_byte1",
-}
+persona_registry = PersonaRegistry(
+    dirs=_default_dirs(),
+    recheck_seconds=float(os.getenv("HOMEGROWN_PERSONAS_RECHECK_SECONDS", "5")),
+)
 
 
 def get_persona(persona_id: str) -> Optional[InstructorPersona]:
-    return PERSONAS.get(persona_id)
+    return persona_registry.get(persona_id)
 
 
 def get_persona_for_agent(agent_id: str) -> Optional[InstructorPersona]:
-    persona_id = AGENT_ID_TO_PERSONA_ID.get(agent_id)
-    if not persona_id:
-        return None
-    return get_persona(persona_id)
+    return persona_registry.for_agent(agent_id)
@@ -1,15 +1,40 @@
+import time
+
+BOOT_STARTED = time.perf_counter()
+
+import asyncio
+import logging
+import signal
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import os
 from dotenv import load_dotenv
 
-from . import models, database
+# Init Environment. Before the app imports: the database, chat log writer, archive,
+# metrics, scheduler and cache settings are all read from the environment at import.
+load_dotenv(override=True)
+
+from . import database
+from .instructors import persona_registry
+from .metrics import MetricsMiddleware, instrument_engine, registry
+from .migrations import migrate, pending_migrations
 from .routers.chat import router as chat_router
 from .routers.enrollments import router as enrollments_router
+from .routers.metrics import router as metrics_router
 from .routers.uploads import router as uploads_router
+from .services.archive_service import segment_cache
+from .services.chat_log_writer import chat_log_writer
+from .services.course_catalog import course_catalog
+from .services.fact_service import fact_extractor
+from .services.prompt_cache import prompt_cache
+from .services.response_cache import response_cache
+from .services.turn_coordinator import turn_coordinator
+from .services.upload_service import sweep_partial_forever
+from .services.llm_service import LLMConfig, get_provider, providers, scheduler
 
-# Init Environment
-load_dotenv(override=True)
+logger = logging.getLogger(__name__)
+boot_timings = {"import_seconds": time.perf_counter() - BOOT_STARTED}
 
 app = FastAPI(title="Homegrown API")
 
@@ -27,8 +52,98 @@ app.add_middleware(
 app.include_router(chat_router, prefix="/api")
 app.include_router(enrollments_router, prefix="/api")
 app.include_router(uploads_router, prefix="/api")
+app.include_router(metrics_router)
+
+# --- Metrics ---
+app.add_middleware(MetricsMiddleware)
+instrument_engine(database.engine)
+registry.register_collector("llm_scheduler", scheduler.snapshot)
+registry.register_collector("llm_prefix_cache", lambda: get_provider().prefix_cache.stats() if get_provider().prefix_cache else {})
+registry.register_collector("response_cache", response_cache.snapshot)
+registry.register_collector("chat_log_writer", chat_log_writer.snapshot)
+registry.register_collector("archive_segments", segment_cache.snapshot)
+registry.register_collector("course_catalog", course_catalog.snapshot)
+registry.register_collector("fact_extractor", fact_extractor.snapshot)
+registry.register_collector("chat_turns", turn_coordinator.snapshot)
+registry.register_collector("persona_registry", persona_registry.snapshot)
+registry.register_collector("worker_boot", lambda: boot_timings)
+registry.register_collector("prompt_cache", lambda: {"entries": len(prompt_cache), "hits": prompt_cache.hits, "misses": prompt_cache.misses})
 
 # --- Initialization ---
 @app.on_event("startup")
 def startup():
-    models.Base.metadata.create_all(bind=database.engine)
\ No newline at end of file
+    # Schema changes belong to the deploy step (backend/migrate.py), not to every worker boot.
+    migrate_mode = os.getenv("HOMEGROWN_MIGRATE_ON_STARTUP", "check")
+    if migrate_mode == "run":
+        migrate(database.engine)
+    elif migrate_mode == "check":
+        pending = pending_migrations(database.engine)
+        if pending:
+            # Serving (and warming the catalog) against an old schema only fails later and less clearly.
+            raise RuntimeError(
+                "Database schema is behind (pending migrations: %s); run `python backend/migrate.py` "
+                "before starting the workers, or set HOMEGROWN_MIGRATE_ON_STARTUP=run for local dev"
+                % ", ".join(str(version) for version, _, _ in pending)
+            )
+
+    persona_registry.reload()
+
+    # Parse every curriculum once up front instead of on the first chat turn per course.
+    db = database.SessionLocal()
+    try:
+        course_catalog.load_all(db)
+    finally:
+        db.close()
+
+
+def _reload_llm_config():
+    load_dotenv(override=True)
+    providers.reload()
+    persona_registry.reload(force=True)
+
+
+def _log_warmup_failure(future: asyncio.Future) -> None:
+    # Not fatal: the first request that needs the SDK loads it (and reports the error) again.
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("LLM provider warmup failed", exc_info=future.exception())
+
+
+@app.on_event("startup")
+async def start_llm_providers():
+    # Build the provider (and its long-lived client) once per worker instead of per request.
+    provider = providers.configure(LLMConfig.from_env())
+    # The SDK import is slow, so by default it happens off the event loop while the worker
+    # already serves requests; "off" leaves it to the first call that needs it.
+    if provider.config.warmup == "blocking":
+        provider.warmup()
+    elif provider.config.warmup == "background":
+        warmup = asyncio.get_running_loop().run_in_executor(None, provider.warmup)
+        warmup.add_done_callback(_log_warmup_failure)
+
+    # `kill -HUP <worker pid>` re-reads .env/env vars, hot-swaps the provider and rereads personas.
+    if hasattr(signal, "SIGHUP"):
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, _reload_llm_config)
+        except (NotImplementedError, RuntimeError, ValueError):
+            # No signal support here (Windows, or the server runs off the main thread).
+            pass
+
+    boot_timings["ready_seconds"] = time.perf_counter() - BOOT_STARTED
+
+
+background_tasks = []
+
+
+@app.on_event("startup")
+async def start_upload_sweeper():
+    # Abandoned resumable sessions and half-received uploads would otherwise stay on disk forever.
+    background_tasks.append(asyncio.create_task(sweep_partial_forever()))
+
+
+@app.on_event("shutdown")
+async def flush_background_work():
+    for task in background_tasks:
+        task.cancel()
+    # Queued fact extraction and write-behind chat logs must hit the database before the worker exits.
+    await fact_extractor.close()
+    chat_log_writer.close()
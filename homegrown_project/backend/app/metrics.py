@@ -0,0 +1,292 @@
+"""Request tracing and Prometheus-style metrics, without external dependencies.
+
+`MetricsMiddleware` opens a `RequestTrace` per HTTP request. Services mark phases with
+`span("name")`, the engine listener counts DB queries, and the LLM layer reports token
+counts. All of it lands in the per-request trace (for the slow-request log) and in
+process-wide histograms/counters rendered by `/metrics`.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+
+logger = logging.getLogger("homegrown.slow_requests")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., count, sum]
+        self._series: Dict[LabelValues, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    le = _format_labels(self.labelnames, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{le} {count}")
+                inf = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{inf} {series[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[object] = []
+        self._collectors: Dict[str, Callable[[], dict]] = {}
+
+    def counter(self, *args, **kwargs) -> Counter:
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, prefix: str, snapshot: Callable[[], dict]) -> None:
+        """Expose a component's `snapshot()` numbers as `homegrown_<prefix>_<key>` gauges."""
+        self._collectors[prefix] = snapshot
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for prefix, snapshot in sorted(self._collectors.items()):
+            try:
+                values = snapshot()
+            except Exception:
+                logger.exception("Metrics collector %s failed", prefix)
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"homegrown_{prefix}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.histogram(
+    "homegrown_http_request_duration_seconds", "HTTP request latency.", ("method", "route", "status")
+)
+phase_seconds = registry.histogram("homegrown_phase_duration_seconds", "Time spent per request phase.", ("phase",))
+db_queries_per_request = registry.histogram(
+    "homegrown_db_queries_per_request", "DB statements issued per HTTP request.", ("route",), COUNT_BUCKETS
+)
+llm_input_tokens = registry.histogram(
+    "homegrown_llm_input_tokens", "Estimated prompt tokens per LLM call.", ("provider",), TOKEN_BUCKETS
+)
+llm_output_tokens = registry.histogram(
+    "homegrown_llm_output_tokens", "Estimated completion tokens per LLM call.", ("provider",), TOKEN_BUCKETS
+)
+llm_route_seconds = registry.histogram(
+    "homegrown_llm_route_duration_seconds", "LLM reply latency per turn route and model.", ("route", "model")
+)
+llm_route_tokens = registry.counter(
+    "homegrown_llm_route_tokens_total", "Estimated LLM tokens per turn route and model.", ("route", "model", "direction")
+)
+llm_route_fallbacks = registry.counter(
+    "homegrown_llm_route_fallbacks_total", "Turns whose routed model timed out or failed.", ("route", "model")
+)
+slow_requests_total = registry.counter("homegrown_slow_requests_total", "Requests over the slow-request threshold.")
+
+
+@dataclass
+class RequestTrace:
+    method: str
+    path: str
+    started: float = field(default_factory=time.perf_counter)
+    spans: Dict[str, float] = field(default_factory=dict)
+    db_queries: int = 0
+    llm_input_tokens: int = 0
+    llm_output_tokens: int = 0
+
+    def as_dict(self, status: int, duration: float) -> dict:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "duration_ms": round(duration * 1000, 1),
+            "spans_ms": {name: round(seconds * 1000, 1) for name, seconds in self.spans.items()},
+            "db_queries": self.db_queries,
+            "llm_input_tokens": self.llm_input_tokens,
+            "llm_output_tokens": self.llm_output_tokens,
+        }
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("homegrown_request_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str):
+    """Time a phase of the current request; repeated phases accumulate."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        phase_seconds.observe(elapsed, phase=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans[name] = trace.spans.get(name, 0.0) + elapsed
+
+
+def record_llm_tokens(provider: str, input_tokens: int, output_tokens: int) -> None:
+    llm_input_tokens.observe(input_tokens, provider=provider)
+    llm_output_tokens.observe(output_tokens, provider=provider)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.llm_input_tokens += input_tokens
+        trace.llm_output_tokens += output_tokens
+
+
+def record_llm_route(route: str, model: str, seconds: float, input_tokens: int, output_tokens: int) -> None:
+    llm_route_seconds.observe(seconds, route=route, model=model)
+    llm_route_tokens.inc(input_tokens, route=route, model=model, direction="input")
+    llm_route_tokens.inc(output_tokens, route=route, model=model, direction="output")
+
+
+def instrument_engine(engine) -> None:
+    """Count statements against the request that issued them."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count_query(conn, cursor, statement, parameters, context, executemany):
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.db_queries += 1
+
+
+@dataclass(frozen=True)
+class MetricsSettings:
+    enabled: bool
+    slow_request_ms: float
+
+    @classmethod
+    def from_env(cls) -> "MetricsSettings":
+        return cls(
+            enabled=os.getenv("HOMEGROWN_METRICS", "1") == "1",
+            slow_request_ms=float(os.getenv("HOMEGROWN_SLOW_REQUEST_MS", "0")),
+        )
+
+
+settings = MetricsSettings.from_env()
+
+
+def _route_label(scope) -> str:
+    """Route template (e.g. `/api/uploads/sessions/{upload_id}`) to keep label cardinality bounded.
+
+    Routes from included routers may only know their own template, so the router prefix
+    is recovered from the concrete path.
+    """
+    route = scope.get("route")
+    template, regex = getattr(route, "path", None), getattr(route, "path_regex", None)
+    if not template:
+        return "unmatched"
+    path = scope["path"]
+    if regex is not None and not regex.match(path):
+        for i, char in enumerate(path):
+            if char == "/" and i and regex.match(path[i:]):
+                return path[:i] + template
+    return template
+
+
+class MetricsMiddleware:
+    """ASGI middleware (not BaseHTTPMiddleware) so streamed responses are timed to the last byte."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(method=scope["method"], path=scope["path"])
+        token = _current_trace.set(trace)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            duration = time.perf_counter() - trace.started
+            route_label = _route_label(scope)
+
+            http_request_seconds.observe(duration, method=trace.method, route=route_label, status=status)
+            db_queries_per_request.observe(trace.db_queries, route=route_label)
+
+            if settings.slow_request_ms and duration * 1000 >= settings.slow_request_ms:
+                slow_requests_total.inc()
+                logger.warning("slow request %s", json.dumps(trace.as_dict(status, duration)))
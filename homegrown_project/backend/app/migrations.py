@@ -0,0 +1,178 @@
+"""Versioned schema migrations.
+
+`create_all` only creates missing tables, so anything that changes an existing table
+(new columns, new indexes) goes here. Each migration runs once; applied versions are
+recorded in `schema_migrations`. Migrations should be idempotent so they are safe on
+databases that were created fresh from the current models.
+
+Schema changes are applied once per deploy with `python backend/migrate.py`, not by
+every worker on boot; workers only check for pending versions (see `main.py`).
+"""
+
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+
+Migration = Tuple[int, str, Callable[[Connection], None]]
+
+
+def _add_column(conn: Connection, table: str, column: str, ddl: str) -> None:
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in existing:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _enrollment_memory_columns(conn: Connection) -> None:
+    _add_column(conn, "enrollments", "conversation_summary", "TEXT DEFAULT ''")
+    _add_column(conn, "enrollments", "summary_through_log_id", "INTEGER DEFAULT 0")
+
+
+def _chat_log_history_index(conn: Connection) -> None:
+    conn.execute(
+        text(
+            "CREATE INDEX IF NOT EXISTS ix_chat_logs_enrollment_timestamp_id "
+            "ON chat_logs (enrollment_id, timestamp, id)"
+        )
+    )
+
+
+def _enrollment_student_index(conn: Connection) -> None:
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_enrollments_student_id ON enrollments (student_id)"))
+
+
+def _course_version_column(conn: Connection) -> None:
+    _add_column(conn, "courses", "version", "INTEGER NOT NULL DEFAULT 1")
+
+
+def _enrollment_progress_column(conn: Connection) -> None:
+    _add_column(conn, "enrollments", "module_progress", "JSON")
+
+
+SQLITE_CHAT_SEARCH = [
+    # Contentless: the index keeps no copy of the text, and rows stay searchable after
+    # archive_service moves them out of chat_logs. `scope` holds "e<enrollment_id> <sender>".
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chat_logs_fts "
+    "USING fts5(content, scope, content='', tokenize='porter unicode61')",
+    "CREATE TRIGGER IF NOT EXISTS chat_logs_fts_insert AFTER INSERT ON chat_logs BEGIN "
+    "INSERT INTO chat_logs_fts (rowid, content, scope) "
+    "VALUES (new.id, new.content, 'e' || new.enrollment_id || ' ' || new.sender); END",
+    "INSERT INTO chat_logs_fts (rowid, content, scope) "
+    "SELECT id, content, 'e' || enrollment_id || ' ' || sender FROM chat_logs",
+]
+
+POSTGRES_CHAT_SEARCH = [
+    "CREATE TABLE IF NOT EXISTS chat_search ("
+    "log_id INTEGER PRIMARY KEY, enrollment_id INTEGER NOT NULL, sender VARCHAR, document TSVECTOR NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS ix_chat_search_document ON chat_search USING GIN (document)",
+    "CREATE INDEX IF NOT EXISTS ix_chat_search_enrollment_id ON chat_search (enrollment_id)",
+    "CREATE OR REPLACE FUNCTION chat_logs_search_insert() RETURNS trigger AS $$ BEGIN "
+    "INSERT INTO chat_search VALUES (NEW.id, NEW.enrollment_id, NEW.sender, "
+    "to_tsvector('english', coalesce(NEW.content, ''))) ON CONFLICT DO NOTHING; RETURN NEW; END $$ LANGUAGE plpgsql",
+    "DROP TRIGGER IF EXISTS chat_logs_search_insert ON chat_logs",
+    "CREATE TRIGGER chat_logs_search_insert AFTER INSERT ON chat_logs "
+    "FOR EACH ROW EXECUTE FUNCTION chat_logs_search_insert()",
+    "INSERT INTO chat_search SELECT id, enrollment_id, sender, to_tsvector('english', coalesce(content, '')) "
+    "FROM chat_logs ON CONFLICT DO NOTHING",
+]
+
+
+def _enrollment_version_column(conn: Connection) -> None:
+    _add_column(conn, "enrollments", "version", "INTEGER NOT NULL DEFAULT 1")
+
+
+def _upload_grading_columns(conn: Connection) -> None:
+    # Existing uploads stay NULL, i.e. outside the grading queue.
+    _add_column(conn, "uploads", "grade_status", "VARCHAR")
+    _add_column(conn, "uploads", "grade_attempts", "INTEGER DEFAULT 0")
+    _add_column(conn, "uploads", "grade_claimed_at", "TIMESTAMP")
+    _add_column(conn, "uploads", "graded_at", "TIMESTAMP")
+    _add_column(conn, "uploads", "grade", "JSON")
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_uploads_grade_status ON uploads (grade_status)"))
+
+
+def _agent_version_column(conn: Connection) -> None:
+    _add_column(conn, "agents", "version", "INTEGER NOT NULL DEFAULT 1")
+
+
+def _upload_blob_names(conn: Connection) -> None:
+    # stored_name used to be "<enrollment>_<timestamp>_<filename>", which never existed on disk.
+    conn.execute(
+        text(
+            "UPDATE uploads SET stored_name = 'blobs/' || substr(sha256, 1, 2) || '/' || sha256 "
+            "WHERE sha256 IS NOT NULL"
+        )
+    )
+
+
+def _chat_search_index(conn: Connection) -> None:
+    # Other dialects have no index; search_service falls back to scanning the hot table.
+    statements = {"sqlite": SQLITE_CHAT_SEARCH, "postgresql": POSTGRES_CHAT_SEARCH}.get(conn.dialect.name, [])
+    for statement in statements:
+        conn.execute(text(statement))
+
+
+MIGRATIONS: List[Migration] = [
+    (1, "enrollment conversation memory columns", _enrollment_memory_columns),
+    (2, "chat_logs (enrollment_id, timestamp, id) index", _chat_log_history_index),
+    (3, "enrollments.student_id index", _enrollment_student_index),
+    (4, "courses.version column", _course_version_column),
+    (5, "enrollments.module_progress column", _enrollment_progress_column),
+    (6, "full-text search index over chat_logs", _chat_search_index),
+    (7, "enrollments.version column", _enrollment_version_column),
+    (8, "uploads grading queue columns", _upload_grading_columns),
+    (9, "agents.version column", _agent_version_column),
+    (10, "uploads.stored_name points at the blob", _upload_blob_names),
+]
+
+
+def _ensure_version_table(conn: Connection) -> None:
+    conn.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, description VARCHAR, applied_at TIMESTAMP)"
+        )
+    )
+
+
+def applied_versions(conn: Connection) -> set:
+    _ensure_version_table(conn)
+    return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def pending_migrations(engine: Engine) -> List[Migration]:
+    """Migrations not yet applied. Read-only, so it is cheap enough for worker startup."""
+    with engine.connect() as conn:
+        if not inspect(conn).has_table("schema_migrations"):
+            return list(MIGRATIONS)
+        done = {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def run_migrations(engine: Engine) -> List[int]:
+    """Apply pending migrations in order; returns the versions that were applied."""
+    applied = []
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+
+    for version, description, migrate in MIGRATIONS:
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            migrate(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description, applied_at) VALUES (:v, :d, :t)"),
+                {"v": version, "d": description, "t": datetime.utcnow()},
+            )
+        applied.append(version)
+    return applied
+
+
+def migrate(engine: Engine) -> List[int]:
+    """Create missing tables, then apply pending migrations."""
+    from . import models
+
+    models.Base.metadata.create_all(bind=engine)
+    return run_migrations(engine)
@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Text, JSON, DateTime
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, LargeBinary, String, Text, JSON, DateTime
 from sqlalchemy.orm import relationship
 from .database import Base
 from datetime import datetime
@@ -17,30 +17,48 @@ class Agent(Base):
     id = Column(String, primary_key=True)
     name = Column(String)
     system_prompt_core = Column(Text)
+    # Bumped on every ORM update, like Course.version; the course catalog rechecks both.
+    version = Column(Integer, nullable=False, default=1)
     
     courses = relationship("Course", back_populates="agent")
 
+    __mapper_args__ = {"version_id_col": version}
+
 class Course(Base):
     __tablename__ = "courses"
     id = Column(String, primary_key=True)
     title = Column(String)
     agent_id = Column(String, ForeignKey("agents.id"))
     curriculum_json = Column(JSON)
+    # Bumped on every ORM update; the course catalog compares it to spot edits from other workers.
+    version = Column(Integer, nullable=False, default=1)
     
     agent = relationship("Agent", back_populates="courses")
 
+    __mapper_args__ = {"version_id_col": version}
+
 class Enrollment(Base):
     __tablename__ = "enrollments"
     id = Column(Integer, primary_key=True, index=True)
-    student_id = Column(Integer, ForeignKey("users.id"))
+    student_id = Column(Integer, ForeignKey("users.id"), index=True)
     course_id = Column(String, ForeignKey("courses.id"))
     current_module_index = Column(Integer, default=0)
     student_facts = Column(JSON, default=dict)
+    # Rolling summary of turns that no longer fit in the prompt's history window.
+    conversation_summary = Column(Text, default="")
+    summary_through_log_id = Column(Integer, default=0)
+    # Per-module evaluation state and quiz scores, keyed by module id (see progress_service).
+    module_progress = Column(JSON, default=dict)
+    # Bumped on every ORM update so concurrent chat turns can't both advance the module.
+    version = Column(Integer, nullable=False, default=1)
     
     # --- THIS WAS THE MISSING LINK ---
     student = relationship("User", back_populates="enrollments")
     course = relationship("Course") # <--- I forgot this line before.
     chat_logs = relationship("ChatLog", back_populates="enrollment")
+    uploads = relationship("Upload", back_populates="enrollment")
+
+    __mapper_args__ = {"version_id_col": version}
 
 class ChatLog(Base):
     __tablename__ = "chat_logs"
@@ -50,4 +68,43 @@ class ChatLog(Base):
     content = Column(Text)
     timestamp = Column(DateTime, default=datetime.utcnow)
     
-    enrollment = relationship("Enrollment", back_populates="chat_logs")
\ No newline at end of file
+    enrollment = relationship("Enrollment", back_populates="chat_logs")
+
+    __table_args__ = (
+        # Serves history reads and keyset pagination on (timestamp, id) per enrollment.
+        Index("ix_chat_logs_enrollment_timestamp_id", "enrollment_id", "timestamp", "id"),
+    )
+
+class ChatLogSegment(Base):
+    """Compressed block of old ChatLog rows for one enrollment (see archive_service)."""
+    __tablename__ = "chat_log_segments"
+    id = Column(Integer, primary_key=True, index=True)
+    enrollment_id = Column(Integer, ForeignKey("enrollments.id"), index=True)
+    first_log_id = Column(Integer)
+    last_log_id = Column(Integer)
+    first_timestamp = Column(DateTime)
+    last_timestamp = Column(DateTime)
+    row_count = Column(Integer)
+    codec = Column(String, default="zlib-json")
+    payload = Column(LargeBinary)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class Upload(Base):
+    __tablename__ = "uploads"
+    id = Column(Integer, primary_key=True, index=True)
+    enrollment_id = Column(Integer, ForeignKey("enrollments.id"), index=True)
+    filename = Column(String)
+    stored_name = Column(String)
+    content_type = Column(String)
+    size_bytes = Column(Integer)
+    # Blobs are content-addressed, so identical files share one copy on disk.
+    sha256 = Column(String(64), index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Offline grading queue (see grading_service): pending -> grading -> graded/skipped/needs_review.
+    grade_status = Column(String, index=True)
+    grade_attempts = Column(Integer, default=0)
+    grade_claimed_at = Column(DateTime)
+    graded_at = Column(DateTime)
+    grade = Column(JSON)
+
+    enrollment = relationship("Enrollment", back_populates="uploads")
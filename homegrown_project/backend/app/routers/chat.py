@@ -1,58 +1,152 @@
+import json
+import logging
+from typing import Optional
+
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from ..deps import get_db
-from ..schemas import ChatHistoryResponse, ChatRequest, ChatResponse
-from ..services.chat_service import handle_chat
-from .. import models
+from ..schemas import ChatHistoryResponse, ChatRequest, ChatResponse, ChatSearchResponse
+from ..services.chat_log_writer import ensure_logs_visible, record_chat_logs
+from ..services.chat_service import handle_chat, stream_chat
+from ..services.fact_service import fact_extractor
+from ..services.history_service import fetch_history_page
+from ..services.llm_service import LLMOverloadedError
+from ..services.response_cache import split_cached_response
+from ..services.search_service import search_chat_logs
+from ..services.turn_coordinator import turn_coordinator
+from .. import database, models
+from ..metrics import span
+
 
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
 
+def _turn_rows(enrollment_id: int, user_message: str, ai_text: str):
+    return [
+        {"enrollment_id": enrollment_id, "sender": "student", "content": user_message},
+        {"enrollment_id": enrollment_id, "sender": "agent", "content": ai_text},
+    ]
+
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat_endpoint(request: ChatRequest, db: Session = Depends(get_db)):
-    enrollment, ai_text, workspace_update = handle_chat(
-        db=db,
-        enrollment_id=request.enrollment_id,
-        user_message=request.message,
-    )
+    # Repeats of an in-flight message (or of an idempotency key) get the first turn's reply.
+    async with turn_coordinator.turn(request.enrollment_id, request.message, request.idempotency_key) as flight:
+        if not flight.leader:
+            return await flight.result()
+
+        enrollment, ai_text, workspace_update = await handle_chat(
+            db=db,
+            enrollment_id=request.enrollment_id,
+            user_message=request.message,
+        )
+
+        with span("chat_log_write"):
+            await record_chat_logs(db, _turn_rows(enrollment.id, request.message, ai_text))
+            db.commit()
+        fact_extractor.submit(enrollment.id, request.message, ai_text)
+
+        response = {"agent_response": ai_text, "workspace_update": workspace_update}
+        flight.resolve(response)
+    return response
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 
-    db.add(models.ChatLog(enrollment_id=enrollment.id, sender="student", content=request.message))
-    db.add(models.ChatLog(enrollment_id=enrollment.id, sender="agent", content=ai_text))
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    # The session has to outlive the handler (logs are written once the stream ends),
+    # so it is managed here instead of through the get_db dependency.
+    db = database.SessionLocal()
+    try:
+        enrollment, events = stream_chat(
+            db=db,
+            enrollment_id=request.enrollment_id,
+            user_message=request.message,
+        )
+    except Exception:
+        db.close()
+        raise
 
-    db.commit()
+    async def event_stream():
+        try:
+            async with turn_coordinator.turn(enrollment.id, request.message, request.idempotency_key) as flight:
+                if not flight.leader:
+                    # A repeat submit: replay the first turn's reply instead of running it again.
+                    payload = await flight.result()
+                    for piece in split_cached_response(payload["agent_response"]):
+                        yield _sse("token", {"text": piece})
+                    if payload["workspace_update"]:
+                        yield _sse("workspace_update", payload["workspace_update"])
+                    yield _sse("done", payload)
+                    return
 
-    return {"agent_response": ai_text, "workspace_update": workspace_update}
+                async for event, payload in events:
+                    if event == "token":
+                        yield _sse("token", {"text": payload})
+                        continue
+
+                    rows = _turn_rows(enrollment.id, request.message, payload["agent_response"])
+                    with span("chat_log_write"):
+                        await record_chat_logs(db, rows)
+                        db.commit()
+                    fact_extractor.submit(enrollment.id, request.message, payload["agent_response"])
+                    flight.resolve(payload)
+
+                    if payload["workspace_update"]:
+                        yield _sse("workspace_update", payload["workspace_update"])
+                    yield _sse("done", payload)
+        except LLMOverloadedError:
+            yield _sse("error", {"detail": "Tutor is busy, please retry"})
+        except HTTPException as e:
+            yield _sse("error", {"detail": e.detail})
+        except Exception:
+            # The 200 and its headers are already sent; tell the client instead of just hanging up.
+            logger.exception("Chat stream failed for enrollment %s", enrollment.id)
+            yield _sse("error", {"detail": "Something went wrong, please retry"})
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.get("/chat/history", response_model=ChatHistoryResponse)
 async def chat_history_endpoint(
     enrollment_id: int = Query(..., ge=1),
     limit: int = Query(50, ge=1, le=500),
+    before: Optional[str] = Query(None),
+    after: Optional[str] = Query(None),
+    since_id: Optional[int] = Query(None, ge=0),
     db: Session = Depends(get_db),
 ):
     enrollment = db.query(models.Enrollment).filter(models.Enrollment.id == enrollment_id).first()
     if not enrollment:
         raise HTTPException(status_code=404, detail="Enrollment not found")
 
-    logs = (
-        db.query(models.ChatLog)
-        .filter(models.ChatLog.enrollment_id == enrollment_id)
-        .order_by(models.ChatLog.timestamp.desc())
-        .limit(limit)
-        .all()
-    )
-    logs.reverse()
-
-    items = [
-        {
-            "id": log.id,
-            "sender": log.sender,
-            "content": log.content,
-            "timestamp": log.timestamp.isoformat() if log.timestamp else "",
-        }
-        for log in logs
-    ]
+    await ensure_logs_visible(enrollment_id)
 
-    return {"enrollment_id": enrollment_id, "items": items}
+    return fetch_history_page(db, enrollment_id, limit, before=before, after=after, since_id=since_id)
+
+
+@router.get("/chat/search", response_model=ChatSearchResponse)
+async def chat_search_endpoint(
+    q: str = Query(..., min_length=1, max_length=200),
+    # Required: without a login, an unscoped search would expose every student's transcript.
+    enrollment_id: int = Query(..., ge=1),
+    sender: Optional[str] = Query(None),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000),
+    db: Session = Depends(get_db),
+):
+    await ensure_logs_visible(enrollment_id)
+    return search_chat_logs(db, q, enrollment_id=enrollment_id, sender=sender, limit=limit, offset=offset)
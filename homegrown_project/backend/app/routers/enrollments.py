@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 
 from ..deps import get_db
+from ..services.course_catalog import course_catalog
 from .. import models
 
 
@@ -9,32 +12,52 @@ router = APIRouter()
 
 
 @router.get("/enrollments")
-def list_enrollments(db: Session = Depends(get_db)):
-    enrollments = db.query(models.Enrollment).all()
-
-    results = []
+def list_enrollments(
+    student_id: Optional[int] = Query(None, ge=1, description="Only this student's enrollments"),
+    after: Optional[int] = Query(None, ge=0, description="Return enrollments with id greater than this cursor"),
+    limit: int = Query(50, ge=1, le=200),
+    db: Session = Depends(get_db),
+):
+    """Enrollments in id order, `limit` at a time; pass `next_cursor` as `after` for the next page.
+
+    Without `student_id` this lists every student's enrollments. That listing is for
+    admins and the local dev picker only: there is no login yet, so deployments that
+    expose the API to students must scope it (the frontend does via VITE_STUDENT_ID)
+    or keep this route behind their admin proxy.
+    """
+    query = db.query(models.Enrollment)
+    if student_id is not None:
+        query = query.filter(models.Enrollment.student_id == student_id)
+    if after is not None:
+        query = query.filter(models.Enrollment.id > after)
+
+    enrollments = query.order_by(models.Enrollment.id).limit(limit + 1).all()
+    has_more = len(enrollments) > limit
+    enrollments = enrollments[:limit]
+
+    # Course titles, agents and module summaries come from the parsed catalog.
+    courses = course_catalog.get_many(db, {e.course_id for e in enrollments})
+
+    items = []
     for e in enrollments:
-        course = e.course
-        agent = course.agent if course else None
-
-        curriculum = getattr(course, "curriculum_json", None) if course else None
-        modules = curriculum.get("modules") if isinstance(curriculum, dict) else None
-        total_modules = len(modules) if isinstance(modules, list) else None
-        current_mod = None
-        if isinstance(modules, list) and 0 <= e.current_module_index < len(modules):
-            current_mod = modules[e.current_module_index]
+        course = courses.get(e.course_id)
+        module = course.module(e.current_module_index) if course else None
 
-        results.append(
+        items.append(
             {
                 "enrollment_id": e.id,
-                "course_id": getattr(course, "id", None),
-                "course_title": getattr(course, "title", None),
-                "agent_name": getattr(agent, "name", None),
+                "course_id": course.course_id if course else None,
+                "course_title": course.title if course else None,
+                "agent_name": course.agent_name if course else None,
                 "current_module_index": e.current_module_index,
-                "total_modules": total_modules,
-                "current_module_title": current_mod.get("title") if isinstance(current_mod, dict) else None,
-                "current_module_objective": current_mod.get("objective") if isinstance(current_mod, dict) else None,
+                "total_modules": course.total_modules if course else None,
+                "current_module_title": module.title if module else None,
+                "current_module_objective": module.objective if module else None,
             }
         )
 
-    return results
+    return {
+        "items": items,
+        "has_more": has_more,
+        "next_cursor": enrollments[-1].id if has_more else None,
+    }
@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from ..metrics import registry
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    # Prometheus text exposition format.
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
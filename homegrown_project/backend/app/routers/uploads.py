@@ -1,56 +1,171 @@
-import os
-from datetime import datetime
-
-from fastapi import APIRouter, Depends, File, Form, UploadFile, HTTPException
+from fastapi import APIRouter, Depends, Query, Request, HTTPException
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 
 from ..deps import get_db
+from ..services import upload_service
+from ..services.chat_log_writer import record_chat_logs
 from .. import models
 
 
 router = APIRouter()
 
 
-@router.post("/uploads")
-async def upload_file(
-    enrollment_id: int = Form(...),
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-):
+class UploadSessionRequest(BaseModel):
+    enrollment_id: int
+    filename: str
+    content_type: str = "application/octet-stream"
+    total_bytes: int = Field(..., ge=1)
+
+
+def _get_enrollment(db: Session, enrollment_id: int) -> models.Enrollment:
     enrollment = db.query(models.Enrollment).filter(models.Enrollment.id == enrollment_id).first()
     if not enrollment:
         raise HTTPException(status_code=404, detail="Enrollment not found")
+    return enrollment
 
-    uploads_dir = os.getenv("HOMEGROWN_UPLOADS_DIR")
-    if not uploads_dir:
-        uploads_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uploads")
-        uploads_dir = os.path.abspath(uploads_dir)
 
-    os.makedirs(uploads_dir, exist_ok=True)
+async def _log_upload(db: Session, upload: models.Upload, deduplicated: bool) -> dict:
+    await record_chat_logs(
+        db,
+        [
+            {
+                "enrollment_id": upload.enrollment_id,
+                "sender": "system",
+                "content": (
+                    f"[FILE_UPLOADED] {upload.filename} stored at {upload.stored_name} "
+                    f"({upload.content_type}, {upload.size_bytes} bytes)"
+                ),
+            }
+        ],
+    )
+    db.commit()
 
-    safe_name = os.path.basename(file.filename or "upload")
-    timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-    stored_name = f"{enrollment_id}_{timestamp}_{safe_name}"
-    stored_path = os.path.join(uploads_dir, stored_name)
+    return {
+        "ok": True,
+        "enrollment_id": upload.enrollment_id,
+        "upload_id": upload.id,
+        "filename": upload.filename,
+        "stored_name": upload.stored_name,
+        "content_type": upload.content_type,
+        "bytes": upload.size_bytes,
+        "sha256": upload.sha256,
+        "deduplicated": deduplicated,
+        "grade_status": upload.grade_status,
+    }
+
+
+# Multipart framing (boundaries, part headers, the enrollment_id field) on top of the file bytes.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+def upload_content_length(request: Request) -> int:
+    """Reject oversized or unsized multipart bodies from the headers alone, before any of it is read."""
+    if "chunked" in request.headers.get("transfer-encoding", "").lower():
+        raise HTTPException(status_code=411, detail="Chunked uploads are not accepted; send a Content-Length")
+    content_length = request.headers.get("content-length", "")
+    if not content_length.isdigit():
+        raise HTTPException(status_code=411, detail="Content-Length is required")
+    if int(content_length) > upload_service.settings.max_file_bytes + MULTIPART_OVERHEAD_BYTES:
+        limit = upload_service.settings.max_file_bytes
+        raise HTTPException(status_code=413, detail=f"Upload exceeds the {limit} byte limit")
+    return int(content_length)
 
-    contents = await file.read()
-    with open(stored_path, "wb") as f:
-        f.write(contents)
 
-    db.add(
-        models.ChatLog(
-            enrollment_id=enrollment_id,
-            sender="system",
-            content=f"[FILE_UPLOADED] {stored_name} ({file.content_type}, {len(contents)} bytes)",
-        )
+def _form_enrollment_id(value) -> int:
+    if not isinstance(value, str) or not value.strip().isdigit():
+        raise HTTPException(status_code=422, detail="enrollment_id must be an integer form field sent before the file")
+    return int(value)
+
+
+# No Form/File parameters here: FastAPI would parse and spool the whole body before
+# `upload_content_length` gets to look at the headers. The body is parsed as it streams
+# in, straight into a temp file that then moves into blob storage.
+@router.post("/uploads")
+async def upload_file(
+    request: Request,
+    content_length: int = Depends(upload_content_length),
+    db: Session = Depends(get_db),
+):
+    def file_limit(fields) -> int:
+        enrollment_id = _form_enrollment_id(fields.get("enrollment_id"))
+        _get_enrollment(db, enrollment_id)
+        limit = upload_service.upload_allowance(db, enrollment_id)
+        if content_length > limit + MULTIPART_OVERHEAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds the {limit} byte limit")
+        # Release the read transaction; the quota is re-checked under a lock once the file is in.
+        db.rollback()
+        return limit
+
+    received = await upload_service.receive_multipart(
+        request.headers.get("content-type", ""), request.stream(), file_limit
     )
-    db.commit()
+    upload, deduplicated = upload_service.record_upload(
+        db,
+        int(received.fields["enrollment_id"]),
+        received.filename,
+        received.content_type,
+        received.size,
+        received.sha256,
+        received.tmp_path,
+    )
+    return await _log_upload(db, upload, deduplicated)
+
 
+@router.get("/uploads/{upload_id}/grade")
+def get_upload_grade(upload_id: int, db: Session = Depends(get_db)):
+    upload = db.query(models.Upload).filter(models.Upload.id == upload_id).first()
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
     return {
-        "ok": True,
-        "enrollment_id": enrollment_id,
-        "filename": safe_name,
-        "stored_name": stored_name,
-        "content_type": file.content_type,
-        "bytes": len(contents),
+        "upload_id": upload.id,
+        "enrollment_id": upload.enrollment_id,
+        "grade_status": upload.grade_status,
+        "graded_at": upload.graded_at.isoformat() if upload.graded_at else None,
+        "grade": upload.grade,
     }
+
+
+# --- Resumable uploads ---
+#
+# 1. POST /uploads/sessions               -> {upload_id, offset: 0, chunk_size}
+# 2. PUT  /uploads/sessions/{id}?offset=N  (raw bytes; repeat until done)
+#    GET  /uploads/sessions/{id}           -> current offset, to resume after a dropped connection
+# 3. POST /uploads/sessions/{id}/complete  -> same payload as POST /uploads
+
+
+@router.post("/uploads/sessions")
+def create_upload_session(request: UploadSessionRequest, db: Session = Depends(get_db)):
+    _get_enrollment(db, request.enrollment_id)
+
+    limit = upload_service.upload_allowance(db, request.enrollment_id)
+    if request.total_bytes > limit:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds the {limit} byte limit")
+
+    meta = upload_service.create_session(
+        request.enrollment_id,
+        upload_service.safe_filename(request.filename),
+        request.content_type,
+        request.total_bytes,
+    )
+    return {**meta, "offset": 0, "chunk_size": upload_service.settings.chunk_size}
+
+
+@router.get("/uploads/sessions/{upload_id}")
+def get_upload_session(upload_id: str):
+    return upload_service.load_session(upload_id)
+
+
+@router.put("/uploads/sessions/{upload_id}")
+async def put_upload_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    return await upload_service.append_session_chunk(upload_id, offset, request.stream())
+
+
+@router.post("/uploads/sessions/{upload_id}/complete")
+async def complete_upload_session(upload_id: str, db: Session = Depends(get_db)):
+    meta = upload_service.load_session(upload_id)
+    _get_enrollment(db, meta["enrollment_id"])
+    db.rollback()
+
+    _, upload, deduplicated = await upload_service.complete_session(db, upload_id)
+    return await _log_upload(db, upload, deduplicated)
@@ -1,10 +1,12 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 
 
 class ChatRequest(BaseModel):
     enrollment_id: int
     message: str
+    # Client-generated per submission and reused on retries; a repeat gets the first reply.
+    idempotency_key: Optional[str] = Field(None, min_length=1, max_length=128)
 
 
 class ChatResponse(BaseModel):
@@ -22,3 +24,26 @@ class ChatHistoryItem(BaseModel):
 class ChatHistoryResponse(BaseModel):
     enrollment_id: int
     items: List[ChatHistoryItem]
+    has_more: bool = False
+    # Pass as `before` to page back / `after` to page forward.
+    before_cursor: Optional[str] = None
+    after_cursor: Optional[str] = None
+    # Highest id in this page; pass as `since_id` to poll for new messages.
+    last_id: Optional[int] = None
+
+
+class ChatSearchHit(BaseModel):
+    id: int
+    enrollment_id: int
+    sender: str
+    timestamp: str
+    snippet: str
+    # True when the message has been moved to cold storage.
+    archived: bool = False
+
+
+class ChatSearchResponse(BaseModel):
+    query: str
+    items: List[ChatSearchHit]
+    has_more: bool = False
+    next_offset: Optional[int] = None
@@ -0,0 +1,312 @@
+"""Hot/cold tiering for chat logs.
+
+`compact` moves an enrollment's oldest ChatLog rows into `ChatLogSegment`s (zlib-compressed
+JSON, up to `segment_rows` rows each) and deletes them from `chat_logs`, so the hot table
+and its indexes only hold recent conversation. The newest `keep_recent` rows of every
+enrollment always stay hot, which keeps conversation memory and the first history page
+off the archive.
+
+Because only the oldest rows are moved, an enrollment's archived rows always sort before
+its hot rows; history paging relies on that to read segments only past the end of the
+hot table. The full-text index is not touched, so archived rows remain searchable.
+Rows conversation memory has not summarized yet are folded into the enrollment's summary
+in the same transaction that archives them, since memory only reads the hot table.
+"""
+
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, tuple_, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from .. import models
+from .memory_service import roll_summary, settings as memory_settings
+
+
+CODEC = "zlib-json"
+
+
+class ArchivedLog(NamedTuple):
+    """Read-only stand-in for a ChatLog row that lives in a segment."""
+
+    id: int
+    enrollment_id: int
+    sender: str
+    content: str
+    timestamp: datetime
+
+
+@dataclass(frozen=True)
+class ArchiveSettings:
+    archive_after_days: int
+    keep_recent: int
+    segment_rows: int
+    cache_segments: int
+
+    @classmethod
+    def from_env(cls) -> "ArchiveSettings":
+        return cls(
+            archive_after_days=int(os.getenv("HOMEGROWN_ARCHIVE_AFTER_DAYS", "90")),
+            keep_recent=int(os.getenv("HOMEGROWN_ARCHIVE_KEEP_RECENT", "200")),
+            segment_rows=int(os.getenv("HOMEGROWN_ARCHIVE_SEGMENT_ROWS", "2000")),
+            cache_segments=int(os.getenv("HOMEGROWN_ARCHIVE_CACHE_SEGMENTS", "64")),
+        )
+
+
+settings = ArchiveSettings.from_env()
+
+
+def encode_segment(rows: Iterable) -> bytes:
+    payload = [[r.id, r.sender, r.content, r.timestamp.isoformat() if r.timestamp else None] for r in rows]
+    return zlib.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def decode_segment(segment: models.ChatLogSegment) -> List[ArchivedLog]:
+    if segment.codec != CODEC:
+        raise ValueError(f"Unknown chat log segment codec '{segment.codec}'")
+    rows = json.loads(zlib.decompress(segment.payload).decode("utf-8"))
+    return [
+        ArchivedLog(
+            id=log_id,
+            enrollment_id=segment.enrollment_id,
+            sender=sender,
+            content=content,
+            timestamp=datetime.fromisoformat(timestamp) if timestamp else None,
+        )
+        for log_id, sender, content, timestamp in rows
+    ]
+
+
+class SegmentCache:
+    """Small LRU of decoded segments; segments never change once written."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, List[ArchivedLog]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def rows(self, segment: models.ChatLogSegment) -> List[ArchivedLog]:
+        with self._lock:
+            rows = self._entries.get(segment.id)
+            if rows is not None:
+                self._entries.move_to_end(segment.id)
+                self.hits += 1
+                return rows
+            self.misses += 1
+
+        rows = decode_segment(segment)
+        with self._lock:
+            self._entries[segment.id] = rows
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return rows
+
+    def snapshot(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+segment_cache = SegmentCache(settings.cache_segments)
+
+
+# --- Reading ---
+
+def iter_archived(
+    db: Session,
+    enrollment_id: int,
+    newest_first: bool,
+    before: Optional[Tuple[datetime, int]] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+    since_id: Optional[int] = None,
+) -> Iterator[ArchivedLog]:
+    """Archived rows of an enrollment in (timestamp, id) order, filtered like the history query.
+
+    Segment metadata prunes whole segments, so only ones that can contain matches are decoded.
+    """
+    Segment = models.ChatLogSegment
+    query = db.query(Segment).filter(Segment.enrollment_id == enrollment_id)
+    if before is not None:
+        query = query.filter(Segment.first_timestamp <= before[0])
+    if after is not None:
+        query = query.filter(Segment.last_timestamp >= after[0])
+    if since_id is not None:
+        query = query.filter(Segment.last_log_id > since_id)
+
+    if newest_first:
+        query = query.order_by(Segment.last_timestamp.desc(), Segment.last_log_id.desc())
+    else:
+        query = query.order_by(Segment.first_timestamp.asc(), Segment.first_log_id.asc())
+
+    for segment in query:
+        rows = segment_cache.rows(segment)
+        for row in reversed(rows) if newest_first else rows:
+            key = (row.timestamp, row.id)
+            if before is not None and not key < before:
+                continue
+            if after is not None and not key > after:
+                continue
+            if since_id is not None and row.id <= since_id:
+                continue
+            yield row
+
+
+def load_archived_by_id(db: Session, log_ids: List[int], enrollment_id: Optional[int] = None) -> dict:
+    """Archived rows for specific log ids, e.g. search hits that are no longer hot."""
+    Segment = models.ChatLogSegment
+    wanted = set(log_ids)
+    found = {}
+    for log_id in sorted(wanted):
+        if log_id in found:
+            continue
+        query = db.query(Segment).filter(Segment.first_log_id <= log_id, Segment.last_log_id >= log_id)
+        if enrollment_id is not None:
+            query = query.filter(Segment.enrollment_id == enrollment_id)
+        for segment in query:
+            for row in segment_cache.rows(segment):
+                if row.id in wanted:
+                    found[row.id] = row
+            if log_id in found:
+                break
+    return found
+
+
+# --- Compaction ---
+
+class _SummaryMoved(Exception):
+    """The enrollment changed while its rows were being archived; the segment is rolled back."""
+
+
+def _summarize_before_archiving(conn, enrollment_id: int, rows) -> None:
+    """Fold rows past the enrollment's summary cursor into its summary."""
+    enrollments = models.Enrollment.__table__
+    enrollment = conn.execute(
+        select(enrollments.c.summary_through_log_id, enrollments.c.conversation_summary, enrollments.c.version)
+        .where(enrollments.c.id == enrollment_id)
+    ).first()
+    if enrollment is None:
+        return
+    unread = sorted((r for r in rows if r.id > (enrollment.summary_through_log_id or 0)), key=lambda r: r.id)
+    if not unread:
+        return
+
+    result = conn.execute(
+        update(enrollments)
+        .where(enrollments.c.id == enrollment_id, enrollments.c.version == enrollment.version)
+        .values(
+            conversation_summary=roll_summary(
+                enrollment.conversation_summary, [(r.sender, r.content) for r in unread], memory_settings
+            ),
+            summary_through_log_id=unread[-1].id,
+            version=enrollment.version + 1,
+        )
+    )
+    if result.rowcount != 1:
+        raise _SummaryMoved()
+
+
+def compact_enrollment(
+    engine: Engine, enrollment_id: int, cutoff: datetime, config: ArchiveSettings = settings
+) -> Tuple[int, int]:
+    """Archive one enrollment's rows older than `cutoff`; returns (segments, rows) written."""
+    chat_logs = models.ChatLog.__table__
+    segments = models.ChatLogSegment.__table__
+    # Conversation memory reads the newest unsummarized turns straight from the hot table.
+    keep_recent = max(config.keep_recent, memory_settings.max_loaded_turns)
+
+    with engine.connect() as conn:
+        boundary = conn.execute(
+            select(chat_logs.c.timestamp, chat_logs.c.id)
+            .where(chat_logs.c.enrollment_id == enrollment_id)
+            .order_by(chat_logs.c.timestamp.desc(), chat_logs.c.id.desc())
+            .offset(keep_recent - 1)
+            .limit(1)
+        ).first()
+    if boundary is None:
+        return 0, 0
+
+    written_segments = written_rows = 0
+    while True:
+        try:
+            with engine.begin() as conn:
+                rows = conn.execute(
+                    select(chat_logs.c.id, chat_logs.c.sender, chat_logs.c.content, chat_logs.c.timestamp)
+                    .where(
+                        chat_logs.c.enrollment_id == enrollment_id,
+                        chat_logs.c.timestamp < cutoff,
+                        tuple_(chat_logs.c.timestamp, chat_logs.c.id) < tuple_(boundary.timestamp, boundary.id),
+                    )
+                    .order_by(chat_logs.c.timestamp.asc(), chat_logs.c.id.asc())
+                    .limit(config.segment_rows)
+                ).all()
+                if not rows:
+                    break
+                _summarize_before_archiving(conn, enrollment_id, rows)
+
+                conn.execute(
+                    insert(segments).values(
+                        enrollment_id=enrollment_id,
+                        first_log_id=min(r.id for r in rows),
+                        last_log_id=max(r.id for r in rows),
+                        first_timestamp=rows[0].timestamp,
+                        last_timestamp=rows[-1].timestamp,
+                        row_count=len(rows),
+                        codec=CODEC,
+                        payload=encode_segment(rows),
+                        created_at=datetime.utcnow(),
+                    )
+                )
+                conn.execute(delete(chat_logs).where(chat_logs.c.id.in_([r.id for r in rows])))
+        except _SummaryMoved:
+            # A chat turn updated the summary meanwhile; leave the rest for the next run.
+            break
+        written_segments += 1
+        written_rows += len(rows)
+        if len(rows) < config.segment_rows:
+            break
+    return written_segments, written_rows
+
+
+def compact(
+    engine: Engine, config: ArchiveSettings = settings, now: Optional[datetime] = None, dry_run: bool = False
+) -> dict:
+    """Archive old rows for every enrollment that has more than `keep_recent` hot rows."""
+    chat_logs = models.ChatLog.__table__
+    cutoff = (now or datetime.utcnow()) - timedelta(days=config.archive_after_days)
+    keep_recent = max(config.keep_recent, memory_settings.max_loaded_turns)
+
+    with engine.connect() as conn:
+        candidates = conn.execute(
+            select(chat_logs.c.enrollment_id)
+            .where(chat_logs.c.timestamp < cutoff)
+            .group_by(chat_logs.c.enrollment_id)
+        ).scalars().all()
+        if candidates:
+            totals = dict(
+                conn.execute(
+                    select(chat_logs.c.enrollment_id, func.count())
+                    .where(chat_logs.c.enrollment_id.in_(candidates))
+                    .group_by(chat_logs.c.enrollment_id)
+                ).all()
+            )
+        else:
+            totals = {}
+
+    report = {"cutoff": cutoff.isoformat(), "enrollments": 0, "segments": 0, "rows": 0}
+    for enrollment_id in sorted(e for e, total in totals.items() if total > keep_recent):
+        if dry_run:
+            report["enrollments"] += 1
+            continue
+        segments, rows = compact_enrollment(engine, enrollment_id, cutoff, config)
+        if rows:
+            report["enrollments"] += 1
+            report["segments"] += segments
+            report["rows"] += rows
+    return report
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Deque, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from .. import database, models
+
+
+logger = logging.getLogger(__name__)
+
+WRITE_MODES = ("sync", "group", "async")
+
+
+@dataclass
+class _Submission:
+    rows: List[dict]
+    future: Future
+
+
+class ChatLogWriter:
+    """Write-behind queue that batches ChatLog inserts into multi-row transactions.
+
+    A single background thread drains the queue whenever `batch_size` rows are waiting,
+    `flush_interval` has passed since the oldest row arrived, or someone asks for a flush.
+    Each submission gets a future that resolves once its rows are committed, which is
+    what group-commit mode waits on.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_interval)
+
+        self._queue: Deque[_Submission] = deque()
+        self._queued_rows = 0
+        self._oldest_at: Optional[float] = None
+        self._flush_requested = False
+        self._stopping = False
+        self._pending_by_enrollment: Counter = Counter()
+        # Resolves once the batch the writer thread has taken off the queue is committed.
+        self._in_flight: Optional[Future] = None
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+        self.batches_written = 0
+        self.rows_written = 0
+        self.failed_batches = 0
+
+    def _ensure_started(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="chatlog-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, rows: List[dict]) -> Future:
+        """Queue rows for insertion; the returned future resolves after they are committed."""
+        future: Future = Future()
+        now = datetime.utcnow()
+        for row in rows:
+            # Stamp at submit time so ordering reflects when the turn happened, not the flush.
+            row.setdefault("timestamp", now)
+
+        with self._cond:
+            self._ensure_started()
+            self._queue.append(_Submission(rows=rows, future=future))
+            self._queued_rows += len(rows)
+            if self._oldest_at is None:
+                self._oldest_at = time.monotonic()
+            for row in rows:
+                self._pending_by_enrollment[row["enrollment_id"]] += 1
+            self._cond.notify()
+        return future
+
+    def request_flush(self) -> Future:
+        """Return a future that resolves once everything queued so far is committed.
+
+        That includes a batch already taken off the queue but still being written.
+        """
+        with self._cond:
+            if not self._queue:
+                if self._in_flight is not None:
+                    return self._in_flight
+                future: Future = Future()
+                future.set_result(None)
+                return future
+            # Queued behind the in-flight batch, so it resolves after that one too.
+            future = Future()
+            self._queue.append(_Submission(rows=[], future=future))
+            self._flush_requested = True
+            self._cond.notify()
+            return future
+
+    def has_pending(self, enrollment_id: int) -> bool:
+        return self._pending_by_enrollment.get(enrollment_id, 0) > 0
+
+    def _take_batch(self) -> List[_Submission]:
+        with self._cond:
+            while not self._queue and not self._stopping:
+                self._cond.wait()
+
+            while not self._stopping and not self._flush_requested and self._queued_rows < self.batch_size:
+                remaining = (self._oldest_at or time.monotonic()) + self.flush_interval - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = []
+            rows = 0
+            while self._queue and (rows < self.batch_size or not batch):
+                submission = self._queue.popleft()
+                batch.append(submission)
+                rows += len(submission.rows)
+
+            self._queued_rows -= rows
+            self._oldest_at = time.monotonic() if self._queue else None
+            self._flush_requested = any(not s.rows for s in self._queue)
+            if batch:
+                self._in_flight = Future()
+            return batch
+
+    def _write(self, batch: List[_Submission]) -> None:
+        rows = [row for submission in batch for row in submission.rows]
+        error: Optional[BaseException] = None
+        if rows:
+            try:
+                with database.engine.begin() as conn:
+                    conn.execute(insert(models.ChatLog.__table__), rows)
+                self.batches_written += 1
+                self.rows_written += len(rows)
+            except Exception as e:
+                self.failed_batches += 1
+                logger.exception("Failed to write %d chat log rows", len(rows))
+                error = e
+
+        with self._cond:
+            for row in rows:
+                self._pending_by_enrollment[row["enrollment_id"]] -= 1
+                if self._pending_by_enrollment[row["enrollment_id"]] <= 0:
+                    del self._pending_by_enrollment[row["enrollment_id"]]
+            in_flight, self._in_flight = self._in_flight, None
+
+        for submission in batch:
+            if error is not None and submission.rows:
+                submission.future.set_exception(error)
+            else:
+                submission.future.set_result(None)
+        # A failed batch is reported to its submitters; flush waiters only need it finished.
+        if in_flight is not None:
+            in_flight.set_result(None)
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+            elif self._stopping:
+                return
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        """Flush everything still queued and stop the writer thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def snapshot(self) -> dict:
+        return {
+            "queued_rows": self._queued_rows,
+            "batches_written": self.batches_written,
+            "rows_written": self.rows_written,
+            "failed_batches": self.failed_batches,
+        }
+
+
+write_mode = os.getenv("HOMEGROWN_CHATLOG_WRITE_MODE", "group")
+if write_mode not in WRITE_MODES:
+    raise RuntimeError(f"HOMEGROWN_CHATLOG_WRITE_MODE must be one of {', '.join(WRITE_MODES)}")
+
+chat_log_writer = ChatLogWriter(
+    batch_size=int(os.getenv("HOMEGROWN_CHATLOG_BATCH_SIZE", "200")),
+    flush_interval=int(os.getenv("HOMEGROWN_CHATLOG_FLUSH_INTERVAL_MS", "20")) / 1000.0,
+)
+
+
+async def record_chat_logs(db: Session, rows: List[dict]) -> None:
+    """Persist ChatLog rows according to HOMEGROWN_CHATLOG_WRITE_MODE.
+
+    - sync:  add to the caller's session; they land with the caller's commit.
+    - group: queue and wait until the shared batch commits (durable, fewer fsyncs).
+    - async: queue and return immediately; rows are flushed shortly after and on shutdown.
+    """
+    if write_mode == "sync":
+        db.add_all(models.ChatLog(**row) for row in rows)
+        return
+
+    future = chat_log_writer.submit(rows)
+    if write_mode == "group":
+        await asyncio.wrap_future(future)
+
+
+async def ensure_logs_visible(enrollment_id: int) -> None:
+    """Read-your-writes barrier: wait until queued rows for this enrollment are committed."""
+    if write_mode == "sync" or not chat_log_writer.has_pending(enrollment_id):
+        return
+    await asyncio.wrap_future(chat_log_writer.request_flush())
@@ -1,78 +1,249 @@
+from dataclasses import replace
+from typing import Optional
+
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
 
 from .. import models
+from ..metrics import span
 from ..instructors import get_persona_for_agent
-from .llm_service import generate_ai_text
-
+from .chat_log_writer import ensure_logs_visible
+from .course_catalog import CourseEntry, ModuleSpec, course_catalog
+from .fact_service import render_facts
+from .memory_service import load_memory
+from .progress_service import ProgressEvaluation, ProgressVerdict, advance_module, record_progress
+from .response_cache import lookup_response, split_cached_response, store_response
+from .prompt_cache import facts_version, prompt_cache
+from .llm_service import (
+    FallbackReply,
+    LLMOverloadedError,
+    SystemPrompt,
+    generate_ai_text_async,
+    stream_ai_text_async,
+)
+from .model_router import Route, route_turn
+
+
+# Attempts to commit a turn's enrollment changes when other writers keep bumping its version.
+COMMIT_ATTEMPTS = 3
 
 def _get_enrollment_context(db: Session, enrollment_id: int):
+    with span("enrollment_context"):
+        return _load_enrollment_context(db, enrollment_id)
+
+
+def _load_enrollment_context(db: Session, enrollment_id: int):
     enrollment = db.query(models.Enrollment).filter(models.Enrollment.id == enrollment_id).first()
     if not enrollment:
         raise HTTPException(status_code=404, detail="Enrollment not found")
 
-    if not enrollment.course:
+    # Course, agent and parsed curriculum come from the in-memory catalog, not the DB.
+    course = course_catalog.get(db, enrollment.course_id)
+    if course is None:
         raise HTTPException(status_code=500, detail="Course data missing")
 
-    course = enrollment.course
-    agent = course.agent
-
-    if not agent:
+    if course.agent_id is None:
         raise HTTPException(status_code=500, detail="Agent data missing")
 
-    syllabus = course.curriculum_json
-    if not isinstance(syllabus, dict):
-        raise HTTPException(status_code=500, detail="Course curriculum is invalid")
-
-    modules = syllabus.get("modules")
-    if not isinstance(modules, list) or len(modules) == 0:
-        raise HTTPException(status_code=500, detail="Course curriculum has no modules")
+    if course.error:
+        raise HTTPException(status_code=500, detail=course.error)
 
-    if enrollment.current_module_index < 0 or enrollment.current_module_index >= len(modules):
+    current_mod = course.module(enrollment.current_module_index)
+    if current_mod is None:
         raise HTTPException(status_code=500, detail="Enrollment module index is out of range")
 
-    current_mod = modules[enrollment.current_module_index]
-
-    return enrollment, course, agent, modules, current_mod
+    return enrollment, course, current_mod
 
 
-def handle_chat(db: Session, enrollment_id: int, user_message: str):
-    enrollment, course, agent, modules, current_mod = _get_enrollment_context(db, enrollment_id)
-
-    persona = get_persona_for_agent(agent.id)
+def _build_system_prompt(enrollment, course: CourseEntry, current_mod: ModuleSpec) -> SystemPrompt:
+    persona = get_persona_for_agent(course.agent_id)
     persona_instructions = persona.system_instructions if persona else ""
 
-    system_instruction = f"""
+    # Everything in the prefix is shared by all students of the course and is cached
+    # provider-side; per-student and per-module details belong in the suffix.
+    prefix = f"""
     {persona_instructions}
 
-    You are {agent.name}. 
-    Your Core Personality: {agent.system_prompt_core}
+    You are {course.agent_name}. 
+    Your Core Personality: {course.agent_core}
 
     CURRENT CONTEXT:
-    Student is working on Course: {course.title}
-    Current Module: {current_mod['title']}
-    Objective: {current_mod['objective']}
-    Student Facts: {enrollment.student_facts}
+    Student is working on Course: {course.title}"""
+
+    suffix = f"""    Current Module: {current_mod.title}
+    Objective: {current_mod.objective}
+    Student Facts: {render_facts(enrollment.student_facts) or "none yet"}
 
     INSTRUCTIONS:
     - Keep responses short (under 3 sentences) unless explaining a complex concept.
-    - If the student completes the objective, add [MODULE_COMPLETE] to your response.
+    - When you grade a quiz or exam, state the result as "Score: X/Y".
     """
 
-    ai_text = generate_ai_text(system_instruction=system_instruction, user_message=user_message, current_mod=current_mod)
+    return SystemPrompt(prefix=prefix, suffix=suffix)
+
+
+def _get_system_prompt(enrollment, course: CourseEntry, current_mod: ModuleSpec) -> SystemPrompt:
+    with span("prompt_build"):
+        return _get_cached_system_prompt(enrollment, course, current_mod)
+
+
+def _get_cached_system_prompt(enrollment, course: CourseEntry, current_mod: ModuleSpec) -> SystemPrompt:
+    key = (
+        course.agent_id,
+        course.course_id,
+        course.version,
+        enrollment.current_module_index,
+        # Keyed on the rendered top-K, so facts that never reach the prompt don't churn the cache.
+        facts_version(render_facts(enrollment.student_facts)),
+        course.agent_version,
+    )
+    return prompt_cache.get_or_build(key, lambda: _build_system_prompt(enrollment, course, current_mod))
+
+
+async def _with_memory(db: Session, enrollment, system_prompt: SystemPrompt) -> SystemPrompt:
+    # History is per-turn, so it rides in the suffix and never disturbs the cached prefix.
+    with span("memory"):
+        await ensure_logs_visible(enrollment.id)
+        history = load_memory(db, enrollment).render()
+    if not history:
+        return system_prompt
+    return replace(system_prompt, suffix=system_prompt.suffix + history)
+
+
+def _cache_scope(course: CourseEntry, current_mod: ModuleSpec):
+    persona = get_persona_for_agent(course.agent_id)
+    # The persona version keeps answers given under an older persona text from being replayed.
+    if persona is None:
+        return (course.agent_id, course.course_id, current_mod.key)
+    return (persona.id, persona.version, course.course_id, current_mod.key)
+
+
+def _route(course: CourseEntry, user_message: str) -> Optional[Route]:
+    persona = get_persona_for_agent(course.agent_id)
+    return route_turn(user_message, persona.routing if persona is not None else None)
+
+
+def _apply_verdict(
+    db: Session,
+    enrollment,
+    course: CourseEntry,
+    current_mod: ModuleSpec,
+    verdict: ProgressVerdict,
+    cache_lookup,
+    reply: str,
+):
+    """Record the verdict and commit the enrollment before the reply goes out.
+
+    The UPDATE is checked against `Enrollment.version`. If another turn changed the row
+    first, it is re-read, the memory summary rolled again and the verdict re-applied only
+    while the student is still on the module it was given for, so a module is advanced
+    exactly once.
+    """
+    # Graded and unlocking replies are specific to this student's attempt, and a canned
+    # fallback would be replayed to everyone asking the same question.
+    if not verdict.complete and verdict.quiz_score is None and not isinstance(reply, FallbackReply):
+        store_response(cache_lookup, reply)
+
+    for attempt in range(COMMIT_ATTEMPTS):
+        if attempt:
+            # The rollback also dropped the summary `load_memory` rolled forward this turn;
+            # redo it against the re-read row so it lands with the progress update.
+            load_memory(db, enrollment)
+        if enrollment.current_module_index != current_mod.index:
+            return None
+        record_progress(enrollment, current_mod, verdict)
+        workspace_update = advance_module(enrollment, course) if verdict.complete else None
+        try:
+            db.commit()
+            return workspace_update
+        except StaleDataError:
+            db.rollback()
+    raise HTTPException(status_code=409, detail="Enrollment was updated concurrently, please retry")
+
+
+async def handle_chat(db: Session, enrollment_id: int, user_message: str):
+    enrollment, course, current_mod = _get_enrollment_context(db, enrollment_id)
+
+    with span("response_cache"):
+        cache_lookup = await lookup_response(_cache_scope(course, current_mod), user_message, current_mod.cache_policy)
+    if cache_lookup.response is not None:
+        return enrollment, cache_lookup.response, None
+
+    tenant = (course.course_id, enrollment.id)
+    evaluation = ProgressEvaluation(current_mod, user_message, tenant)
+    try:
+        system_prompt = await _with_memory(db, enrollment, _get_system_prompt(enrollment, course, current_mod))
+        with span("llm"):
+            ai_text = await generate_ai_text_async(
+                system_prompt=system_prompt,
+                user_message=user_message,
+                current_mod=current_mod.raw,
+                tenant=tenant,
+                route=_route(course, user_message),
+            )
+        with span("progress"):
+            verdict = await evaluation.finish(ai_text)
+    except LLMOverloadedError:
+        raise HTTPException(status_code=503, detail="Tutor is busy, please retry", headers={"Retry-After": "1"})
+    finally:
+        evaluation.cancel()
+
+    workspace_update = _apply_verdict(db, enrollment, course, current_mod, verdict, cache_lookup, ai_text)
+    return enrollment, ai_text, workspace_update
 
-    workspace_update = None
-    if "[MODULE_COMPLETE]" in ai_text:
-        next_index = enrollment.current_module_index + 1
-        if next_index < len(modules):
-            next_mod = modules[next_index]
-            workspace_update = {
-                "status": "unlocked",
-                "next_module": next_mod["title"],
-                "objective": next_mod["objective"],
-            }
-            enrollment.current_module_index = next_index
 
-        ai_text = ai_text.replace("[MODULE_COMPLETE]", "")
+def stream_chat(db: Session, enrollment_id: int, user_message: str):
+    """Validate the enrollment up front, then return an async iterator of chat events.
 
-    return enrollment, ai_text, workspace_update
+    Events are `(name, payload)` tuples: any number of `("token", str)` followed by a
+    single `("done", {"agent_response": ..., "workspace_update": ...})`.
+    Lookup errors raise immediately so the caller can still answer with a plain HTTP error.
+    """
+    enrollment, course, current_mod = _get_enrollment_context(db, enrollment_id)
+
+    async def events():
+        nonlocal current_mod
+        # A turn queued behind another one for this enrollment may find it on a new module.
+        db.refresh(enrollment)
+        current_mod = course.module(enrollment.current_module_index) or current_mod
+
+        with span("response_cache"):
+            cache_lookup = await lookup_response(_cache_scope(course, current_mod), user_message, current_mod.cache_policy)
+        if cache_lookup.response is not None:
+            for piece in split_cached_response(cache_lookup.response):
+                yield "token", piece
+            yield "done", {"agent_response": cache_lookup.response, "workspace_update": None}
+            return
+
+        tenant = (course.course_id, enrollment.id)
+        evaluation = ProgressEvaluation(current_mod, user_message, tenant)
+        try:
+            system_prompt = await _with_memory(db, enrollment, _get_system_prompt(enrollment, course, current_mod))
+            parts = []
+
+            with span("llm"):
+                async for chunk in stream_ai_text_async(
+                    system_prompt=system_prompt,
+                    user_message=user_message,
+                    current_mod=current_mod.raw,
+                    tenant=tenant,
+                    route=_route(course, user_message),
+                ):
+                    parts.append(chunk)
+                    yield "token", chunk
+
+            agent_response = "".join(parts)
+            if any(isinstance(part, FallbackReply) for part in parts):
+                agent_response = FallbackReply(agent_response)
+            with span("progress"):
+                verdict = await evaluation.finish(agent_response)
+        finally:
+            evaluation.cancel()
+
+        workspace_update = _apply_verdict(
+            db, enrollment, course, current_mod, verdict, cache_lookup, agent_response
+        )
+        yield "done", {"agent_response": agent_response, "workspace_update": workspace_update}
+
+    return enrollment, events()
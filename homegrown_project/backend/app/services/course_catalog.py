@@ -0,0 +1,244 @@
+import copy
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Dict, Iterable, Mapping, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload
+
+from .. import models
+from .deliverable_checks import DeliverableSpec
+from .progress_service import ProgressRules
+from .prompt_cache import prompt_cache
+from .response_cache import CachePolicy
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ModuleSpec:
+    index: int
+    id: Optional[str]
+    title: str
+    objective: str
+    success_criteria: Optional[str]
+    cache_policy: CachePolicy
+    progress: ProgressRules
+    # Set when the module's uploads are graded offline (see grading_service).
+    deliverable: Optional[DeliverableSpec]
+    # Read-only copy of the module JSON, for code that wants fields not modelled here.
+    raw: Mapping = field(repr=False, compare=False)
+
+    @property
+    def key(self) -> str:
+        return self.id or str(self.index)
+
+
+@dataclass(frozen=True)
+class CourseEntry:
+    """Parsed, validated view of a course row and its agent.
+
+    `error` is set instead of raising when the curriculum is unusable, so listings can
+    still show the course while chat refuses it with that message.
+    """
+
+    course_id: str
+    title: Optional[str]
+    version: int
+    agent_id: Optional[str]
+    agent_version: Optional[int]
+    agent_name: Optional[str]
+    agent_core: Optional[str]
+    modules: Tuple[ModuleSpec, ...] = ()
+    error: Optional[str] = None
+
+    @property
+    def total_modules(self) -> Optional[int]:
+        return len(self.modules) if self.error is None else None
+
+    def module(self, index: int) -> Optional[ModuleSpec]:
+        if 0 <= index < len(self.modules):
+            return self.modules[index]
+        return None
+
+
+class CurriculumError(ValueError):
+    pass
+
+
+def _parse_module(index: int, raw) -> ModuleSpec:
+    if not isinstance(raw, dict):
+        raise CurriculumError(f"Course curriculum module {index} is invalid")
+    title, objective = raw.get("title"), raw.get("objective")
+    if not isinstance(title, str) or not isinstance(objective, str):
+        raise CurriculumError(f"Course curriculum module {index} needs a title and objective")
+    try:
+        progress = ProgressRules.for_module(raw)
+        deliverable = DeliverableSpec.for_module(raw)
+    except (ValueError, TypeError) as e:
+        raise CurriculumError(f"Course curriculum module {index}: {e}")
+
+    return ModuleSpec(
+        index=index,
+        id=raw.get("id"),
+        title=title,
+        objective=objective,
+        success_criteria=raw.get("success_criteria"),
+        cache_policy=CachePolicy.for_module(raw),
+        progress=progress,
+        deliverable=deliverable,
+        raw=MappingProxyType(copy.deepcopy(raw)),
+    )
+
+
+def parse_curriculum(curriculum) -> Tuple[ModuleSpec, ...]:
+    if not isinstance(curriculum, dict):
+        raise CurriculumError("Course curriculum is invalid")
+    modules = curriculum.get("modules")
+    if not isinstance(modules, list) or len(modules) == 0:
+        raise CurriculumError("Course curriculum has no modules")
+    return tuple(_parse_module(i, m) for i, m in enumerate(modules))
+
+
+def build_entry(course: models.Course) -> CourseEntry:
+    agent = course.agent
+    try:
+        modules, error = parse_curriculum(course.curriculum_json), None
+    except CurriculumError as e:
+        modules, error = (), str(e)
+
+    return CourseEntry(
+        course_id=course.id,
+        title=course.title,
+        version=course.version or 0,
+        agent_id=agent.id if agent else None,
+        agent_version=(agent.version or 0) if agent else None,
+        agent_name=agent.name if agent else None,
+        agent_core=agent.system_prompt_core if agent else None,
+        modules=modules,
+        error=error,
+    )
+
+
+@dataclass
+class _Cached:
+    entry: CourseEntry
+    checked_at: float
+
+
+class CourseCatalog:
+    """In-memory catalog of parsed courses.
+
+    Edits made through this process's ORM invalidate entries immediately (see the mapper
+    listeners below). Edits from other workers are picked up by a cheap check of the
+    course and agent versions once an entry is older than `recheck_seconds`.
+    """
+
+    def __init__(self, recheck_seconds: float):
+        self.recheck_seconds = recheck_seconds
+        self.loads = 0
+        self.hits = 0
+        self.rechecks = 0
+        self._entries: Dict[str, _Cached] = {}
+        self._lock = threading.Lock()
+
+    def _store(self, courses: Iterable[models.Course]) -> Dict[str, CourseEntry]:
+        now = time.monotonic()
+        loaded = {}
+        with self._lock:
+            for course in courses:
+                entry = build_entry(course)
+                self._entries[course.id] = _Cached(entry=entry, checked_at=now)
+                loaded[course.id] = entry
+                self.loads += 1
+        return loaded
+
+    def _load(self, db: Session, course_ids: Iterable[str]) -> Dict[str, CourseEntry]:
+        courses = (
+            db.query(models.Course)
+            .options(joinedload(models.Course.agent))
+            .filter(models.Course.id.in_(list(course_ids)))
+            .all()
+        )
+        return self._store(courses)
+
+    def load_all(self, db: Session) -> int:
+        courses = db.query(models.Course).options(joinedload(models.Course.agent)).all()
+        return len(self._store(courses))
+
+    def get_many(self, db: Session, course_ids: Iterable[str]) -> Dict[str, CourseEntry]:
+        wanted = {cid for cid in course_ids if cid is not None}
+        now = time.monotonic()
+        found: Dict[str, CourseEntry] = {}
+        stale: Dict[str, Tuple[int, Optional[int]]] = {}
+
+        with self._lock:
+            for course_id in wanted:
+                cached = self._entries.get(course_id)
+                if cached is None:
+                    continue
+                if now - cached.checked_at < self.recheck_seconds:
+                    found[course_id] = cached.entry
+                    self.hits += 1
+                else:
+                    stale[course_id] = (cached.entry.version, cached.entry.agent_version)
+
+        if stale:
+            self.rechecks += 1
+            rows = (
+                db.query(models.Course.id, models.Course.version, models.Agent.version)
+                .outerjoin(models.Agent, models.Agent.id == models.Course.agent_id)
+                .filter(models.Course.id.in_(list(stale)))
+                .all()
+            )
+            current = {course_id: (version, agent_version) for course_id, version, agent_version in rows}
+            with self._lock:
+                for course_id, versions in stale.items():
+                    cached = self._entries.get(course_id)
+                    if cached is not None and current.get(course_id) == versions:
+                        cached.checked_at = now
+                        found[course_id] = cached.entry
+
+        missing = wanted - found.keys()
+        if missing:
+            found.update(self._load(db, missing))
+        return found
+
+    def get(self, db: Session, course_id: str) -> Optional[CourseEntry]:
+        return self.get_many(db, [course_id]).get(course_id)
+
+    def invalidate(self, course_id: Optional[str] = None, agent_id: Optional[str] = None) -> None:
+        """Forget a course, every course taught by an agent, or (no arguments) everything."""
+        with self._lock:
+            if course_id is None and agent_id is None:
+                self._entries.clear()
+            else:
+                for key in list(self._entries):
+                    entry = self._entries[key].entry
+                    if key == course_id or (agent_id is not None and entry.agent_id == agent_id):
+                        del self._entries[key]
+        prompt_cache.invalidate(agent_id=agent_id, course_id=course_id)
+
+    def snapshot(self) -> dict:
+        return {"entries": len(self._entries), "loads": self.loads, "hits": self.hits, "rechecks": self.rechecks}
+
+
+course_catalog = CourseCatalog(recheck_seconds=float(os.getenv("HOMEGROWN_CATALOG_RECHECK_SECONDS", "30")))
+
+
+@event.listens_for(models.Course, "after_insert")
+@event.listens_for(models.Course, "after_update")
+@event.listens_for(models.Course, "after_delete")
+def _course_changed(mapper, connection, target):
+    course_catalog.invalidate(course_id=target.id)
+
+
+@event.listens_for(models.Agent, "after_update")
+@event.listens_for(models.Agent, "after_delete")
+def _agent_changed(mapper, connection, target):
+    course_catalog.invalidate(agent_id=target.id)
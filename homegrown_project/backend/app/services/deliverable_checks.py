@@ -0,0 +1,237 @@
+"""Cheap local checks for uploaded deliverables.
+
+A module opts into grading with a `deliverable` key:
+
+    "deliverable": {
+        "accept": ["html"],
+        "required_tags": ["h1", "p", "img"],
+        "rubric": "A digital business card with the student's name, a short bio and a picture.",
+        "max_bytes": 1048576
+    }
+
+`check_file` sniffs the real file type from its first bytes, checks the size and, for
+HTML, parses the markup for unbalanced or missing tags. Everything here is pure and
+stdlib-only so it can run in a process pool without importing the app.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+
+
+KINDS = ("html", "css", "js", "text", "png", "jpeg", "gif", "webp", "pdf", "zip")
+TEXT_KINDS = ("html", "css", "js", "text")
+
+SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"%PDF-", "pdf"),
+    (b"PK\x03\x04", "zip"),
+)
+EXTENSION_KINDS = {
+    ".html": "html",
+    ".htm": "html",
+    ".css": "css",
+    ".js": "js",
+    ".txt": "text",
+    ".md": "text",
+    ".png": "png",
+    ".jpg": "jpeg",
+    ".jpeg": "jpeg",
+    ".gif": "gif",
+    ".webp": "webp",
+    ".pdf": "pdf",
+    ".zip": "zip",
+}
+HTML_START_RE = re.compile(r"\s*(?:<!--.*?-->\s*)*<(?:!doctype\s+html|html|head|body)\b", re.IGNORECASE | re.DOTALL)
+
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr",
+}
+# Closing tags HTML lets you leave out, so leaving them open is not reported.
+OPTIONAL_CLOSE_TAGS = {"html", "head", "body", "p", "li", "dt", "dd", "tr", "td", "th", "option", "thead", "tbody"}
+SNIFF_BYTES = 2048
+MAX_PROBLEMS = 8
+
+
+@dataclass(frozen=True)
+class DeliverableSpec:
+    accept: Tuple[str, ...] = ("html",)
+    required_tags: Tuple[str, ...] = ()
+    rubric: str = ""
+    min_bytes: int = 1
+    max_bytes: int = 1024 * 1024
+
+    @classmethod
+    def for_module(cls, module: dict) -> Optional["DeliverableSpec"]:
+        raw = module.get("deliverable")
+        if raw is None:
+            return None
+        if not isinstance(raw, dict):
+            raise ValueError("deliverable must be an object")
+        accept = tuple(str(k).lower() for k in raw.get("accept") or ("html",))
+        unknown = [k for k in accept if k not in KINDS]
+        if unknown:
+            raise ValueError(f"deliverable accepts unknown file types: {', '.join(unknown)}")
+        tags = raw.get("required_tags") or []
+        if not isinstance(tags, list):
+            raise ValueError("deliverable.required_tags must be a list of tag names")
+        return cls(
+            accept=accept,
+            required_tags=tuple(str(t).lower() for t in tags),
+            rubric=str(raw.get("rubric") or ""),
+            min_bytes=int(raw.get("min_bytes", cls.min_bytes)),
+            max_bytes=int(raw.get("max_bytes", cls.max_bytes)),
+        )
+
+
+def sniff_kind(head: bytes, filename: str = "") -> str:
+    """The file's real type from its first bytes; "binary" when it is none of `KINDS`."""
+    for signature, kind in SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if b"\x00" in head:
+        return "binary"
+    try:
+        text = head.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off by the sniffed window is fine; anything else is not text.
+        if len(head) < SNIFF_BYTES or e.start < len(head) - 3:
+            return "binary"
+        text = head[: e.start].decode("utf-8-sig")
+    if HTML_START_RE.match(text):
+        return "html"
+    named = EXTENSION_KINDS.get(os.path.splitext(filename)[1].lower())
+    return named if named in TEXT_KINDS else "text"
+
+
+class _TagChecker(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack: List[Tuple[str, int]] = []
+        self.seen = set()
+        self.doctype = False
+        self.errors: List[str] = []
+        self.warnings: List[str] = []
+
+    def handle_decl(self, decl):
+        if decl.lower().startswith("doctype"):
+            self.doctype = True
+
+    def handle_starttag(self, tag, attrs):
+        self.seen.add(tag)
+        attributes = dict(attrs)
+        line = self.getpos()[0]
+        if tag == "img":
+            if not attributes.get("src"):
+                self.errors.append(f"line {line}: <img> has no src")
+            if "alt" not in attributes:
+                self.warnings.append(f"line {line}: <img> has no alt text")
+        if tag in VOID_TAGS:
+            return
+        # A new <p>/<li> implicitly closes an open one of the same kind.
+        if tag in OPTIONAL_CLOSE_TAGS and self.stack and self.stack[-1][0] == tag:
+            self.stack.pop()
+        self.stack.append((tag, line))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.stack and self.stack[-1][0] == tag:
+            self.stack.pop()
+
+    def handle_endtag(self, tag):
+        line = self.getpos()[0]
+        if tag in VOID_TAGS:
+            return
+        open_tags = [name for name, _ in self.stack]
+        if tag not in open_tags:
+            self.errors.append(f"line {line}: </{tag}> has no matching <{tag}>")
+            return
+        while self.stack:
+            name, opened = self.stack.pop()
+            if name == tag:
+                break
+            self._unclosed(name, opened, f"before </{tag}> on line {line}")
+
+    def _unclosed(self, tag, line, where):
+        if tag not in OPTIONAL_CLOSE_TAGS:
+            self.errors.append(f"line {line}: <{tag}> is never closed{' ' + where if where else ''}")
+
+    def finish(self):
+        self.close()
+        for name, opened in reversed(self.stack):
+            self._unclosed(name, opened, "")
+        self.stack = []
+
+
+def check_html(text: str, spec: DeliverableSpec) -> Tuple[List[str], List[str], List[str]]:
+    """(errors, warnings, tags seen) for an HTML document."""
+    checker = _TagChecker()
+    checker.feed(text)
+    checker.finish()
+    errors, warnings = checker.errors, checker.warnings
+    if not checker.doctype:
+        warnings.append("missing <!DOCTYPE html>")
+    if "title" not in checker.seen:
+        warnings.append("missing <title>")
+    missing = [tag for tag in spec.required_tags if tag not in checker.seen]
+    if missing:
+        errors.insert(0, "missing required tags: " + ", ".join(f"<{tag}>" for tag in missing))
+    return errors, warnings, sorted(checker.seen)
+
+
+def check_file(path: str, filename: str, spec: DeliverableSpec, excerpt_chars: int) -> dict:
+    """Local verdict for one file: "pass", "fail", "review" (the rubric needs the LLM) or
+    "unreadable" (the stored blob is missing, which is not the student's fault).
+
+    Runs in a worker process, so it takes and returns plain data only.
+    """
+    result = {"kind": None, "bytes": 0, "errors": [], "warnings": [], "tags": [], "excerpt": None}
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            data = f.read(SNIFF_BYTES)
+            kind = sniff_kind(data, filename)
+            # Only text is read in full; images and archives are judged by their header.
+            if kind in TEXT_KINDS and size <= spec.max_bytes:
+                data += f.read()
+    except OSError as e:
+        result["errors"].append(f"file could not be read ({e.strerror or e})")
+        return {**result, "verdict": "unreadable"}
+
+    result.update(kind=kind, bytes=size)
+    errors, warnings = result["errors"], result["warnings"]
+
+    named = EXTENSION_KINDS.get(os.path.splitext(filename)[1].lower())
+    if named and named != kind:
+        warnings.append(f"{filename} is named like a {named} file but contains {kind}")
+    if kind not in spec.accept:
+        errors.append(f"expected a {' or '.join(spec.accept)} file, got {kind}")
+    if size < spec.min_bytes:
+        errors.append("file is empty" if size == 0 else f"file is smaller than {spec.min_bytes} bytes")
+    if size > spec.max_bytes:
+        errors.append(f"file is larger than {spec.max_bytes} bytes")
+
+    if not errors and kind in TEXT_KINDS:
+        text = data.decode("utf-8-sig", errors="replace")
+        if kind == "html":
+            html_errors, html_warnings, tags = check_html(text, spec)
+            errors.extend(html_errors)
+            warnings.extend(html_warnings)
+            result["tags"] = tags
+        result["excerpt"] = text[:excerpt_chars]
+
+    result["errors"], result["warnings"] = errors[:MAX_PROBLEMS], warnings[:MAX_PROBLEMS]
+    if errors:
+        verdict = "fail"
+    elif spec.rubric and result["excerpt"] is not None:
+        verdict = "review"
+    else:
+        verdict = "pass"
+    return {**result, "verdict": verdict}
@@ -0,0 +1,314 @@
+"""Durable facts about a student, mined from chat turns in the background.
+
+`Enrollment.student_facts` holds `{"facts": [{"kind", "value", "seen", "at"}, ...]}`.
+Facts are deduplicated by kind (for single-valued kinds like `name` or `os`) or by kind and
+normalized value, ranked by kind weight, how often they were seen and recency, and capped
+at `max_stored`. Only the top `prompt_k` are rendered into the system prompt.
+
+Extraction never runs on the request path: routers `submit` finished turns, and one
+worker task coalesces them per enrollment, runs the regex extractors (plus, with
+HOMEGROWN_FACTS_EXTRACTOR=llm, a background-priority JSON-mode call) and writes the
+merged facts back in a single transaction.
+"""
+
+import asyncio
+import logging
+import os
+import re
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+
+from .. import database, models
+from .llm_scheduler import PRIORITY_BACKGROUND
+from .llm_service import SystemPrompt, generate_json_async
+
+
+logger = logging.getLogger(__name__)
+
+EXTRACTOR_MODES = ("off", "rules", "llm")
+
+KIND_WEIGHTS = {
+    "name": 100,
+    "misconception": 90,
+    "goal": 80,
+    "os": 70,
+    "grade": 60,
+    "age": 60,
+    "preference": 50,
+    "interest": 40,
+}
+SINGLE_VALUED = {"name", "os", "grade", "age"}
+
+OS_NAMES = {
+    "windows": "Windows",
+    "mac": "macOS",
+    "macos": "macOS",
+    "macbook": "macOS",
+    "linux": "Linux",
+    "ubuntu": "Linux",
+    "chromebook": "ChromeOS",
+}
+CORRECTION_CUES = re.compile(r"\b(not quite|close|almost|actually|careful|mix-?up|common mistake)\b", re.IGNORECASE)
+
+RULES: List[Tuple[str, re.Pattern]] = [
+    ("name", re.compile(r"\b(?i:my name is|call me)\s+([A-Z][a-z]{1,20})\b")),
+    ("grade", re.compile(r"\bI'?m in (?:the )?(\d{1,2})(?:st|nd|rd|th)? grade\b", re.IGNORECASE)),
+    ("age", re.compile(r"\bI'?m (\d{1,2}) (?:years old|yrs old|y/o)\b", re.IGNORECASE)),
+    (
+        "os",
+        re.compile(
+            r"\b(?:I(?:'m| am)? (?:on|using|use|have)|my (?:computer|laptop|pc) is)\s+(?:an? )?"
+            r"(windows|mac ?os|macbook|mac|linux|ubuntu|chromebook)\b",
+            re.IGNORECASE,
+        ),
+    ),
+    ("goal", re.compile(r"\bI (?:want|would like|hope|plan) to ([^.!?\n]{5,80})", re.IGNORECASE)),
+    ("interest", re.compile(r"\b(?:I(?:'m| am) into|I (?:really )?(?:love|enjoy)) ([^.!?,\n]{3,40})", re.IGNORECASE)),
+]
+BELIEF_RE = re.compile(r"\bI (?:thought|think|assumed) (?:that )?([^.!?\n]{5,100})", re.IGNORECASE)
+
+LLM_INSTRUCTIONS = """You extract durable facts about a student from a tutoring exchange.
+Answer with one JSON object and nothing else:
+{"facts": [{"kind": "name|grade|age|os|goal|interest|preference|misconception", "value": "short phrase"}]}
+Only include facts that will still matter in later lessons. Return {"facts": []} when there are none."""
+
+
+@dataclass(frozen=True)
+class FactSettings:
+    extractor: str
+    max_stored: int
+    prompt_k: int
+    value_chars: int
+    queue_size: int
+    coalesce_seconds: float
+
+    @classmethod
+    def from_env(cls) -> "FactSettings":
+        extractor = os.getenv("HOMEGROWN_FACTS_EXTRACTOR", "rules")
+        if extractor not in EXTRACTOR_MODES:
+            raise RuntimeError(f"HOMEGROWN_FACTS_EXTRACTOR must be one of {', '.join(EXTRACTOR_MODES)}")
+        return cls(
+            extractor=extractor,
+            max_stored=int(os.getenv("HOMEGROWN_FACTS_MAX_STORED", "24")),
+            prompt_k=int(os.getenv("HOMEGROWN_FACTS_PROMPT_K", "6")),
+            value_chars=int(os.getenv("HOMEGROWN_FACTS_VALUE_CHARS", "80")),
+            queue_size=int(os.getenv("HOMEGROWN_FACTS_QUEUE_SIZE", "10000")),
+            coalesce_seconds=int(os.getenv("HOMEGROWN_FACTS_COALESCE_MS", "500")) / 1000.0,
+        )
+
+
+settings = FactSettings.from_env()
+
+
+# --- Fact store ---
+
+def _normalize(value: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", value.lower()).strip()
+
+
+def _fact_key(kind: str, value: str) -> str:
+    return kind if kind in SINGLE_VALUED else f"{kind}:{_normalize(value)}"
+
+
+def load_facts(student_facts) -> List[dict]:
+    """Facts from a stored blob; older free-form dicts are read as one fact per key."""
+    if not isinstance(student_facts, dict):
+        return []
+    if isinstance(student_facts.get("facts"), list):
+        return [f for f in student_facts["facts"] if isinstance(f, dict) and f.get("kind") and f.get("value")]
+
+    facts = []
+    for key, value in student_facts.items():
+        values = value if isinstance(value, list) else [value]
+        kind = key[:-1] if isinstance(value, list) and key.endswith("s") else key
+        facts.extend({"kind": kind, "value": str(v), "seen": 1} for v in values if v not in (None, ""))
+    return facts
+
+
+def _rank(facts: List[dict]) -> List[dict]:
+    # Later entries are newer, so the index doubles as a recency tie-breaker.
+    scored = [
+        (KIND_WEIGHTS.get(f["kind"], 30) + 5 * min(f.get("seen", 1), 5), i, f) for i, f in enumerate(facts)
+    ]
+    return [f for _, _, f in sorted(scored, key=lambda item: (item[0], item[1]), reverse=True)]
+
+
+def merge_facts(student_facts, new_facts: List[dict], config: FactSettings = settings) -> Tuple[dict, bool]:
+    """Merge extracted facts into a stored blob; returns the new blob and whether it changed."""
+    merged: "OrderedDict[str, dict]" = OrderedDict()
+    for fact in load_facts(student_facts):
+        merged[_fact_key(fact["kind"], fact["value"])] = dict(fact)
+
+    changed = not (isinstance(student_facts, dict) and "facts" in student_facts)
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    for fact in new_facts:
+        kind = str(fact.get("kind") or "").strip().lower()
+        value = " ".join(str(fact.get("value") or "").split())[: config.value_chars]
+        if not kind or not _normalize(value):
+            continue
+
+        key = _fact_key(kind, value)
+        existing = merged.pop(key, None)
+        if existing is not None and _normalize(existing["value"]) == _normalize(value):
+            existing["seen"] = existing.get("seen", 1) + 1
+            existing["at"] = now
+            merged[key] = existing
+        else:
+            merged[key] = {"kind": kind, "value": value, "seen": 1, "at": now}
+        changed = True
+
+    facts = list(merged.values())
+    if len(facts) > config.max_stored:
+        keep = {id(f) for f in _rank(facts)[: config.max_stored]}
+        facts = [f for f in facts if id(f) in keep]
+        changed = True
+    return {"facts": facts}, changed
+
+
+def render_facts(student_facts, config: FactSettings = settings) -> str:
+    """Top-K facts as one compact line for the system prompt."""
+    top = _rank(load_facts(student_facts))[: config.prompt_k]
+    return "; ".join(f"{f['kind']}: {f['value']}" for f in top)
+
+
+# --- Extraction ---
+
+def extract_facts_rules(student_message: str, agent_reply: str = "") -> List[dict]:
+    facts = []
+    for kind, pattern in RULES:
+        for match in pattern.finditer(student_message or ""):
+            value = match.group(1).strip()
+            if kind == "os":
+                value = OS_NAMES.get(value.lower().replace(" ", ""), value)
+            facts.append({"kind": kind, "value": value})
+
+    # A stated belief the tutor then corrects is worth remembering as a misconception.
+    if agent_reply and CORRECTION_CUES.search(agent_reply[:200]):
+        for match in BELIEF_RE.finditer(student_message or ""):
+            facts.append({"kind": "misconception", "value": match.group(1).strip()})
+    return facts
+
+
+async def extract_facts_llm(enrollment_id: int, turns: List[Tuple[str, str]]) -> List[dict]:
+    transcript = "\n".join(f"Student: {student}\nTutor: {tutor}" for student, tutor in turns)
+    prompt = SystemPrompt(prefix=LLM_INSTRUCTIONS, suffix="")
+    data = await generate_json_async(prompt, transcript, tenant=("facts", enrollment_id), priority=PRIORITY_BACKGROUND)
+    facts = data.get("facts") if data else None
+    if not isinstance(facts, list):
+        return []
+    return [f for f in facts if isinstance(f, dict) and f.get("kind") in KIND_WEIGHTS]
+
+
+class FactExtractor:
+    """Background queue of finished turns, drained by a single asyncio worker task.
+
+    The queue is bounded; when it is full the oldest turns are dropped, since missing a
+    fact is harmless and falling behind forever is not.
+    """
+
+    def __init__(self, config: FactSettings = settings):
+        self.config = config
+        self._queue: Deque[Tuple[int, str, str]] = deque(maxlen=max(1, config.queue_size))
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.turns_submitted = 0
+        self.turns_dropped = 0
+        self.facts_extracted = 0
+        self.enrollments_updated = 0
+        self.failed_batches = 0
+
+    def submit(self, enrollment_id: int, student_message: str, agent_reply: str) -> None:
+        """Queue a finished turn; never blocks the caller."""
+        if self.config.extractor == "off":
+            return
+        if len(self._queue) == self._queue.maxlen:
+            self.turns_dropped += 1
+        self._queue.append((enrollment_id, student_message, agent_reply))
+        self.turns_submitted += 1
+
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._task = loop.create_task(self._run())
+        self._wakeup.set()
+
+    def _drain(self) -> Dict[int, List[Tuple[str, str]]]:
+        turns: Dict[int, List[Tuple[str, str]]] = {}
+        while self._queue:
+            enrollment_id, student_message, agent_reply = self._queue.popleft()
+            turns.setdefault(enrollment_id, []).append((student_message, agent_reply))
+        return turns
+
+    async def _extract(self, enrollment_id: int, turns: List[Tuple[str, str]]) -> List[dict]:
+        facts = [fact for student, tutor in turns for fact in extract_facts_rules(student, tutor)]
+        if self.config.extractor == "llm":
+            facts.extend(await extract_facts_llm(enrollment_id, turns))
+        return facts
+
+    def _write(self, found: Dict[int, List[dict]]) -> int:
+        enrollments = models.Enrollment.__table__
+        updated = 0
+        with database.engine.begin() as conn:
+            current = conn.execute(
+                select(enrollments.c.id, enrollments.c.student_facts).where(enrollments.c.id.in_(list(found)))
+            ).all()
+            for enrollment_id, student_facts in current:
+                merged, changed = merge_facts(student_facts, found[enrollment_id], self.config)
+                if changed:
+                    # Chat turns never write student_facts, so this skips the enrollment version check.
+                    conn.execute(
+                        update(enrollments).where(enrollments.c.id == enrollment_id).values(student_facts=merged)
+                    )
+                    updated += 1
+        return updated
+
+    async def process_pending(self) -> None:
+        turns = self._drain()
+        if not turns:
+            return
+        results = await asyncio.gather(*(self._extract(eid, t) for eid, t in turns.items()))
+        found = {eid: facts for eid, facts in zip(turns, results) if facts}
+        if not found:
+            return
+        self.facts_extracted += sum(len(facts) for facts in found.values())
+        self.enrollments_updated += await asyncio.to_thread(self._write, found)
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            # Let a burst of turns pile up so each enrollment is read and written once.
+            await asyncio.sleep(self.config.coalesce_seconds)
+            try:
+                await self.process_pending()
+            except Exception:
+                self.failed_batches += 1
+                logger.exception("Fact extraction batch failed")
+
+    async def close(self) -> None:
+        """Process whatever is still queued and stop the worker."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            await self.process_pending()
+        except Exception:
+            logger.exception("Fact extraction failed during shutdown")
+
+    def snapshot(self) -> dict:
+        return {
+            "queued_turns": len(self._queue),
+            "turns_submitted": self.turns_submitted,
+            "turns_dropped": self.turns_dropped,
+            "facts_extracted": self.facts_extracted,
+            "enrollments_updated": self.enrollments_updated,
+            "failed_batches": self.failed_batches,
+        }
+
+
+fact_extractor = FactExtractor()
@@ -0,0 +1,414 @@
+"""Offline grading of uploaded deliverables.
+
+The `uploads` table doubles as the job queue: every new upload is recorded with
+`grade_status="pending"` and a separate worker process (backend/grade_uploads.py) claims
+pending rows in batches, so grading bursts at course deadlines never share an event loop
+or the LLM scheduler with interactive chat.
+
+Each claimed upload is graded against the `deliverable` spec of the module the student is
+on. The cheap checks in deliverable_checks run first, in a process pool; only files that
+pass them and whose module has a rubric go to the LLM, several submissions per JSON-mode
+call at background priority. Results are written to the upload row, the enrollment's
+`module_progress` (a passing deliverable completes the module) and a `[FILE_GRADED]`
+system chat line.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.orm.exc import StaleDataError
+
+from .. import database, models
+from .course_catalog import CourseEntry, ModuleSpec, course_catalog
+from .deliverable_checks import check_file
+from .llm_scheduler import PRIORITY_BACKGROUND
+from .llm_service import SystemPrompt, generate_json_async
+from .progress_service import ProgressVerdict, advance_module, record_deliverable, record_progress
+from .upload_service import blob_path
+
+
+logger = logging.getLogger(__name__)
+
+COMMIT_ATTEMPTS = 3
+
+GRADER_INSTRUCTIONS = """You grade students' project files against each submission's rubric.
+Answer with one JSON object and nothing else:
+{"grades": [{"id": submission id, "passed": true or false, "score": number from 0 to 1, "feedback": "one or two short sentences for the student"}]}
+Grade every submission. Automated checks already confirmed each file is well-formed, so judge only what the rubric asks for."""
+
+
+@dataclass(frozen=True)
+class GradingSettings:
+    batch_size: int
+    llm_batch_size: int
+    processes: int
+    poll_seconds: float
+    lease_seconds: float
+    max_attempts: int
+    excerpt_chars: int
+    pass_ratio: float
+    timeout_seconds: float
+
+    @classmethod
+    def from_env(cls) -> "GradingSettings":
+        return cls(
+            batch_size=int(os.getenv("HOMEGROWN_GRADING_BATCH_SIZE", "32")),
+            llm_batch_size=int(os.getenv("HOMEGROWN_GRADING_LLM_BATCH_SIZE", "6")),
+            # 0 runs the checks in a thread of the worker process instead of a pool.
+            processes=int(os.getenv("HOMEGROWN_GRADING_PROCESSES", "2")),
+            poll_seconds=float(os.getenv("HOMEGROWN_GRADING_POLL_SECONDS", "5")),
+            lease_seconds=float(os.getenv("HOMEGROWN_GRADING_LEASE_SECONDS", "600")),
+            max_attempts=int(os.getenv("HOMEGROWN_GRADING_MAX_ATTEMPTS", "3")),
+            excerpt_chars=int(os.getenv("HOMEGROWN_GRADING_EXCERPT_CHARS", "6000")),
+            pass_ratio=float(os.getenv("HOMEGROWN_GRADING_PASS_RATIO", "0.7")),
+            timeout_seconds=float(os.getenv("HOMEGROWN_GRADING_TIMEOUT_SECONDS", "60")),
+        )
+
+
+settings = GradingSettings.from_env()
+
+
+@dataclass
+class GradingJob:
+    upload_id: int
+    enrollment_id: int
+    filename: str
+    stored_name: str
+    sha256: str
+    attempts: int
+    course: Optional[CourseEntry] = None
+    module: Optional[ModuleSpec] = None
+    checks: Optional[dict] = None
+
+
+# --- Queue ---
+
+def claim_uploads(config: GradingSettings = settings) -> List[GradingJob]:
+    """Lease up to `batch_size` pending uploads (or ones whose lease ran out) to this worker."""
+    uploads = models.Upload.__table__
+    now = datetime.utcnow()
+    claimable = or_(
+        uploads.c.grade_status == "pending",
+        and_(
+            uploads.c.grade_status == "grading",
+            uploads.c.grade_claimed_at < now - timedelta(seconds=config.lease_seconds),
+        ),
+    )
+    with database.engine.begin() as conn:
+        ids = conn.execute(
+            select(uploads.c.id).where(claimable).order_by(uploads.c.id).limit(config.batch_size)
+        ).scalars().all()
+        if not ids:
+            return []
+        # Re-checking `claimable` makes the claim safe against another worker racing for the same rows.
+        conn.execute(
+            update(uploads)
+            .where(uploads.c.id.in_(ids), claimable)
+            .values(
+                grade_status="grading",
+                grade_claimed_at=now,
+                grade_attempts=uploads.c.grade_attempts + 1,
+            )
+        )
+        rows = conn.execute(
+            select(uploads).where(uploads.c.id.in_(ids), uploads.c.grade_claimed_at == now)
+        ).all()
+
+    return [
+        GradingJob(
+            upload_id=row.id,
+            enrollment_id=row.enrollment_id,
+            filename=row.filename,
+            stored_name=row.stored_name,
+            sha256=row.sha256,
+            attempts=row.grade_attempts or 1,
+        )
+        for row in rows
+    ]
+
+
+def release_uploads(upload_ids: List[int]) -> None:
+    """Put uploads back in the queue, e.g. when the LLM could not grade them this time."""
+    uploads = models.Upload.__table__
+    with database.engine.begin() as conn:
+        conn.execute(
+            update(uploads)
+            .where(uploads.c.id.in_(upload_ids))
+            .values(grade_status="pending", grade_claimed_at=None)
+        )
+
+
+def _attach_modules(jobs: List[GradingJob]) -> None:
+    db = database.SessionLocal()
+    try:
+        Enrollment = models.Enrollment
+        rows = db.query(Enrollment.id, Enrollment.course_id, Enrollment.current_module_index).filter(
+            Enrollment.id.in_({job.enrollment_id for job in jobs})
+        )
+        enrollments = {row.id: row for row in rows}
+        courses = course_catalog.get_many(db, {row.course_id for row in enrollments.values()})
+    finally:
+        db.close()
+
+    for job in jobs:
+        enrollment = enrollments.get(job.enrollment_id)
+        course = courses.get(enrollment.course_id) if enrollment else None
+        if course is not None and course.error is None:
+            job.course = course
+            job.module = course.module(enrollment.current_module_index or 0)
+
+
+# --- Grading ---
+
+def _local_grade(job: GradingJob) -> dict:
+    checks = job.checks
+    grade = {
+        "module": job.module.key,
+        "kind": checks["kind"],
+        "errors": checks["errors"],
+        "warnings": checks["warnings"],
+        "source": "rules",
+        "score": None,
+    }
+    if checks["verdict"] == "fail":
+        return {**grade, "passed": False, "feedback": "Fix these and upload again: " + "; ".join(checks["errors"][:3])}
+    return {**grade, "passed": True, "feedback": "Your file passed all the automated checks."}
+
+
+def _submission(job: GradingJob) -> str:
+    notes = "; ".join(job.checks["warnings"]) or "none"
+    return (
+        f"## Submission {job.upload_id}\n"
+        f"Module: {job.module.title}\n"
+        f"Rubric: {job.module.deliverable.rubric}\n"
+        f"Automated check notes: {notes}\n"
+        f"--- {job.filename} ---\n{job.checks['excerpt']}\n--- end of {job.filename} ---"
+    )
+
+
+async def _grade_batch(jobs: List[GradingJob], config: GradingSettings) -> Dict[int, dict]:
+    prompt = SystemPrompt(prefix=GRADER_INSTRUCTIONS, suffix="")
+    data = await generate_json_async(
+        prompt,
+        "\n\n".join(_submission(job) for job in jobs),
+        tenant=("grading", jobs[0].upload_id),
+        priority=PRIORITY_BACKGROUND,
+        timeout_seconds=config.timeout_seconds,
+    )
+    grades = data.get("grades") if data else None
+    if not isinstance(grades, list):
+        return {}
+
+    by_id = {job.upload_id: job for job in jobs}
+    found = {}
+    for item in grades:
+        if not isinstance(item, dict):
+            continue
+        try:
+            job = by_id.get(int(item.get("id")))
+        except (TypeError, ValueError):
+            continue
+        if job is None:
+            continue
+        score = item.get("score")
+        score = min(1.0, max(0.0, float(score))) if isinstance(score, (int, float)) else None
+        passed = item.get("passed") is True and (score is None or score >= config.pass_ratio)
+        found[job.upload_id] = {
+            **_local_grade(job),
+            "source": "llm",
+            "passed": passed,
+            "score": score,
+            "feedback": str(item.get("feedback") or "")[:500],
+        }
+    return found
+
+
+async def grade_with_llm(jobs: List[GradingJob], config: GradingSettings = settings) -> Dict[int, dict]:
+    """Rubric grades for `jobs`, `llm_batch_size` submissions per request; missing ones failed."""
+    size = max(1, config.llm_batch_size)
+    batches = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+    found: Dict[int, dict] = {}
+    for grades in await asyncio.gather(*(_grade_batch(batch, config) for batch in batches)):
+        found.update(grades)
+    return found
+
+
+def write_grade(job: GradingJob, status: str, grade: dict) -> bool:
+    """Store the result; a graded deliverable also updates the enrollment and the chat."""
+    db = database.SessionLocal()
+    try:
+        for _ in range(COMMIT_ATTEMPTS):
+            upload = db.get(models.Upload, job.upload_id)
+            if upload is None:
+                return False
+            upload.grade_status = status
+            upload.grade = grade
+            upload.graded_at = datetime.utcnow()
+
+            if status == "graded":
+                enrollment = db.get(models.Enrollment, job.enrollment_id)
+                # A student who already moved on keeps their place; the grade is still recorded.
+                if enrollment is not None and enrollment.current_module_index == job.module.index:
+                    verdict = ProgressVerdict(
+                        complete=grade["passed"],
+                        source="grading",
+                        reason=grade["feedback"][:200],
+                        confidence=grade["score"],
+                    )
+                    record_progress(enrollment, job.module, verdict)
+                    record_deliverable(enrollment, job.module, job.upload_id, grade)
+                    if grade["passed"]:
+                        advance_module(enrollment, job.course)
+                outcome = "passed" if grade["passed"] else "needs work"
+                db.add(
+                    models.ChatLog(
+                        enrollment_id=job.enrollment_id,
+                        sender="system",
+                        content=f"[FILE_GRADED] {job.filename}: {outcome}. {grade['feedback']}",
+                    )
+                )
+            try:
+                db.commit()
+                return True
+            except StaleDataError:
+                # A chat turn updated the enrollment meanwhile; re-read it and try again.
+                db.rollback()
+        logger.warning("Upload %s: enrollment kept changing, leaving it for the next pass", job.upload_id)
+        return False
+    finally:
+        db.close()
+
+
+class GradingWorker:
+    """Claims batches of uploads and grades them; one per grading process."""
+
+    def __init__(self, config: GradingSettings = settings):
+        self.config = config
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+        self.graded = 0
+        self.failed_locally = 0
+        self.sent_to_llm = 0
+        self.llm_requests = 0
+        self.skipped = 0
+        self.released = 0
+        self.needs_review = 0
+
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        if self._pool is None and self.config.processes > 0:
+            # Spawned, not forked: the parent holds DB connections and event-loop threads.
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.config.processes, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    async def _run_checks(self, jobs: List[GradingJob]) -> None:
+        loop = asyncio.get_running_loop()
+        pool = self._executor()
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    pool,
+                    check_file,
+                    blob_path(job.sha256),
+                    job.filename,
+                    job.module.deliverable,
+                    self.config.excerpt_chars,
+                )
+                for job in jobs
+            )
+        )
+        for job, checks in zip(jobs, results):
+            job.checks = checks
+
+    async def _finish(self, job: GradingJob, status: str, grade: dict) -> None:
+        if await asyncio.to_thread(write_grade, job, status, grade):
+            if status == "graded":
+                self.graded += 1
+            elif status == "needs_review":
+                self.needs_review += 1
+            else:
+                self.skipped += 1
+
+    async def run_once(self) -> int:
+        """Grade one claimed batch; returns how many uploads were claimed."""
+        jobs = await asyncio.to_thread(claim_uploads, self.config)
+        if not jobs:
+            return 0
+        await asyncio.to_thread(_attach_modules, jobs)
+
+        gradable = []
+        for job in jobs:
+            if job.module is None or job.module.deliverable is None:
+                await self._finish(job, "skipped", {"reason": "the student's module has no graded deliverable"})
+            elif job.attempts > self.config.max_attempts:
+                await self._finish(job, "needs_review", {"reason": f"grading failed {job.attempts - 1} times"})
+            else:
+                gradable.append(job)
+        if not gradable:
+            return len(jobs)
+
+        await self._run_checks(gradable)
+        review = [job for job in gradable if job.checks["verdict"] == "review"]
+        for job in gradable:
+            verdict = job.checks["verdict"]
+            if verdict == "unreadable":
+                logger.error("Upload %s: %s", job.upload_id, "; ".join(job.checks["errors"]))
+                await self._finish(job, "needs_review", {"reason": "; ".join(job.checks["errors"])})
+            elif verdict != "review":
+                if verdict == "fail":
+                    self.failed_locally += 1
+                await self._finish(job, "graded", _local_grade(job))
+
+        if review:
+            self.sent_to_llm += len(review)
+            self.llm_requests += -(-len(review) // max(1, self.config.llm_batch_size))
+            grades = await grade_with_llm(review, self.config)
+            retry = []
+            for job in review:
+                grade = grades.get(job.upload_id)
+                if grade is not None:
+                    await self._finish(job, "graded", grade)
+                elif job.attempts >= self.config.max_attempts:
+                    pending_review = {**_local_grade(job), "passed": None, "feedback": "Waiting for a teacher to review."}
+                    await self._finish(job, "needs_review", pending_review)
+                else:
+                    retry.append(job.upload_id)
+            if retry:
+                self.released += len(retry)
+                await asyncio.to_thread(release_uploads, retry)
+        return len(jobs)
+
+    async def run_forever(self) -> None:
+        while True:
+            try:
+                claimed = await self.run_once()
+            except Exception:
+                logger.exception("Grading pass failed")
+                claimed = 0
+            # Keep going while there is a backlog; poll when the queue is empty.
+            if claimed < self.config.batch_size:
+                await asyncio.sleep(self.config.poll_seconds)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def snapshot(self) -> dict:
+        return {
+            "graded": self.graded,
+            "failed_locally": self.failed_locally,
+            "sent_to_llm": self.sent_to_llm,
+            "llm_requests": self.llm_requests,
+            "skipped": self.skipped,
+            "released": self.released,
+            "needs_review": self.needs_review,
+        }
@@ -0,0 +1,106 @@
+import base64
+from datetime import datetime
+from itertools import islice
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+from .. import models
+from .archive_service import iter_archived
+
+
+# Cursors are opaque to clients: base64 of "<iso timestamp>|<id>", matching the
+# (enrollment_id, timestamp, id) index so every page is a single index range scan.
+
+def encode_cursor(log) -> str:
+    raw = f"{log.timestamp.isoformat()}|{log.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, log_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid history cursor")
+
+
+def _item(log) -> dict:
+    return {
+        "id": log.id,
+        "sender": log.sender,
+        "content": log.content,
+        "timestamp": log.timestamp.isoformat() if log.timestamp else "",
+    }
+
+
+def fetch_history_page(
+    db: Session,
+    enrollment_id: int,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    since_id: Optional[int] = None,
+) -> dict:
+    """Return one page of chat history, oldest first.
+
+    - no cursor:  the latest `limit` messages
+    - `before`:   the `limit` messages immediately older than the cursor (scroll back)
+    - `after`:    the `limit` messages immediately newer than the cursor (scroll forward)
+    - `since_id`: messages with id > since_id (cheap incremental poll)
+
+    `has_more` says whether another page exists in the direction that was read.
+    Rows moved to cold storage are read from their segments: they are always older than
+    the enrollment's hot rows, so scrolling back continues into them once the hot table
+    runs out, and forward reads drain them before the hot table.
+    """
+    if sum(x is not None for x in (before, after, since_id)) > 1:
+        raise HTTPException(status_code=400, detail="Use only one of before, after or since_id")
+
+    ChatLog = models.ChatLog
+    key = tuple_(ChatLog.timestamp, ChatLog.id)
+    query = db.query(ChatLog).filter(ChatLog.enrollment_id == enrollment_id)
+
+    newest_first = after is None and since_id is None
+    before_key = decode_cursor(before) if before is not None else None
+    after_key = decode_cursor(after) if after is not None else None
+    if before_key is not None:
+        query = query.filter(key < tuple_(*before_key))
+    elif after_key is not None:
+        query = query.filter(key > tuple_(*after_key))
+    elif since_id is not None:
+        query = query.filter(ChatLog.id > since_id)
+
+    if newest_first:
+        query = query.order_by(ChatLog.timestamp.desc(), ChatLog.id.desc())
+    elif since_id is not None:
+        query = query.order_by(ChatLog.id.asc())
+    else:
+        query = query.order_by(ChatLog.timestamp.asc(), ChatLog.id.asc())
+
+    if newest_first:
+        logs: List = query.limit(limit + 1).all()
+        if len(logs) <= limit:
+            older_than = (logs[-1].timestamp, logs[-1].id) if logs else before_key
+            logs.extend(islice(iter_archived(db, enrollment_id, True, before=older_than), limit + 1 - len(logs)))
+    else:
+        logs = list(islice(iter_archived(db, enrollment_id, False, after=after_key, since_id=since_id), limit + 1))
+        if len(logs) <= limit:
+            logs.extend(query.limit(limit + 1 - len(logs)).all())
+
+    has_more = len(logs) > limit
+    logs = logs[:limit]
+    if newest_first:
+        logs.reverse()
+
+    return {
+        "enrollment_id": enrollment_id,
+        "items": [_item(log) for log in logs],
+        "has_more": has_more,
+        "before_cursor": encode_cursor(logs[0]) if logs else before,
+        "after_cursor": encode_cursor(logs[-1]) if logs else after,
+        "last_id": max((log.id for log in logs), default=since_id),
+    }
@@ -0,0 +1,318 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, Optional, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class LLMOverloadedError(RuntimeError):
+    """Raised when the per-worker LLM queue is full and the request should be shed."""
+
+
+class LLMDeadlineExceeded(RuntimeError):
+    """Raised when a call could not be completed (queued, throttled or retried) before its deadline."""
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Token-bucket parameters for one (provider, model, API key) combination."""
+
+    key: str
+    per_minute: float
+    burst: int
+
+
+class TokenBucket:
+    """Reservation-style token bucket; a rate of zero or less means unlimited."""
+
+    def __init__(self, per_minute: float, burst: int):
+        self.configure(per_minute, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def configure(self, per_minute: float, burst: int) -> None:
+        self.rate = per_minute / 60.0
+        self.burst = max(1, burst)
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take a token and return how long the caller must wait before using it."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(time.monotonic())
+        self.tokens -= 1
+        return max(0.0, -self.tokens / self.rate)
+
+    def refund(self) -> None:
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + 1)
+
+    def drain(self) -> None:
+        """The provider said we're over quota; stop handing out burst capacity."""
+        if self.rate > 0:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, 0.0)
+
+
+@dataclass
+class _Ticket:
+    priority: int
+    course_key: Hashable
+    enrollment_key: Hashable
+    enqueued_at: float
+    granted: asyncio.Future
+    cancelled: bool = False
+
+
+@dataclass
+class SchedulerStats:
+    submitted: int = 0
+    completed: int = 0
+    rejected: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    deadline_exceeded: int = 0
+    fallbacks: int = 0
+    wait_seconds_total: float = 0.0
+    wait_seconds_max: float = 0.0
+    waits: int = 0
+
+
+class LLMScheduler:
+    """Admission control in front of the LLM providers.
+
+    - At most `max_concurrency` calls run at once; up to `max_pending` more wait in a queue
+      and anything beyond that is shed with `LLMOverloadedError`.
+    - Waiting calls are served by priority, then round-robin across courses and, within a
+      course, across enrollments, so one busy class or student can't starve the rest.
+    - Each call takes a token from the bucket for its provider/model/key before it runs.
+    - Rate-limit errors drain that bucket and are retried with jittered exponential
+      backoff until the call's deadline; after that `LLMDeadlineExceeded` is raised.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_pending: int,
+        is_retryable: Callable[[Exception], bool],
+        backoff_base_seconds: float = 0.5,
+        backoff_max_seconds: float = 8.0,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_pending = max(0, max_pending)
+        self.is_retryable = is_retryable
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+
+        self.in_flight = 0
+        self.pending = 0
+        self.stats = SchedulerStats()
+
+        self._queues: Dict[int, "OrderedDict[Hashable, OrderedDict[Hashable, Deque[_Ticket]]]"] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    # --- Queueing ---
+
+    def _enqueue(self, ticket: _Ticket) -> None:
+        courses = self._queues.setdefault(ticket.priority, OrderedDict())
+        enrollments = courses.setdefault(ticket.course_key, OrderedDict())
+        enrollments.setdefault(ticket.enrollment_key, deque()).append(ticket)
+        self.pending += 1
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        for priority in sorted(self._queues):
+            courses = self._queues[priority]
+            while courses:
+                course_key, enrollments = next(iter(courses.items()))
+                enrollment_key, tickets = next(iter(enrollments.items()))
+                ticket = tickets.popleft()
+
+                # Rotate so the next pick goes to a different enrollment/course.
+                if tickets:
+                    enrollments.move_to_end(enrollment_key)
+                else:
+                    del enrollments[enrollment_key]
+                if enrollments:
+                    courses.move_to_end(course_key)
+                else:
+                    del courses[course_key]
+
+                if not ticket.cancelled:
+                    return ticket
+            del self._queues[priority]
+        return None
+
+    def _dispatch(self) -> None:
+        while self.in_flight < self.max_concurrency:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            self.pending -= 1
+            self.in_flight += 1
+            ticket.granted.set_result(None)
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._dispatch()
+
+    async def _acquire(self, tenant: Tuple[Hashable, Hashable], priority: int, deadline: float) -> None:
+        if self.in_flight >= self.max_concurrency and self.pending >= self.max_pending:
+            self.stats.rejected += 1
+            raise LLMOverloadedError("LLM worker queue is full")
+
+        loop = asyncio.get_running_loop()
+        ticket = _Ticket(
+            priority=priority,
+            course_key=tenant[0],
+            enrollment_key=tenant[1],
+            enqueued_at=time.monotonic(),
+            granted=loop.create_future(),
+        )
+        self._enqueue(ticket)
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.granted), timeout=max(0.0, deadline - time.monotonic()))
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if ticket.granted.done():
+                self._release()
+            else:
+                ticket.cancelled = True
+                self.pending -= 1
+                ticket.granted.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats.deadline_exceeded += 1
+                raise LLMDeadlineExceeded("Timed out waiting for an LLM slot") from None
+            raise
+
+        waited = time.monotonic() - ticket.enqueued_at
+        self.stats.waits += 1
+        self.stats.wait_seconds_total += waited
+        self.stats.wait_seconds_max = max(self.stats.wait_seconds_max, waited)
+
+    # --- Rate limiting ---
+
+    def _bucket(self, limit: RateLimit) -> TokenBucket:
+        bucket = self._buckets.get(limit.key)
+        if bucket is None:
+            bucket = self._buckets[limit.key] = TokenBucket(limit.per_minute, limit.burst)
+        elif bucket.rate != limit.per_minute / 60.0 or bucket.burst != max(1, limit.burst):
+            bucket.configure(limit.per_minute, limit.burst)
+        return bucket
+
+    async def _take_token(self, limit: RateLimit, deadline: float) -> None:
+        bucket = self._bucket(limit)
+        wait = bucket.reserve()
+        if wait <= 0:
+            return
+        if time.monotonic() + wait > deadline:
+            bucket.refund()
+            self.stats.deadline_exceeded += 1
+            raise LLMDeadlineExceeded("Rate limit wait would exceed the deadline")
+        await asyncio.sleep(wait)
+
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": spreads retries out so throttled callers don't return in lockstep.
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** attempt)))
+
+    def _retry_delay(self, err: Exception, limit: RateLimit, attempt: int, deadline: float) -> float:
+        """Return how long to wait before retrying `err`, or re-raise if we shouldn't."""
+        if isinstance(err, (LLMDeadlineExceeded, LLMOverloadedError)) or not self.is_retryable(err):
+            raise err
+
+        self.stats.rate_limited += 1
+        self._bucket(limit).drain()
+
+        delay = self._backoff(attempt)
+        if time.monotonic() + delay >= deadline:
+            self.stats.deadline_exceeded += 1
+            raise LLMDeadlineExceeded("LLM still rate limited at deadline") from err
+        return delay
+
+    # --- Public API ---
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[T]],
+        *,
+        limit: RateLimit,
+        tenant: Tuple[Hashable, Hashable],
+        priority: int,
+        deadline: float,
+    ) -> T:
+        self.stats.submitted += 1
+        attempt = 0
+        while True:
+            await self._acquire(tenant, priority, deadline)
+            try:
+                await self._take_token(limit, deadline)
+                result = await call()
+                self.stats.completed += 1
+                return result
+            except Exception as e:
+                delay = self._retry_delay(e, limit, attempt, deadline)
+            finally:
+                self._release()
+
+            attempt += 1
+            self.stats.retries += 1
+            await asyncio.sleep(delay)
+
+    async def stream(
+        self,
+        open_stream: Callable[[], AsyncIterator[T]],
+        *,
+        limit: RateLimit,
+        tenant: Tuple[Hashable, Hashable],
+        priority: int,
+        deadline: float,
+    ) -> AsyncIterator[T]:
+        """Like `run`, but for streaming calls. Only failures before the first item are retried."""
+        self.stats.submitted += 1
+        attempt = 0
+        while True:
+            await self._acquire(tenant, priority, deadline)
+            emitted = False
+            try:
+                await self._take_token(limit, deadline)
+                async for item in open_stream():
+                    emitted = True
+                    yield item
+                self.stats.completed += 1
+                return
+            except Exception as e:
+                if emitted:
+                    raise
+                delay = self._retry_delay(e, limit, attempt, deadline)
+            finally:
+                self._release()
+
+            attempt += 1
+            self.stats.retries += 1
+            await asyncio.sleep(delay)
+
+    def snapshot(self) -> dict:
+        stats = self.stats
+        return {
+            "queue_depth": self.pending,
+            "in_flight": self.in_flight,
+            "submitted": stats.submitted,
+            "completed": stats.completed,
+            "rejected": stats.rejected,
+            "retries": stats.retries,
+            "rate_limited": stats.rate_limited,
+            "deadline_exceeded": stats.deadline_exceeded,
+            "fallbacks": stats.fallbacks,
+            "wait_seconds_avg": stats.wait_seconds_total / stats.waits if stats.waits else 0.0,
+            "wait_seconds_max": stats.wait_seconds_max,
+        }
@@ -1,11 +1,65 @@
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import math
 import os
-import google.generativeai as genai
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
 
+from ..metrics import llm_route_fallbacks, record_llm_route, record_llm_tokens
+from .llm_scheduler import (
+    PRIORITY_INTERACTIVE,
+    LLMDeadlineExceeded,
+    LLMOverloadedError,
+    LLMScheduler,
+    RateLimit,
+)
+from .model_router import ModelChoice, Route
 
-def _dev_fallback_response(user_message: str, current_mod: dict) -> str:
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SystemPrompt:
+    """A system prompt split into a stable, cacheable prefix and a per-turn suffix.
+
+    The prefix (persona, agent core, course) is identical for every student in a course,
+    so providers that support context caching upload it once and reference it by handle.
+    """
+
+    prefix: str
+    suffix: str
+
+    @property
+    def text(self) -> str:
+        return f"{self.prefix}\n{self.suffix}"
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough rule of thumb for English prose; good enough for budgeting and metrics.
+    return (len(text) + 3) // 4
+
+
+DEV_COMPLETION_PHRASES = ("done", "completed", "finish", "finished", "i did it", "module complete")
+
+
+def _dev_claims_completion(user_message: str) -> bool:
     msg_lower = user_message.strip().lower()
-    if any(token in msg_lower for token in ["done", "completed", "finish", "finished", "i did it", "module complete"]):
-        return f"Nice work — you met the objective for '{current_mod.get('title', 'this module')}'. [MODULE_COMPLETE]"
+    return any(token in msg_lower for token in DEV_COMPLETION_PHRASES)
+
+
+def _dev_fallback_response(user_message: str, current_mod: dict) -> str:
+    if _dev_claims_completion(user_message):
+        return f"Nice work — you met the objective for '{current_mod.get('title', 'this module')}'."
 
     objective = current_mod.get("objective")
     if objective:
@@ -13,27 +67,801 @@ def _dev_fallback_response(user_message: str, current_mod: dict) -> str:
     return "Tell me what you tried, and I'll guide your next step."
 
 
-def generate_ai_text(system_instruction: str, user_message: str, current_mod: dict) -> str:
-    dev_fallback_enabled = os.getenv("HOMEGROWN_DEV_FALLBACK", "0") == "1"
-    if dev_fallback_enabled:
+class FallbackReply(str):
+    """Canned text sent instead of a model reply when the LLM deadline ran out.
+
+    It only fits this moment, so it must never be stored in the response cache.
+    """
+
+
+def _deadline_fallback(user_message: str, current_mod: dict) -> FallbackReply:
+    scheduler.stats.fallbacks += 1
+    return FallbackReply(_dev_fallback_response(user_message, current_mod))
+
+
+def _split_into_chunks(text: str):
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+def _is_rate_limit_error(err: Exception) -> bool:
+    err_text = str(err)
+    return "429" in err_text or "quota" in err_text.lower() or "rate" in err_text.lower()
+
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("HOMEGROWN_LLM_THREADPOOL_SIZE", "32")),
+    thread_name_prefix="llm",
+)
+
+
+async def run_in_llm_pool(func, *args, **kwargs):
+    """Run a blocking provider call on the dedicated LLM thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+# --- Prefix (context) caching ---
+
+@dataclass
+class _CachedPrefix:
+    handle: object
+    expires_at: float
+
+
+class PrefixCache:
+    """Tracks provider-side cached-content handles for stable prompt prefixes.
+
+    Entries are keyed by model and a hash of the prefix text, so editing a persona yields a
+    new key and the stale handle simply ages out. Handles are refreshed shortly before they
+    expire. Providers that reject a prefix (e.g. below their minimum cacheable size) are
+    remembered so we don't retry on every turn.
+    """
+
+    def __init__(
+        self,
+        create: Callable[[str, str, int], object],
+        refresh: Optional[Callable[[object, int], None]] = None,
+        delete: Optional[Callable[[object], None]] = None,
+        ttl_seconds: int = 3600,
+        refresh_margin_seconds: int = 120,
+    ):
+        self._create = create
+        self._refresh = refresh
+        self._delete = delete
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self._entries: Dict[str, _CachedPrefix] = {}
+        self._rejected: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.reused = 0
+        self.prefix_chars_sent = 0
+        self.prefix_chars_reused = 0
+        self.prefix_tokens_reused = 0
+
+    @staticmethod
+    def key_for(model_name: str, prefix: str) -> str:
+        digest = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+        return f"{model_name}:{digest}"
+
+    def get_handle(self, model_name: str, prefix: str) -> Optional[object]:
+        key = self.key_for(model_name, prefix)
+        now = time.monotonic()
+
+        with self._lock:
+            self.requests += 1
+            if self._rejected.get(key, 0) > now:
+                self.prefix_chars_sent += len(prefix)
+                return None
+
+            entry = self._entries.get(key)
+            if entry and entry.expires_at - now > self.refresh_margin_seconds:
+                self._record_reuse(prefix)
+                return entry.handle
+
+        if entry and entry.expires_at > now and self._refresh is not None:
+            try:
+                self._refresh(entry.handle, self.ttl_seconds)
+                with self._lock:
+                    entry.expires_at = now + self.ttl_seconds
+                    self._record_reuse(prefix)
+                return entry.handle
+            except Exception:
+                pass
+
+        try:
+            handle = self._create(model_name, prefix, self.ttl_seconds)
+        except Exception:
+            with self._lock:
+                self._rejected[key] = now + self.ttl_seconds
+                self.prefix_chars_sent += len(prefix)
+            return None
+
+        with self._lock:
+            self._entries[key] = _CachedPrefix(handle=handle, expires_at=now + self.ttl_seconds)
+            self.prefix_chars_sent += len(prefix)
+        return handle
+
+    def _record_reuse(self, prefix: str) -> None:
+        self.reused += 1
+        self.prefix_chars_reused += len(prefix)
+        self.prefix_tokens_reused += estimate_tokens(prefix)
+
+    def invalidate(self) -> None:
+        """Forget every handle, e.g. after personas are edited; remote copies are deleted best-effort."""
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+            self._rejected.clear()
+
+        if self._delete is None:
+            return
+        for entry in entries:
+            try:
+                self._delete(entry.handle)
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "reused": self.reused,
+            "entries": len(self._entries),
+            "prefix_chars_sent": self.prefix_chars_sent,
+            "prefix_chars_reused": self.prefix_chars_reused,
+            "prefix_tokens_reused": self.prefix_tokens_reused,
+        }
+
+
+# --- Configuration ---
+
+@dataclass(frozen=True)
+class LLMConfig:
+    """Provider settings, read from the environment once per (re)load rather than per call."""
+
+    provider: str
+    api_key: Optional[str]
+    default_model: str
+    embedding_model: str
+    transport: Optional[str]
+    prefix_cache_enabled: bool
+    prefix_cache_ttl_seconds: int
+    requests_per_minute: float
+    rate_limit_burst: int
+    fallback_deadline_seconds: float
+    # "background" loads the provider SDK in a thread at startup, "blocking" before serving,
+    # "off" on the first call that needs it.
+    warmup: str = "background"
+    # Per-model overrides, e.g. {"gemini-1.5-flash": {"temperature": 0.4, "timeout": 20, "rpm": 300}}.
+    # "timeout" becomes a request option, "rpm"/"burst" feed the scheduler's token bucket;
+    # everything else is generation config.
+    model_settings: Dict[str, dict] = field(default_factory=dict)
+
+    @classmethod
+    def from_env(cls) -> "LLMConfig":
+        dev_fallback_enabled = os.getenv("HOMEGROWN_DEV_FALLBACK", "0") == "1"
+        raw_settings = os.getenv("HOMEGROWN_LLM_MODEL_SETTINGS", "").strip()
+        return cls(
+            provider="stub" if dev_fallback_enabled else os.getenv("HOMEGROWN_LLM_PROVIDER", "gemini"),
+            api_key=os.getenv("GEMINI_API_KEY"),
+            default_model=os.getenv("GEMINI_MODEL", "gemini-pro-latest"),
+            embedding_model=os.getenv("GEMINI_EMBEDDING_MODEL", "models/text-embedding-004"),
+            transport=os.getenv("GEMINI_TRANSPORT") or None,
+            prefix_cache_enabled=os.getenv("HOMEGROWN_PREFIX_CACHE", "1") == "1",
+            prefix_cache_ttl_seconds=int(os.getenv("HOMEGROWN_PREFIX_CACHE_TTL_SECONDS", "3600")),
+            requests_per_minute=float(os.getenv("HOMEGROWN_LLM_RPM", "0")),
+            rate_limit_burst=int(os.getenv("HOMEGROWN_LLM_BURST", "10")),
+            fallback_deadline_seconds=float(os.getenv("HOMEGROWN_LLM_FALLBACK_DEADLINE_SECONDS", "20")),
+            warmup=os.getenv("HOMEGROWN_LLM_WARMUP", "background"),
+            model_settings=json.loads(raw_settings) if raw_settings else {},
+        )
+
+
+# --- Providers ---
+
+class LLMProvider:
+    """Base provider. Subclasses implement `generate`; async and streaming variants
+    default to running it on the LLM thread pool."""
+
+    name = "base"
+
+    def __init__(self, config: LLMConfig):
+        self.config = config
+        self.prefix_cache: Optional[PrefixCache] = None
+
+    # `model` picks one of the provider's models for this call; None means `config.default_model`.
+
+    def generate(self, prompt: SystemPrompt, user_message: str, current_mod: dict, model: Optional[str] = None) -> str:
+        raise NotImplementedError
+
+    async def agenerate(
+        self, prompt: SystemPrompt, user_message: str, current_mod: dict, model: Optional[str] = None
+    ) -> str:
+        return await run_in_llm_pool(self.generate, prompt, user_message, current_mod, model)
+
+    async def astream(
+        self, prompt: SystemPrompt, user_message: str, current_mod: dict, model: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        yield await self.agenerate(prompt, user_message, current_mod, model)
+
+    def warmup(self) -> None:
+        """Load SDKs and clients ahead of the first request; a no-op for local providers."""
+
+    async def agenerate_json(self, prompt: SystemPrompt, user_message: str) -> str:
+        """Like `agenerate` but asks for a single JSON object; providers with a JSON mode use it."""
+        return await self.agenerate(prompt, user_message, {})
+
+    async def aembed(self, text: str) -> Optional[List[float]]:
+        """Embedding used for semantic cache lookups; None when unsupported or failing."""
+        return None
+
+    def rate_limit(self, model: Optional[str] = None) -> RateLimit:
+        model_name = model or self.config.default_model
+        settings = self.config.model_settings.get(model_name, {})
+        key_id = hashlib.sha256((self.config.api_key or "").encode("utf-8")).hexdigest()[:8]
+        return RateLimit(
+            key=f"{self.name}:{model_name}:{key_id}",
+            per_minute=float(settings.get("rpm", self.config.requests_per_minute)),
+            burst=int(settings.get("burst", self.config.rate_limit_burst)),
+        )
+
+    def close(self) -> None:
+        """Release provider resources once the provider has been swapped out."""
+
+
+class StubProvider(LLMProvider):
+    """Offline provider that answers with the canned dev responses.
+
+    It still runs prefixes through a `PrefixCache` so prefix reuse can be observed and
+    tested without network access.
+    """
+
+    name = "stub"
+
+    def __init__(self, config: LLMConfig):
+        super().__init__(config)
+        self.prefix_cache = PrefixCache(
+            create=lambda model_name, prefix, ttl: PrefixCache.key_for(model_name, prefix),
+            ttl_seconds=config.prefix_cache_ttl_seconds,
+        )
+
+    def generate(self, prompt: SystemPrompt, user_message: str, current_mod: dict, model: Optional[str] = None) -> str:
+        self.prefix_cache.get_handle(self.name, prompt.prefix)
         return _dev_fallback_response(user_message, current_mod)
 
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise RuntimeError("GEMINI_API_KEY is not configured")
+    async def agenerate(
+        self, prompt: SystemPrompt, user_message: str, current_mod: dict, model: Optional[str] = None
+    ) -> str:
+        return self.generate(prompt, user_message, current_mod, model)
 
-    genai.configure(api_key=api_key)
+    async def astream(
+        self, prompt: SystemPrompt, user_message: str, current_mod: dict, model: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        for piece in _split_into_chunks(self.generate(prompt, user_message, current_mod, model)):
+            yield piece
 
-    model_name = os.getenv("GEMINI_MODEL", "gemini-pro-latest")
-    model = genai.GenerativeModel(model_name)
+    async def agenerate_json(self, prompt: SystemPrompt, user_message: str) -> str:
+        complete = _dev_claims_completion(user_message)
+        return json.dumps({"complete": complete, "score": 1.0 if complete else 0.0, "reason": "dev heuristic"})
 
-    full_prompt = f"{system_instruction}\n\nUser: {user_message}"
+    async def aembed(self, text: str) -> Optional[List[float]]:
+        # Hashed bag-of-words: crude, but deterministic and good enough to exercise the
+        # semantic cache offline.
+        vector = [0.0] * 64
+        for word in text.lower().split():
+            vector[int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % 64] += 1.0
+        return vector
 
+
+def _chunk_text(chunk) -> str:
+    # Chunks that only carry safety/finish metadata raise on `.text`.
     try:
-        response = model.generate_content(full_prompt)
+        return chunk.text or ""
+    except ValueError:
+        return ""
+
+
+@dataclass(frozen=True)
+class FakeLLMSettings:
+    """Knobs for the benchmark provider.
+
+    Latency specs: `fixed:MS`, `uniform:LO_MS:HI_MS`, `exponential:MEAN_MS` or
+    `lognormal:MEDIAN_MS:SIGMA`. The sampled latency is the time to the first token;
+    the rest of the reply then streams at `tokens_per_second`. `model_latency` overrides
+    the spec per model name, e.g. `{"gemini-flash-latest": "lognormal:250:0.4"}`, so
+    model routing can be load-tested.
+    """
+
+    latency: str
+    tokens_per_second: float
+    response_tokens: int
+    rate_limit_probability: float
+    seed: Optional[int]
+    model_latency: Dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_env(cls) -> "FakeLLMSettings":
+        seed = os.getenv("HOMEGROWN_FAKE_LLM_SEED")
+        model_latency = os.getenv("HOMEGROWN_FAKE_LLM_MODEL_LATENCY", "").strip()
+        return cls(
+            latency=os.getenv("HOMEGROWN_FAKE_LLM_LATENCY", "lognormal:800:0.5"),
+            tokens_per_second=float(os.getenv("HOMEGROWN_FAKE_LLM_TOKENS_PER_SECOND", "60")),
+            response_tokens=int(os.getenv("HOMEGROWN_FAKE_LLM_RESPONSE_TOKENS", "60")),
+            rate_limit_probability=float(os.getenv("HOMEGROWN_FAKE_LLM_429_RATE", "0")),
+            seed=int(seed) if seed else None,
+            model_latency=json.loads(model_latency) if model_latency else {},
+        )
+
+
+class FakeRateLimitError(Exception):
+    pass
+
+
+class FakeProvider(StubProvider):
+    """Stub replies with simulated latency, streaming speed and 429s, for load tests.
+
+    Select it with HOMEGROWN_LLM_PROVIDER=fake; see `FakeLLMSettings` for the knobs.
+    """
+
+    name = "fake"
+
+    def __init__(self, config: LLMConfig):
+        super().__init__(config)
+        self.settings = FakeLLMSettings.from_env()
+        self._random = random.Random(self.settings.seed)
+        self._sample_latency = self._latency_sampler(self.settings.latency)
+        self._model_latency = {
+            model: self._latency_sampler(spec) for model, spec in self.settings.model_latency.items()
+        }
+
+    def _latency(self, model: Optional[str]) -> float:
+        return self._model_latency.get(model, self._sample_latency)()
+
+    def _latency_sampler(self, spec: str) -> Callable[[], float]:
+        kind, _, raw_args = spec.partition(":")
+        args = [float(a) for a in raw_args.split(":") if a]
+        rng = self._random
+        samplers = {
+            "fixed": lambda: args[0],
+            "uniform": lambda: rng.uniform(args[0], args[1]),
+            "exponential": lambda: rng.expovariate(1.0 / args[0]),
+            "lognormal": lambda: rng.lognormvariate(math.log(args[0]), args[1]),
+        }
+        if kind not in samplers:
+            raise RuntimeError(f"Unknown fake LLM latency distribution '{kind}'")
+        return lambda: max(0.0, samplers[kind]()) / 1000.0
+
+    def _reply(self, prompt: SystemPrompt, user_message: str, current_mod: dict) -> List[str]:
+        if self._random.random() < self.settings.rate_limit_probability:
+            raise FakeRateLimitError("429 Resource has been exhausted (fake provider)")
+        pieces = _split_into_chunks(super().generate(prompt, user_message, current_mod) + " ")
+        filler = self.settings.response_tokens - len(pieces)
+        return pieces + ["lorem "] * max(0, filler)
+
+    def generate(self, prompt: SystemPrompt, user_message: str, current_mod: dict, model: Optional[str] = None) -> str:
+        pieces = self._reply(prompt, user_message, current_mod)
+        time.sleep(self._latency(model) + len(pieces) / self.settings.tokens_per_second)
+        return "".join(pieces)
+
+    async def agenerate(
+        self, prompt: SystemPrompt, user_message: str, current_mod: dict, model: Optional[str] = None
+    ) -> str:
+        pieces = self._reply(prompt, user_message, current_mod)
+        await asyncio.sleep(self._latency(model) + len(pieces) / self.settings.tokens_per_second)
+        return "".join(pieces)
+
+    async def astream(
+        self, prompt: SystemPrompt, user_message: str, current_mod: dict, model: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        pieces = self._reply(prompt, user_message, current_mod)
+        await asyncio.sleep(self._latency(model))
+        for piece in pieces:
+            yield piece
+            await asyncio.sleep(1.0 / self.settings.tokens_per_second)
+
+    async def agenerate_json(self, prompt: SystemPrompt, user_message: str) -> str:
+        await asyncio.sleep(self._sample_latency())
+        return await super().agenerate_json(prompt, user_message)
+
+
+class GeminiProvider(LLMProvider):
+    """Gemini client configured once; model objects are built lazily and reused.
+
+    `google.generativeai` is imported on first use (or by `warmup`) because it is the
+    slowest import in the app. `genai.configure` then sets up the SDK's long-lived
+    transport (a gRPC channel by default), so connections and TLS sessions are kept
+    alive across requests.
+    """
+
+    name = "gemini"
+
+    def __init__(self, config: LLMConfig):
+        super().__init__(config)
+        self._genai = None
+        self._genai_lock = threading.Lock()
+
+        self._models: Dict[str, object] = {}
+        self._models_lock = threading.Lock()
+
+        if config.prefix_cache_enabled:
+            self.prefix_cache = PrefixCache(
+                create=self._create_cached_model,
+                refresh=lambda handle, ttl: handle[0].update(ttl=timedelta(seconds=ttl)),
+                delete=lambda handle: handle[0].delete(),
+                ttl_seconds=config.prefix_cache_ttl_seconds,
+            )
+
+    @property
+    def genai(self):
+        sdk = self._genai
+        if sdk is None:
+            with self._genai_lock:
+                sdk = self._genai
+                if sdk is None:
+                    import google.generativeai as sdk
+
+                    if self.config.api_key:
+                        sdk.configure(api_key=self.config.api_key, transport=self.config.transport)
+                    self._genai = sdk
+        return sdk
+
+    def warmup(self) -> None:
+        self.genai
+
+    def _settings_for(self, model_name: str):
+        settings = dict(self.config.model_settings.get(model_name, {}))
+        timeout = settings.pop("timeout", None)
+        settings.pop("rpm", None)
+        settings.pop("burst", None)
+        request_options = {"timeout": timeout} if timeout else None
+        return settings or None, request_options
+
+    def _get_model(self, model_name: str, json_mode: bool = False):
+        key = (model_name, json_mode)
+        model = self._models.get(key)
+        if model is None:
+            with self._models_lock:
+                model = self._models.get(key)
+                if model is None:
+                    generation_config, _ = self._settings_for(model_name)
+                    if json_mode:
+                        generation_config = {**(generation_config or {}), "response_mime_type": "application/json"}
+                    model = self.genai.GenerativeModel(model_name, generation_config=generation_config)
+                    self._models[key] = model
+        return model
+
+    def _create_cached_model(self, model_name: str, prefix: str, ttl_seconds: int):
+        cached = self.genai.caching.CachedContent.create(
+            model=model_name,
+            display_name="homegrown-prefix",
+            system_instruction=prefix,
+            ttl=timedelta(seconds=ttl_seconds),
+        )
+        generation_config, _ = self._settings_for(model_name)
+        return cached, self.genai.GenerativeModel.from_cached_content(cached, generation_config=generation_config)
+
+    def _prepare(self, prompt: SystemPrompt, user_message: str, model: Optional[str] = None):
+        """Return the model to call, the contents to send it and its request options.
+
+        With a cached prefix the model is bound to the cached content and only the
+        volatile suffix travels with the request.
+        """
+        if not self.config.api_key:
+            raise RuntimeError("GEMINI_API_KEY is not configured")
+
+        model_name = model or self.config.default_model
+        _, request_options = self._settings_for(model_name)
+
+        if self.prefix_cache is not None:
+            handle = self.prefix_cache.get_handle(model_name, prompt.prefix)
+            if handle is not None:
+                return handle[1], f"{prompt.suffix}\n\nUser: {user_message}", request_options
+
+        return self._get_model(model_name), f"{prompt.text}\n\nUser: {user_message}", request_options
+
+    def generate(self, prompt: SystemPrompt, user_message: str, current_mod: dict, model: Optional[str] = None) -> str:
+        client, contents, request_options = self._prepare(prompt, user_message, model)
+        return client.generate_content(contents, request_options=request_options).text
+
+    async def agenerate(
+        self, prompt: SystemPrompt, user_message: str, current_mod: dict, model: Optional[str] = None
+    ) -> str:
+        # Creating or refreshing a cached-content handle is a blocking API call.
+        client, contents, request_options = await run_in_llm_pool(self._prepare, prompt, user_message, model)
+
+        generate_async = getattr(client, "generate_content_async", None)
+        if generate_async is not None:
+            response = await generate_async(contents, request_options=request_options)
+        else:
+            # Older SDKs only ship the blocking client; keep it off the event loop.
+            response = await run_in_llm_pool(client.generate_content, contents, request_options=request_options)
         return response.text
-    except Exception as e:
-        err_text = str(e)
-        if "429" in err_text or "quota" in err_text.lower() or "rate" in err_text.lower():
-            return _dev_fallback_response(user_message, current_mod)
-        raise
+
+    async def astream(
+        self, prompt: SystemPrompt, user_message: str, current_mod: dict, model: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        client, contents, request_options = await run_in_llm_pool(self._prepare, prompt, user_message, model)
+
+        generate_async = getattr(client, "generate_content_async", None)
+        if generate_async is None:
+            response = await run_in_llm_pool(client.generate_content, contents, request_options=request_options)
+            yield response.text
+            return
+
+        response = await generate_async(contents, stream=True, request_options=request_options)
+        async for chunk in response:
+            text = _chunk_text(chunk)
+            if text:
+                yield text
+
+    async def agenerate_json(self, prompt: SystemPrompt, user_message: str) -> str:
+        # Short structured calls skip the prefix cache; JSON mode needs its own model config.
+        if not self.config.api_key:
+            raise RuntimeError("GEMINI_API_KEY is not configured")
+        model_name = self.config.default_model
+        _, request_options = self._settings_for(model_name)
+        model = self._get_model(model_name, json_mode=True)
+        contents = f"{prompt.text}\n\nUser: {user_message}"
+
+        generate_async = getattr(model, "generate_content_async", None)
+        if generate_async is None:
+            response = await run_in_llm_pool(model.generate_content, contents, request_options=request_options)
+        else:
+            response = await generate_async(contents, request_options=request_options)
+        return response.text
+
+    async def aembed(self, text: str) -> Optional[List[float]]:
+        if not self.config.api_key:
+            return None
+        try:
+            result = await self.genai.embed_content_async(model=self.config.embedding_model, content=text)
+        except Exception:
+            return None
+        return result.get("embedding")
+
+    def close(self) -> None:
+        if self.prefix_cache is not None:
+            self.prefix_cache.invalidate()
+        with self._models_lock:
+            self._models.clear()
+
+
+PROVIDER_FACTORIES: Dict[str, Callable[[LLMConfig], LLMProvider]] = {
+    "gemini": GeminiProvider,
+    "stub": StubProvider,
+    "fake": FakeProvider,
+}
+
+
+class ProviderRegistry:
+    """Holds the worker's live provider and swaps it atomically on config reload.
+
+    In-flight calls keep the provider object they started with; only new calls see the
+    replacement.
+    """
+
+    def __init__(self):
+        self._config: Optional[LLMConfig] = None
+        self._provider: Optional[LLMProvider] = None
+        self._lock = threading.Lock()
+
+    def configure(self, config: LLMConfig) -> LLMProvider:
+        factory = PROVIDER_FACTORIES.get(config.provider)
+        if factory is None:
+            raise RuntimeError(f"Unknown LLM provider '{config.provider}'")
+
+        provider = factory(config)
+        with self._lock:
+            previous, self._provider, self._config = self._provider, provider, config
+
+        if previous is not None:
+            previous.close()
+        return provider
+
+    def reload(self) -> bool:
+        """Re-read configuration and swap providers if anything changed."""
+        config = LLMConfig.from_env()
+        if config == self._config:
+            return False
+        self.configure(config)
+        return True
+
+    def get(self) -> LLMProvider:
+        provider = self._provider
+        if provider is None:
+            with self._lock:
+                provider = self._provider
+            if provider is None:
+                provider = self.configure(LLMConfig.from_env())
+        return provider
+
+
+providers = ProviderRegistry()
+
+
+def get_provider() -> LLMProvider:
+    return providers.get()
+
+
+scheduler = LLMScheduler(
+    max_concurrency=int(os.getenv("HOMEGROWN_LLM_MAX_CONCURRENCY", "256")),
+    max_pending=int(os.getenv("HOMEGROWN_LLM_MAX_PENDING", "1024")),
+    is_retryable=_is_rate_limit_error,
+)
+
+
+def _route_plan(route: Optional[Route]) -> Tuple[str, Tuple[ModelChoice, ...]]:
+    if route is None:
+        return "default", (ModelChoice(None),)
+    return route.kind, route.attempts
+
+
+def _attempt_deadline(choice: ModelChoice, deadline: float) -> float:
+    if choice.timeout_seconds is None:
+        return deadline
+    return min(deadline, time.monotonic() + choice.timeout_seconds)
+
+
+def _bounded(call: Awaitable[str], choice: ModelChoice, deadline: float) -> Awaitable[str]:
+    # Only routed models with a tier timeout are cut off; others keep the old unbounded call.
+    if choice.timeout_seconds is None:
+        return call
+    return asyncio.wait_for(call, timeout=max(0.0, deadline - time.monotonic()))
+
+
+async def _first_within(stream: AsyncIterator[str], choice: ModelChoice, deadline: float) -> AsyncIterator[str]:
+    """Pass `stream` through, giving up if its first chunk has not arrived by `deadline`."""
+    iterator = stream.__aiter__()
+    if choice.timeout_seconds is not None:
+        try:
+            first = await asyncio.wait_for(iterator.__anext__(), timeout=max(0.0, deadline - time.monotonic()))
+        except StopAsyncIteration:
+            return
+        yield first
+    async for item in iterator:
+        yield item
+
+
+def _route_fallback(kind: str, model_name: str, err: Exception) -> None:
+    llm_route_fallbacks.inc(route=kind, model=model_name)
+    logger.warning("Model %s gave no %s reply (%s); trying the next model", model_name, kind, type(err).__name__)
+
+
+async def generate_ai_text_async(
+    system_prompt: SystemPrompt,
+    user_message: str,
+    current_mod: dict,
+    tenant: Tuple[Hashable, Hashable] = ("", 0),
+    priority: int = PRIORITY_INTERACTIVE,
+    route: Optional[Route] = None,
+) -> str:
+    """Generate a tutor reply, on the routed model when a `route` is given.
+
+    A routed model that times out or fails hands the turn to the next one in
+    `route.attempts`; the last one falls back to the canned reply at the deadline.
+    """
+    provider = get_provider()
+    kind, attempts = _route_plan(route)
+    deadline = time.monotonic() + provider.config.fallback_deadline_seconds
+    input_tokens = estimate_tokens(system_prompt.text + user_message)
+
+    for attempt, choice in enumerate(attempts):
+        model_name = choice.model or provider.config.default_model
+        call_deadline = _attempt_deadline(choice, deadline)
+        started = time.monotonic()
+        try:
+            text = await scheduler.run(
+                lambda: _bounded(
+                    provider.agenerate(system_prompt, user_message, current_mod, choice.model), choice, call_deadline
+                ),
+                limit=provider.rate_limit(choice.model),
+                tenant=tenant,
+                priority=priority,
+                deadline=call_deadline,
+            )
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            if attempt + 1 < len(attempts):
+                _route_fallback(kind, model_name, e)
+                continue
+            if not isinstance(e, (LLMDeadlineExceeded, asyncio.TimeoutError)):
+                raise
+            return _deadline_fallback(user_message, current_mod)
+
+        output_tokens = estimate_tokens(text)
+        record_llm_tokens(provider.name, input_tokens, output_tokens)
+        record_llm_route(kind, model_name, time.monotonic() - started, input_tokens, output_tokens)
+        return text
+
+
+async def stream_ai_text_async(
+    system_prompt: SystemPrompt,
+    user_message: str,
+    current_mod: dict,
+    tenant: Tuple[Hashable, Hashable] = ("", 0),
+    priority: int = PRIORITY_INTERACTIVE,
+    route: Optional[Route] = None,
+) -> AsyncIterator[str]:
+    """Streaming `generate_ai_text_async`; a route's timeout applies to the first chunk."""
+    provider = get_provider()
+    kind, attempts = _route_plan(route)
+    deadline = time.monotonic() + provider.config.fallback_deadline_seconds
+    input_tokens = estimate_tokens(system_prompt.text + user_message)
+
+    for attempt, choice in enumerate(attempts):
+        model_name = choice.model or provider.config.default_model
+        call_deadline = _attempt_deadline(choice, deadline)
+        started = time.monotonic()
+        output = []
+        try:
+            async for text in scheduler.stream(
+                lambda: _first_within(
+                    provider.astream(system_prompt, user_message, current_mod, choice.model), choice, call_deadline
+                ),
+                limit=provider.rate_limit(choice.model),
+                tenant=tenant,
+                priority=priority,
+                deadline=call_deadline,
+            ):
+                output.append(text)
+                yield text
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            # Once tokens have gone out the reply can't switch models.
+            if output:
+                raise
+            if attempt + 1 < len(attempts):
+                _route_fallback(kind, model_name, e)
+                continue
+            if not isinstance(e, (LLMDeadlineExceeded, asyncio.TimeoutError)):
+                raise
+            # The scheduler only gives up before the first token, so nothing has been sent yet.
+            for piece in _split_into_chunks(_deadline_fallback(user_message, current_mod)):
+                yield FallbackReply(piece)
+            return
+
+        output_tokens = estimate_tokens("".join(output))
+        record_llm_tokens(provider.name, input_tokens, output_tokens)
+        record_llm_route(kind, model_name, time.monotonic() - started, input_tokens, output_tokens)
+        return
+
+
+async def generate_json_async(
+    system_prompt: SystemPrompt,
+    user_message: str,
+    tenant: Tuple[Hashable, Hashable] = ("", 0),
+    priority: int = PRIORITY_INTERACTIVE,
+    timeout_seconds: Optional[float] = None,
+) -> Optional[dict]:
+    """Ask the provider for one JSON object; None if it is busy, slow, failing or not JSON.
+
+    Used for auxiliary decisions (e.g. progress evaluation) where no answer is better than
+    a wrong one, so every failure is swallowed and logged.
+    """
+    provider = get_provider()
+    timeout = provider.config.fallback_deadline_seconds if timeout_seconds is None else timeout_seconds
+    try:
+        text = await scheduler.run(
+            lambda: provider.agenerate_json(system_prompt, user_message),
+            limit=provider.rate_limit(),
+            tenant=tenant,
+            priority=priority,
+            deadline=time.monotonic() + timeout,
+        )
+    except (LLMDeadlineExceeded, LLMOverloadedError):
+        scheduler.stats.fallbacks += 1
+        return None
+    except Exception:
+        logger.warning("Structured LLM call failed", exc_info=True)
+        return None
+
+    record_llm_tokens(provider.name, estimate_tokens(system_prompt.text + user_message), estimate_tokens(text))
+    try:
+        data = json.loads(text.strip().removeprefix("```json").removesuffix("```"))
+    except ValueError:
+        logger.warning("Structured LLM call returned non-JSON output: %.200s", text)
+        return None
+    return data if isinstance(data, dict) else None
@@ -0,0 +1,157 @@
+import os
+import re
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+from sqlalchemy.orm import Session
+
+from .. import models
+from .llm_service import estimate_tokens
+
+
+SENDER_LABELS = {"student": "Student", "agent": "Tutor", "system": "System"}
+
+
+@dataclass(frozen=True)
+class MemorySettings:
+    history_token_budget: int
+    summary_token_budget: int
+    max_loaded_turns: int
+    summary_line_chars: int
+    catchup_chunks: int
+
+    @classmethod
+    def from_env(cls) -> "MemorySettings":
+        return cls(
+            history_token_budget=int(os.getenv("HOMEGROWN_MEMORY_TOKEN_BUDGET", "1500")),
+            summary_token_budget=int(os.getenv("HOMEGROWN_MEMORY_SUMMARY_TOKENS", "400")),
+            max_loaded_turns=int(os.getenv("HOMEGROWN_MEMORY_MAX_TURNS", "60")),
+            summary_line_chars=int(os.getenv("HOMEGROWN_MEMORY_SUMMARY_LINE_CHARS", "160")),
+            catchup_chunks=int(os.getenv("HOMEGROWN_MEMORY_CATCHUP_CHUNKS", "5")),
+        )
+
+
+settings = MemorySettings.from_env()
+
+
+@dataclass
+class ConversationMemory:
+    summary: str = ""
+    turns: List[Tuple[str, str]] = field(default_factory=list)
+
+    def render(self) -> str:
+        if not self.summary and not self.turns:
+            return ""
+
+        lines = ["", "    CONVERSATION SO FAR:"]
+        if self.summary:
+            lines.append("    Summary of earlier conversation:")
+            lines.extend(f"    {line}" for line in self.summary.splitlines())
+        if self.turns:
+            lines.append("    Recent messages:")
+            lines.extend(f"    {SENDER_LABELS.get(sender, sender)}: {content}" for sender, content in self.turns)
+        return "\n".join(lines) + "\n"
+
+
+def _format_turn(sender: str, content: str) -> str:
+    return f"{SENDER_LABELS.get(sender, sender)}: {content}"
+
+
+def _condense(sender: str, content: str, max_chars: int) -> str:
+    text = " ".join((content or "").split())
+    first_sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    if len(first_sentence) > max_chars:
+        first_sentence = first_sentence[: max_chars - 1].rstrip() + "…"
+    return f"- {_format_turn(sender, first_sentence)}"
+
+
+def roll_summary(summary: str, turns: List[Tuple[str, str]], config: MemorySettings = settings) -> str:
+    """Fold older turns into the running summary, keeping it within its token budget.
+
+    Each turn is condensed to its first sentence; once the budget is exceeded the oldest
+    lines are dropped, so the summary stays a fixed size no matter how long the course runs.
+    """
+    lines = [line for line in (summary or "").splitlines() if line.strip()]
+    lines.extend(_condense(sender, content, config.summary_line_chars) for sender, content in turns)
+
+    while lines and estimate_tokens("\n".join(lines)) > config.summary_token_budget:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def _catch_up(db: Session, enrollment: models.Enrollment, before_id: int, config: MemorySettings) -> bool:
+    """Fold unsummarized rows older than `before_id` into the summary, oldest first.
+
+    Reads at most `catchup_chunks` chunks of `max_loaded_turns` rows; returns True once
+    `summary_through_log_id` has reached them all.
+    """
+    for _ in range(max(1, config.catchup_chunks)):
+        chunk = (
+            db.query(models.ChatLog.id, models.ChatLog.sender, models.ChatLog.content)
+            .filter(
+                models.ChatLog.enrollment_id == enrollment.id,
+                models.ChatLog.id > (enrollment.summary_through_log_id or 0),
+                models.ChatLog.id < before_id,
+            )
+            .order_by(models.ChatLog.id.asc())
+            .limit(config.max_loaded_turns)
+            .all()
+        )
+        if not chunk:
+            return True
+        enrollment.conversation_summary = roll_summary(
+            enrollment.conversation_summary, [(log.sender, log.content) for log in chunk], config
+        )
+        enrollment.summary_through_log_id = chunk[-1].id
+        if len(chunk) < config.max_loaded_turns:
+            return True
+    return False
+
+
+def load_memory(db: Session, enrollment: models.Enrollment, config: MemorySettings = settings) -> ConversationMemory:
+    """Return the newest turns that fit the history budget plus the rolling summary.
+
+    Turns that fall out of the window are folded into `enrollment.conversation_summary`
+    and `summary_through_log_id` is advanced; the caller's commit persists both.
+    At most `max_loaded_turns` recent rows are read per call. Older unsummarized rows
+    (e.g. history from before memory existed) are summarized forward from the cursor a
+    few chunks per call; until that catches up, the window's overflow waits its turn.
+    """
+    logs = (
+        db.query(models.ChatLog.id, models.ChatLog.sender, models.ChatLog.content)
+        .filter(
+            models.ChatLog.enrollment_id == enrollment.id,
+            models.ChatLog.id > (enrollment.summary_through_log_id or 0),
+        )
+        .order_by(models.ChatLog.id.desc())
+        .limit(config.max_loaded_turns)
+        .all()
+    )
+
+    caught_up = True
+    if len(logs) >= config.max_loaded_turns:
+        # A full page may not reach back to the cursor; never skip rows that were not read.
+        caught_up = _catch_up(db, enrollment, logs[-1].id, config)
+
+    window = []
+    used = 0
+    for log in logs:
+        cost = estimate_tokens(_format_turn(log.sender, log.content or ""))
+        if used + cost > config.history_token_budget:
+            break
+        window.append(log)
+        used += cost
+
+    overflow = logs[len(window):]
+    if overflow and caught_up:
+        enrollment.conversation_summary = roll_summary(
+            enrollment.conversation_summary,
+            [(log.sender, log.content) for log in reversed(overflow)],
+            config,
+        )
+        enrollment.summary_through_log_id = overflow[0].id
+
+    return ConversationMemory(
+        summary=enrollment.conversation_summary or "",
+        turns=[(log.sender, log.content or "") for log in reversed(window)],
+    )
@@ -0,0 +1,159 @@
+"""Routes each chat turn to a small or a large model.
+
+Turns are classified locally with a few regexes, no model call:
+
+- `ack`: greetings and acknowledgements ("ok", "thanks!", "yes, I'm ready");
+- `quiz_answer`: bare answers ("b", "true", "my answer is 42", "1 a 2 c 3 b");
+- `code_review`: messages containing code, markup or an error to debug;
+- `concept`: everything else, i.e. explanations and open questions.
+
+A policy maps each kind to a tier (`small`/`large`) or directly to a model name. The
+default comes from `HOMEGROWN_LLM_ROUTING` and a persona can override single kinds with a
+`routing:` header line (see instructors.py). A small-model call that is slow to answer
+or fails falls back to the large model, so hard turns are never stuck on the cheap one.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+
+ROUTES = ("ack", "quiz_answer", "concept", "code_review")
+TIERS = ("small", "large")
+
+ACK_PHRASES = sorted(
+    (
+        "hi", "hello", "hey", "yo", "thanks", "thank you", "thx", "ok", "okay", "k", "yes", "yeah", "yep",
+        "yup", "sure", "cool", "great", "nice", "awesome", "got it", "makes sense", "im ready", "ready",
+        "lets go", "lets do it", "next", "continue", "go on", "sounds good", "nope", "so much", "a lot",
+        "again", "now", "please",
+    ),
+    key=len,
+    reverse=True,
+)
+ACK_MAX_WORDS = 6
+
+QUIZ_ANSWER_RE = re.compile(
+    r"(?:(?:my )?(?:final )?answer(?: is)?|i (?:think|choose|pick|say|guess)(?: its| it is)?|its|it is)?\s*"
+    r"(?:[a-d]|true|false|-?\d+(?:\.\d+)?)"
+    r"|(?:\d+ [a-d] ?)+"
+)
+CODE_RE = re.compile(
+    r"```|</?[a-zA-Z][^<>]*>|[{};]\s*$"
+    r"|^\s*(?:(?:def|class)\s+\w+.*:|function\s*\w*\s*\(|(?:const|let|var)\s+\w+\s*=|import\s+\w+)"
+    r"|\b(?:traceback|exception|error|bug|debug|stack trace|syntax|not working|doesn'?t work)\b",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def _normalize(message: str) -> str:
+    text = message.lower().replace("'", "").replace("’", "")
+    text = re.sub(r"[^\w\s.-]", " ", text)
+    text = re.sub(r"(?<!\d)[.]|[.](?!\d)", " ", text)
+    return " ".join(text.split())
+
+
+def _is_ack(normalized: str) -> bool:
+    if not normalized or len(normalized.split()) > ACK_MAX_WORDS:
+        return False
+    rest = normalized
+    while rest:
+        phrase = next((p for p in ACK_PHRASES if rest == p or rest.startswith(p + " ")), None)
+        if phrase is None:
+            break
+        rest = rest[len(phrase):].strip()
+    # Allow one leftover word, e.g. the tutor's name in "thanks tera".
+    return rest != normalized and len(rest.split()) <= 1
+
+
+def classify_turn(message: str) -> str:
+    if CODE_RE.search(message):
+        return "code_review"
+    normalized = _normalize(message)
+    if QUIZ_ANSWER_RE.fullmatch(normalized):
+        return "quiz_answer"
+    if "?" not in message and _is_ack(normalized):
+        return "ack"
+    return "concept"
+
+
+def parse_policy(raw: str) -> Dict[str, str]:
+    """`"ack=small, code_review=gemini-2.5-pro"` -> {"ack": "small", "code_review": "gemini-2.5-pro"}."""
+    policy = {}
+    for item in raw.split(","):
+        if not item.strip():
+            continue
+        kind, sep, target = (part.strip() for part in item.partition("="))
+        if not sep or kind not in ROUTES or not target:
+            raise ValueError(f"routing entries look like 'concept=large', got {item.strip()!r}")
+        policy[kind] = target
+    return policy
+
+
+@dataclass(frozen=True)
+class RoutingSettings:
+    enabled: bool
+    policy: Dict[str, str]
+    small_model: str
+    # Empty means the provider's configured default model (GEMINI_MODEL).
+    large_model: str
+    small_timeout_seconds: float
+    # 0 leaves large-model calls to the provider's overall fallback deadline.
+    large_timeout_seconds: float
+
+    @classmethod
+    def from_env(cls) -> "RoutingSettings":
+        raw = os.getenv("HOMEGROWN_LLM_ROUTING", "ack=small,quiz_answer=small,concept=large,code_review=large")
+        enabled = raw.strip().lower() not in ("", "off", "0")
+        return cls(
+            enabled=enabled,
+            policy=parse_policy(raw) if enabled else {},
+            small_model=os.getenv("HOMEGROWN_LLM_SMALL_MODEL", "gemini-flash-latest"),
+            large_model=os.getenv("HOMEGROWN_LLM_LARGE_MODEL", ""),
+            small_timeout_seconds=float(os.getenv("HOMEGROWN_LLM_SMALL_TIMEOUT_SECONDS", "6")),
+            large_timeout_seconds=float(os.getenv("HOMEGROWN_LLM_LARGE_TIMEOUT_SECONDS", "0")),
+        )
+
+
+settings = RoutingSettings.from_env()
+
+
+@dataclass(frozen=True)
+class ModelChoice:
+    # None means the provider's default model.
+    model: Optional[str]
+    timeout_seconds: Optional[float] = None
+
+
+@dataclass(frozen=True)
+class Route:
+    kind: str
+    tier: str
+    # Tried in order; later entries are fallbacks for timeouts and errors.
+    attempts: Tuple[ModelChoice, ...]
+
+
+def _choice(tier: str, config: RoutingSettings) -> ModelChoice:
+    if tier == "small":
+        return ModelChoice(config.small_model, config.small_timeout_seconds or None)
+    return ModelChoice(config.large_model or None, config.large_timeout_seconds or None)
+
+
+def route_turn(
+    message: str, persona_policy: Optional[Dict[str, str]] = None, config: RoutingSettings = settings
+) -> Optional[Route]:
+    """The route for one turn, or None when routing is off (use the default model)."""
+    if not config.enabled:
+        return None
+    kind = classify_turn(message)
+    target = {**config.policy, **(persona_policy or {})}.get(kind, "large")
+    if target not in TIERS:
+        # An explicit model name: no tier timeout, the large model backs it up.
+        return Route(kind=kind, tier="custom", attempts=(ModelChoice(target), _choice("large", config)))
+
+    primary = _choice(target, config)
+    attempts = (primary,)
+    if primary.timeout_seconds is not None:
+        attempts += (_choice("large" if target == "small" else "small", config),)
+    return Route(kind=kind, tier=target, attempts=attempts)
@@ -0,0 +1,269 @@
+"""Decides when a student has finished a module.
+
+Each turn is checked by cheap local rules first and only goes to a small JSON-mode LLM
+call when the rules can't tell:
+
+- a question or a near-empty message never completes a module;
+- a message matching every `completion_patterns` regex of the module completes it;
+- a tutor reply that grades a quiz ("Score: 17/20") is decided by the module's
+  `pass_score`, e.g. `"pass_score": "17/20"` for a 20-question module exam;
+- any other short message that neither claims to be done nor shows work (code, markup)
+  does not complete the module.
+
+Only what is left, a claim or a submission the rules can't check, is worth the LLM
+call (`HOMEGROWN_PROGRESS_EVALUATOR=auto`, the default). `llm` asks about every message
+the first rules leave open; `rules` never asks. The LLM check only looks at the student's
+message, so it runs concurrently with the tutor reply rather than after it. Outcomes, quiz scores and graded deliverables (see
+grading_service) are kept in `Enrollment.module_progress`.
+"""
+
+import asyncio
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Hashable, Optional, Pattern, Tuple
+
+from .llm_service import SystemPrompt, generate_json_async
+
+
+# A message that says it is finished, or hands in work, is the only kind the rules can't settle.
+CLAIM_RE = re.compile(
+    r"\b(?:done|finished|completed?|submit(?:ted|ting)?|solved|works now|got it working|here(?:'s| is) my)\b"
+    r"|```|</?[a-z][a-z0-9]*[\s>/]|[{};]\s*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+SCORE_RE = re.compile(r"\b(?:score|scored|got|earned)\b[^\d\n]{0,12}(\d{1,3})\s*(?:/|out of)\s*(\d{1,3})\b", re.IGNORECASE)
+
+EVALUATOR_INSTRUCTIONS = """You check whether a student's latest message shows they met a course module's success criteria.
+Answer with one JSON object and nothing else:
+{"complete": true or false, "score": number from 0 to 1, "reason": "one short sentence"}
+Only mark complete when the message itself demonstrates the criteria; saying "I'm done" is not enough."""
+
+
+@dataclass(frozen=True)
+class ProgressSettings:
+    evaluator: str
+    min_chars: int
+    answer_chars: int
+    pass_ratio: float
+    timeout_seconds: float
+    max_scores: int
+
+    @classmethod
+    def from_env(cls) -> "ProgressSettings":
+        return cls(
+            evaluator=os.getenv("HOMEGROWN_PROGRESS_EVALUATOR", "auto"),
+            min_chars=int(os.getenv("HOMEGROWN_PROGRESS_MIN_CHARS", "4")),
+            # Long enough to be a worked answer rather than chatter, so "auto" asks the LLM.
+            answer_chars=int(os.getenv("HOMEGROWN_PROGRESS_ANSWER_CHARS", "200")),
+            pass_ratio=float(os.getenv("HOMEGROWN_PROGRESS_PASS_RATIO", "0.7")),
+            timeout_seconds=float(os.getenv("HOMEGROWN_PROGRESS_TIMEOUT_SECONDS", "8")),
+            max_scores=int(os.getenv("HOMEGROWN_PROGRESS_MAX_SCORES", "20")),
+        )
+
+
+settings = ProgressSettings.from_env()
+
+
+def _parse_score(value) -> Tuple[int, int]:
+    if isinstance(value, str):
+        match = re.fullmatch(r"\s*(\d+)\s*(?:/|out of)\s*(\d+)\s*", value)
+        if match:
+            value = (match.group(1), match.group(2))
+    if isinstance(value, (list, tuple)) and len(value) == 2:
+        passing, out_of = int(value[0]), int(value[1])
+        if 0 < passing <= out_of:
+            return passing, out_of
+    raise ValueError(f"pass_score must look like '17/20', got {value!r}")
+
+
+@dataclass(frozen=True)
+class ProgressRules:
+    """Completion rules from the optional `pass_score` / `completion_patterns` module keys."""
+
+    pass_score: Optional[Tuple[int, int]] = None
+    completion_patterns: Tuple[Pattern, ...] = ()
+
+    @classmethod
+    def for_module(cls, module: dict) -> "ProgressRules":
+        pass_score = module.get("pass_score")
+        patterns = module.get("completion_patterns") or []
+        if not isinstance(patterns, list):
+            raise ValueError("completion_patterns must be a list of regexes")
+        try:
+            compiled = tuple(re.compile(p) for p in patterns)
+        except (re.error, TypeError) as e:
+            raise ValueError(f"invalid completion pattern: {e}")
+        return cls(
+            pass_score=_parse_score(pass_score) if pass_score is not None else None,
+            completion_patterns=compiled,
+        )
+
+
+@dataclass(frozen=True)
+class ProgressVerdict:
+    complete: bool
+    # "rules", "llm", or "unavailable" when the evaluator could not answer in time.
+    source: str
+    reason: str = ""
+    # Quiz score the tutor announced this turn, as (correct, out_of).
+    quiz_score: Optional[Tuple[int, int]] = None
+    # Evaluator confidence in [0, 1], when the LLM was asked.
+    confidence: Optional[float] = None
+
+    @property
+    def recorded(self) -> bool:
+        # Plain chatter is not worth an enrollment write.
+        return self.source != "rules" or self.complete or self.quiz_score is not None
+
+
+def extract_quiz_score(reply: str) -> Optional[Tuple[int, int]]:
+    scores = [(int(m.group(1)), int(m.group(2))) for m in SCORE_RE.finditer(reply or "")]
+    scores = [(correct, out_of) for correct, out_of in scores if 0 < out_of and correct <= out_of]
+    # The last one wins when a reply recaps earlier attempts before the new grade.
+    return scores[-1] if scores else None
+
+
+def precheck(current_mod, message: str, config: ProgressSettings = settings) -> Optional[ProgressVerdict]:
+    """Verdict from the student's message alone, or None if it needs the evaluator."""
+    rules = current_mod.progress
+    if rules.completion_patterns and all(p.search(message) for p in rules.completion_patterns):
+        return ProgressVerdict(complete=True, source="rules", reason="matched the module's completion patterns")
+
+    text = message.strip()
+    if len(text) < config.min_chars or text.endswith("?"):
+        return ProgressVerdict(complete=False, source="rules", reason="question or too short to assess")
+    if config.evaluator not in ("auto", "llm") or not (current_mod.success_criteria or current_mod.objective):
+        return ProgressVerdict(complete=False, source="rules", reason="no rule matched")
+    if config.evaluator == "auto" and len(text) < config.answer_chars and not CLAIM_RE.search(text):
+        return ProgressVerdict(complete=False, source="rules", reason="no completion claim or work shown")
+    return None
+
+
+def check_reply(current_mod, reply: str) -> Optional[ProgressVerdict]:
+    """Verdict from a graded quiz in the tutor's reply; such turns never need the evaluator."""
+    score = extract_quiz_score(reply)
+    if score is None:
+        return None
+
+    pass_score = current_mod.progress.pass_score
+    if pass_score is not None and score[1] == pass_score[1]:
+        passed = score[0] >= pass_score[0]
+        reason = f"exam {'passed' if passed else 'failed'} ({score[0]}/{score[1]}, needs {pass_score[0]})"
+        return ProgressVerdict(complete=passed, source="rules", reason=reason, quiz_score=score)
+    return ProgressVerdict(complete=False, source="rules", reason="quiz graded", quiz_score=score)
+
+
+async def evaluate_with_llm(
+    current_mod, message: str, tenant: Tuple[Hashable, Hashable], config: ProgressSettings = settings
+) -> ProgressVerdict:
+    prompt = SystemPrompt(
+        prefix=EVALUATOR_INSTRUCTIONS,
+        suffix=(
+            f"Module: {current_mod.title}\n"
+            f"Objective: {current_mod.objective}\n"
+            f"Success criteria: {current_mod.success_criteria or current_mod.objective}"
+        ),
+    )
+    data = await generate_json_async(prompt, message, tenant=tenant, timeout_seconds=config.timeout_seconds)
+    if data is None:
+        return ProgressVerdict(complete=False, source="unavailable", reason="evaluator unavailable")
+
+    confidence = data.get("score")
+    confidence = min(1.0, max(0.0, float(confidence))) if isinstance(confidence, (int, float)) else None
+    complete = data.get("complete") is True and (confidence is None or confidence >= config.pass_ratio)
+    return ProgressVerdict(
+        complete=complete, source="llm", reason=str(data.get("reason") or "")[:200], confidence=confidence
+    )
+
+
+class ProgressEvaluation:
+    """One turn's evaluation, started before the tutor replies and finished after."""
+
+    def __init__(self, current_mod, message: str, tenant: Tuple[Hashable, Hashable]):
+        self.current_mod = current_mod
+        self._verdict = precheck(current_mod, message)
+        self._task: Optional[asyncio.Task] = None
+        if self._verdict is None:
+            self._task = asyncio.create_task(evaluate_with_llm(current_mod, message, tenant))
+
+    async def finish(self, reply: str) -> ProgressVerdict:
+        graded = check_reply(self.current_mod, reply)
+        if graded is not None:
+            self.cancel()
+            return graded
+        if self._task is not None:
+            return await self._task
+        return self._verdict
+
+    def cancel(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+
+def record_progress(enrollment, current_mod, verdict: ProgressVerdict, config: ProgressSettings = settings) -> None:
+    """Fold a verdict into `enrollment.module_progress`; the caller's commit persists it."""
+    if not verdict.recorded:
+        return
+
+    now = datetime.utcnow().isoformat()
+    progress = dict(enrollment.module_progress or {})
+    entry = dict(progress.get(current_mod.key) or {"status": "in_progress", "evaluations": 0})
+    entry["evaluations"] = entry.get("evaluations", 0) + 1
+    entry["last_source"] = verdict.source
+    entry["last_reason"] = verdict.reason
+    if verdict.confidence is not None:
+        entry["last_confidence"] = verdict.confidence
+
+    if verdict.quiz_score is not None:
+        correct, out_of = verdict.quiz_score
+        scores = list(entry.get("scores") or [])
+        scores.append({"correct": correct, "out_of": out_of, "at": now})
+        entry["scores"] = scores[-config.max_scores:]
+        entry["best_ratio"] = max(entry.get("best_ratio", 0.0), round(correct / out_of, 4))
+
+    if verdict.complete and entry.get("status") != "complete":
+        entry["status"] = "complete"
+        entry["completed_at"] = now
+        entry["completed_by"] = verdict.source
+
+    progress[current_mod.key] = entry
+    # Reassign rather than mutate so the JSON column is flagged dirty.
+    enrollment.module_progress = progress
+
+
+def record_deliverable(
+    enrollment, current_mod, upload_id: int, grade: dict, config: ProgressSettings = settings
+) -> None:
+    """Append a graded upload to the module's entry; call after `record_progress`."""
+    progress = dict(enrollment.module_progress or {})
+    entry = dict(progress.get(current_mod.key) or {"status": "in_progress", "evaluations": 0})
+    deliverables = list(entry.get("deliverables") or [])
+    deliverables.append(
+        {
+            "upload_id": upload_id,
+            "passed": grade["passed"],
+            "score": grade.get("score"),
+            "source": grade["source"],
+            "at": datetime.utcnow().isoformat(),
+        }
+    )
+    entry["deliverables"] = deliverables[-config.max_scores:]
+    progress[current_mod.key] = entry
+    enrollment.module_progress = progress
+
+
+def advance_module(enrollment, course):
+    """Move the enrollment to the next module; returns the workspace update, or None at the end."""
+    next_mod = course.module(enrollment.current_module_index + 1)
+    if next_mod is None:
+        return None
+
+    enrollment.current_module_index = next_mod.index
+    return {
+        "status": "unlocked",
+        "next_module": next_mod.title,
+        "objective": next_mod.objective,
+    }
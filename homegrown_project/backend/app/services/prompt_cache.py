@@ -0,0 +1,72 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional, Tuple
+
+from .llm_service import SystemPrompt
+
+
+def facts_version(student_facts) -> str:
+    """Short, stable fingerprint of an enrollment's student facts (the blob or its rendered form)."""
+    payload = json.dumps(student_facts or {}, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class PromptCache:
+    """Bounded LRU of fully rendered system prompts (`SystemPrompt` objects).
+
+    Keys are `(agent_id, course_id, course_version, module_index, facts_version,
+    agent_version)`, so advancing a module, editing the course or agent or changing the
+    facts naturally misses. Persona edits must call `invalidate` since their text is not
+    part of the key.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[Hashable, ...], SystemPrompt]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: Tuple[Hashable, ...], build: Callable[[], SystemPrompt]) -> SystemPrompt:
+        with self._lock:
+            prompt = self._entries.get(key)
+            if prompt is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return prompt
+            self.misses += 1
+
+        prompt = build()
+
+        with self._lock:
+            self._entries[key] = prompt
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return prompt
+
+    def invalidate(self, agent_id: Optional[str] = None, course_id: Optional[str] = None) -> int:
+        """Drop entries for an agent and/or course; with no arguments, clear everything."""
+        with self._lock:
+            if agent_id is None and course_id is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+
+            stale = [
+                key
+                for key in self._entries
+                if (agent_id is None or key[0] == agent_id) and (course_id is None or key[1] == course_id)
+            ]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+prompt_cache = PromptCache(max_entries=int(os.getenv("HOMEGROWN_PROMPT_CACHE_SIZE", "2048")))
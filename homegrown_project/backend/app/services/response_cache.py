@@ -0,0 +1,276 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .llm_service import get_provider
+
+
+# Conceptual questions are the ones many students ask word-for-word; anything else
+# (answers, code, personal details) is too specific to share.
+DEFAULT_ALLOW_PATTERNS = (
+    r"^(what|whats|why|how|explain|define|describe)\b",
+    r"^(can|could) you (explain|define|describe)\b",
+)
+DEFAULT_DENY_PATTERNS = (
+    r"\b(my|mine|i|im|ive|me)\b",
+)
+
+Scope = Tuple[str, str, str]
+
+
+def normalize_message(message: str) -> str:
+    text = message.lower().replace("'", "")
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """Which messages in a module may be answered from the cache.
+
+    Built from the optional `response_cache` block on a curriculum module, e.g.
+    `{"enabled": true, "allow": ["^what is"], "deny": ["quiz"], "ttl_seconds": 600}`.
+    """
+
+    enabled: bool = True
+    allow: Tuple[str, ...] = DEFAULT_ALLOW_PATTERNS
+    deny: Tuple[str, ...] = DEFAULT_DENY_PATTERNS
+    ttl_seconds: Optional[int] = None
+
+    @classmethod
+    def for_module(cls, module: dict) -> "CachePolicy":
+        raw = module.get("response_cache") if isinstance(module, dict) else None
+        if not isinstance(raw, dict):
+            return cls()
+        return cls(
+            enabled=bool(raw.get("enabled", True)),
+            allow=tuple(raw.get("allow", DEFAULT_ALLOW_PATTERNS)),
+            deny=tuple(raw.get("deny", DEFAULT_DENY_PATTERNS)),
+            ttl_seconds=raw.get("ttl_seconds"),
+        )
+
+    def permits(self, normalized: str) -> bool:
+        if not self.enabled or not normalized:
+            return False
+        if any(re.search(pattern, normalized) for pattern in self.deny):
+            return False
+        return any(re.search(pattern, normalized) for pattern in self.allow)
+
+
+@dataclass
+class _Entry:
+    response: str
+    expires_at: float
+    size: int
+    embedding: Optional[List[float]] = None
+
+
+@dataclass
+class ResponseCacheStats:
+    hits: int = 0
+    semantic_hits: int = 0
+    misses: int = 0
+    bypassed: int = 0
+    stores: int = 0
+    evictions: int = 0
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ResponseCache:
+    """TTL + LRU cache of tutor replies, bounded by an approximate memory budget.
+
+    Exact hits match on `(persona, course, module)` plus the normalized message. When an
+    embedding is supplied, a miss falls back to the most similar cached question in the
+    same scope if it clears `similarity_threshold`.
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: int, similarity_threshold: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.bytes_used = 0
+        self.stats = ResponseCacheStats()
+        self._entries: "OrderedDict[Tuple[Scope, str], _Entry]" = OrderedDict()
+        self._scopes: Dict[Scope, set] = {}
+        self._lock = threading.Lock()
+
+    def _remove(self, key: Tuple[Scope, str]) -> None:
+        entry = self._entries.pop(key)
+        self.bytes_used -= entry.size
+        keys = self._scopes.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._scopes[key[0]]
+
+    def get(self, scope: Scope, normalized: str, embedding: Optional[List[float]] = None) -> Optional[str]:
+        now = time.monotonic()
+        key = (scope, normalized)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return entry.response
+            if entry is not None:
+                self._remove(key)
+
+            if embedding is not None:
+                best_key, best_score = None, self.similarity_threshold
+                for candidate_key in list(self._scopes.get(scope, ())):
+                    candidate = self._entries[candidate_key]
+                    if candidate.expires_at <= now:
+                        self._remove(candidate_key)
+                        continue
+                    if candidate.embedding is None:
+                        continue
+                    score = _cosine(embedding, candidate.embedding)
+                    if score >= best_score:
+                        best_key, best_score = candidate_key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.stats.semantic_hits += 1
+                    return self._entries[best_key].response
+
+            self.stats.misses += 1
+            return None
+
+    def put(
+        self,
+        scope: Scope,
+        normalized: str,
+        response: str,
+        embedding: Optional[List[float]] = None,
+        ttl_seconds: Optional[int] = None,
+    ) -> None:
+        key = (scope, normalized)
+        size = len(normalized) + len(response) + (len(embedding) * 8 if embedding else 0) + 64
+        if size > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + (ttl_seconds or self.ttl_seconds)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(response=response, expires_at=expires_at, size=size, embedding=embedding)
+            self._scopes.setdefault(scope, set()).add(key)
+            self.bytes_used += size
+            self.stats.stores += 1
+
+            while self.bytes_used > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+            self.bytes_used = 0
+
+    def snapshot(self) -> dict:
+        stats = self.stats
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes_used,
+            "hits": stats.hits,
+            "semantic_hits": stats.semantic_hits,
+            "misses": stats.misses,
+            "bypassed": stats.bypassed,
+            "stores": stats.stores,
+            "evictions": stats.evictions,
+        }
+
+
+@dataclass(frozen=True)
+class ResponseCacheSettings:
+    enabled: bool
+    semantic: bool
+    max_bytes: int
+    ttl_seconds: int
+    similarity_threshold: float
+
+    @classmethod
+    def from_env(cls) -> "ResponseCacheSettings":
+        return cls(
+            enabled=os.getenv("HOMEGROWN_RESPONSE_CACHE", "0") == "1",
+            semantic=os.getenv("HOMEGROWN_RESPONSE_CACHE_SEMANTIC", "0") == "1",
+            max_bytes=int(os.getenv("HOMEGROWN_RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+            ttl_seconds=int(os.getenv("HOMEGROWN_RESPONSE_CACHE_TTL_SECONDS", "86400")),
+            similarity_threshold=float(os.getenv("HOMEGROWN_RESPONSE_CACHE_SIMILARITY", "0.92")),
+        )
+
+
+settings = ResponseCacheSettings.from_env()
+
+response_cache = ResponseCache(
+    max_bytes=settings.max_bytes,
+    ttl_seconds=settings.ttl_seconds,
+    similarity_threshold=settings.similarity_threshold,
+)
+
+
+@dataclass
+class CacheLookup:
+    """Result of checking the cache for one chat turn; pass it back to `store_response`."""
+
+    scope: Scope
+    normalized: str
+    policy: CachePolicy
+    cacheable: bool
+    response: Optional[str] = None
+    embedding: Optional[List[float]] = field(default=None, repr=False)
+
+
+async def lookup_response(scope: Scope, message: str, policy: CachePolicy) -> CacheLookup:
+    normalized = normalize_message(message)
+    if not settings.enabled or not policy.permits(normalized):
+        if settings.enabled:
+            response_cache.stats.bypassed += 1
+        return CacheLookup(scope=scope, normalized=normalized, policy=policy, cacheable=False)
+
+    embedding = None
+    if settings.semantic:
+        embedding = await get_provider().aembed(normalized)
+
+    response = response_cache.get(scope, normalized, embedding)
+    return CacheLookup(
+        scope=scope,
+        normalized=normalized,
+        policy=policy,
+        cacheable=True,
+        response=response,
+        embedding=embedding,
+    )
+
+
+def store_response(lookup: CacheLookup, response: str) -> None:
+    """Remember a freshly generated reply.
+
+    Callers skip replies that advanced the module: those are about the student's own
+    work, not the concept.
+    """
+    if not lookup.cacheable or lookup.response is not None or not response.strip():
+        return
+    response_cache.put(
+        lookup.scope,
+        lookup.normalized,
+        response,
+        embedding=lookup.embedding,
+        ttl_seconds=lookup.policy.ttl_seconds,
+    )
+
+
+def split_cached_response(response: str) -> List[str]:
+    """Chunk a cached reply so the streaming endpoint can replay it like a live one."""
+    return re.findall(r"\S+\s*|\s+", response)
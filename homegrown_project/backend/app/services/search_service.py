@@ -0,0 +1,128 @@
+"""Full-text search over chat transcripts, hot and archived.
+
+The index (migration 6) is a contentless FTS5 table on SQLite and a `chat_search`
+tsvector table on Postgres, both filled by an insert trigger on `chat_logs`. Neither
+stores the text itself: hits are resolved against the hot table first and then against
+archived segments. Other databases fall back to a LIKE scan of the hot table.
+"""
+
+import re
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .. import models
+from .archive_service import load_archived_by_id
+
+
+SNIPPET_CHARS = 160
+SENDERS = ("student", "agent", "system")
+
+
+def query_terms(q: str) -> List[str]:
+    return re.findall(r"\w+", (q or "").lower())[:16]
+
+
+def _fts5_expression(terms: List[str], enrollment_id: Optional[int], sender: Optional[str]) -> str:
+    # Terms are quoted so user input can never be read as FTS5 syntax; the last one is a prefix.
+    words = " ".join(f'"{t}"' for t in terms[:-1]) + f' "{terms[-1]}"*'
+    expression = f"content : ({words.strip()})"
+    scope = [f"e{enrollment_id}"] if enrollment_id is not None else []
+    if sender is not None:
+        scope.append(sender)
+    if scope:
+        expression = f"scope : ({' AND '.join(scope)}) AND {expression}"
+    return expression
+
+
+def _matching_ids(db: Session, q: str, terms, enrollment_id, sender, limit: int, offset: int) -> List[int]:
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        rows = db.execute(
+            text(
+                "SELECT rowid FROM chat_logs_fts WHERE chat_logs_fts MATCH :expr "
+                "ORDER BY rank LIMIT :limit OFFSET :offset"
+            ),
+            {"expr": _fts5_expression(terms, enrollment_id, sender), "limit": limit, "offset": offset},
+        )
+        return [row[0] for row in rows]
+
+    if dialect == "postgresql":
+        filters = "".join(
+            [
+                " AND enrollment_id = :enrollment_id" if enrollment_id is not None else "",
+                " AND sender = :sender" if sender is not None else "",
+            ]
+        )
+        rows = db.execute(
+            text(
+                "SELECT log_id FROM chat_search, websearch_to_tsquery('english', :q) query "
+                f"WHERE document @@ query{filters} "
+                "ORDER BY ts_rank(document, query) DESC, log_id DESC LIMIT :limit OFFSET :offset"
+            ),
+            {"q": q, "enrollment_id": enrollment_id, "sender": sender, "limit": limit, "offset": offset},
+        )
+        return [row[0] for row in rows]
+
+    ChatLog = models.ChatLog
+    query = db.query(ChatLog.id)
+    for term in terms:
+        query = query.filter(ChatLog.content.ilike(f"%{term}%"))
+    if enrollment_id is not None:
+        query = query.filter(ChatLog.enrollment_id == enrollment_id)
+    if sender is not None:
+        query = query.filter(ChatLog.sender == sender)
+    return [row[0] for row in query.order_by(ChatLog.id.desc()).offset(offset).limit(limit)]
+
+
+def snippet(content: str, terms: List[str], width: int = SNIPPET_CHARS) -> str:
+    content = " ".join((content or "").split())
+    lowered = content.lower()
+    hits = [pos for pos in (lowered.find(t) for t in terms) if pos >= 0]
+    start = max(0, min(hits) - width // 3) if hits else 0
+    piece = content[start:start + width]
+    return ("…" if start > 0 else "") + piece + ("…" if start + width < len(content) else "")
+
+
+def search_chat_logs(
+    db: Session,
+    q: str,
+    enrollment_id: Optional[int] = None,
+    sender: Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> dict:
+    """Best matches first; archived messages are included and flagged."""
+    terms = query_terms(q)
+    if not terms:
+        raise HTTPException(status_code=400, detail="Search query has no words")
+    if sender is not None and sender not in SENDERS:
+        raise HTTPException(status_code=400, detail=f"sender must be one of {', '.join(SENDERS)}")
+
+    # One extra id tells us whether another page exists.
+    ids = _matching_ids(db, q, terms, enrollment_id, sender, limit + 1, offset)
+    has_more = len(ids) > limit
+    ids = ids[:limit]
+
+    ChatLog = models.ChatLog
+    hot = {log.id: log for log in db.query(ChatLog).filter(ChatLog.id.in_(ids))} if ids else {}
+    cold = load_archived_by_id(db, [i for i in ids if i not in hot], enrollment_id)
+
+    items = []
+    for log_id in ids:
+        log = hot.get(log_id) or cold.get(log_id)
+        if log is None:
+            continue
+        items.append(
+            {
+                "id": log.id,
+                "enrollment_id": log.enrollment_id,
+                "sender": log.sender,
+                "timestamp": log.timestamp.isoformat() if log.timestamp else "",
+                "snippet": snippet(log.content, terms),
+                "archived": log_id not in hot,
+            }
+        )
+    return {"query": q, "items": items, "has_more": has_more, "next_offset": offset + limit if has_more else None}
@@ -0,0 +1,170 @@
+"""Per-enrollment single-flight for chat turns.
+
+Within a worker, turns for one enrollment run one at a time, so their ChatLog rows never
+interleave and two turns never evaluate the same module at once. A submit that repeats the
+message already in flight for that enrollment (double-click, client retry) starts no second
+LLM call: it waits for the first turn and gets the same reply. Replies to requests that
+carried an `idempotency_key` are remembered for `HOMEGROWN_IDEMPOTENCY_TTL_SECONDS`, so a
+retry after a dropped connection replays the answer instead of asking again.
+
+All of this is per worker. Across workers, the `Enrollment.version` check in chat_service
+keeps module advancement exactly-once.
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+
+@dataclass(frozen=True)
+class TurnSettings:
+    idempotency_ttl_seconds: float
+    max_idempotency_keys: int
+
+    @classmethod
+    def from_env(cls) -> "TurnSettings":
+        return cls(
+            idempotency_ttl_seconds=float(os.getenv("HOMEGROWN_IDEMPOTENCY_TTL_SECONDS", "600")),
+            max_idempotency_keys=int(os.getenv("HOMEGROWN_IDEMPOTENCY_MAX_KEYS", "10000")),
+        )
+
+
+settings = TurnSettings.from_env()
+
+
+def message_fingerprint(message: str) -> str:
+    return hashlib.blake2b(message.strip().encode("utf-8"), digest_size=12).hexdigest()
+
+
+class Flight:
+    """A request's view of a turn: the leader runs it, followers wait for its result."""
+
+    def __init__(self, future: asyncio.Future, leader: bool):
+        self.future = future
+        self.leader = leader
+
+    def resolve(self, result: Any) -> None:
+        if not self.future.done():
+            self.future.set_result(result)
+
+    async def result(self) -> Any:
+        # Shielded so a follower that goes away does not cancel the shared result.
+        return await asyncio.shield(self.future)
+
+
+def _mark_retrieved(future: asyncio.Future) -> None:
+    # A failed turn nobody joined would otherwise log "Future exception was never retrieved".
+    if not future.cancelled():
+        future.exception()
+
+
+class TurnCoordinator:
+    def __init__(self, config: TurnSettings):
+        self.config = config
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._lock_users: Dict[int, int] = {}
+        self._in_flight: Dict[Tuple[int, str], asyncio.Future] = {}
+        self._replays: "OrderedDict[Tuple[int, str], Tuple[float, str, Any]]" = OrderedDict()
+
+        self.turns = 0
+        self.joined = 0
+        self.replayed = 0
+
+    def _acquire(self, enrollment_id: int) -> asyncio.Lock:
+        lock = self._locks.get(enrollment_id)
+        if lock is None:
+            lock = self._locks[enrollment_id] = asyncio.Lock()
+        self._lock_users[enrollment_id] = self._lock_users.get(enrollment_id, 0) + 1
+        return lock
+
+    def _release(self, enrollment_id: int) -> None:
+        users = self._lock_users[enrollment_id] - 1
+        if users:
+            self._lock_users[enrollment_id] = users
+        else:
+            del self._lock_users[enrollment_id]
+            del self._locks[enrollment_id]
+
+    def _replay(self, enrollment_id: int, idempotency_key: str, fingerprint: str) -> Optional[asyncio.Future]:
+        key = (enrollment_id, idempotency_key)
+        entry = self._replays.get(key)
+        if entry is None:
+            return None
+        expires_at, stored_fingerprint, result = entry
+        if expires_at <= time.monotonic():
+            del self._replays[key]
+            return None
+        if stored_fingerprint != fingerprint:
+            raise HTTPException(status_code=409, detail="idempotency_key was already used for a different message")
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(result)
+        return future
+
+    def _remember(self, enrollment_id: int, idempotency_key: str, fingerprint: str, result: Any) -> None:
+        key = (enrollment_id, idempotency_key)
+        self._replays.pop(key, None)
+        self._replays[key] = (time.monotonic() + self.config.idempotency_ttl_seconds, fingerprint, result)
+        while len(self._replays) > self.config.max_idempotency_keys:
+            self._replays.popitem(last=False)
+
+    @asynccontextmanager
+    async def turn(
+        self, enrollment_id: int, message: str, idempotency_key: Optional[str] = None
+    ) -> AsyncIterator[Flight]:
+        """Enter a chat turn. The leader must call `flight.resolve(result)` before leaving."""
+        fingerprint = message_fingerprint(message)
+        if idempotency_key:
+            replay = self._replay(enrollment_id, idempotency_key, fingerprint)
+            if replay is not None:
+                self.replayed += 1
+                yield Flight(replay, leader=False)
+                return
+
+        flight_key = (enrollment_id, fingerprint)
+        future = self._in_flight.get(flight_key)
+        if future is not None:
+            self.joined += 1
+            yield Flight(future, leader=False)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_mark_retrieved)
+        self._in_flight[flight_key] = future
+        lock = self._acquire(enrollment_id)
+        try:
+            async with lock:
+                self.turns += 1
+                yield Flight(future, leader=True)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            raise
+        finally:
+            self._in_flight.pop(flight_key, None)
+            self._release(enrollment_id)
+            if not future.done():
+                # Cancelled or disconnected before answering; followers have to resubmit.
+                future.set_exception(
+                    HTTPException(status_code=409, detail="The original request was interrupted, please retry")
+                )
+            if future.exception() is None and idempotency_key:
+                self._remember(enrollment_id, idempotency_key, fingerprint, future.result())
+
+    def snapshot(self) -> dict:
+        return {
+            "turns": self.turns,
+            "joined": self.joined,
+            "replayed": self.replayed,
+            "in_flight": len(self._in_flight),
+            "idempotency_keys": len(self._replays),
+        }
+
+
+turn_coordinator = TurnCoordinator(settings)
@@ -0,0 +1,579 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session
+
+from .. import models
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process session lock applies.
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+# Non-file form fields (enrollment_id) are tiny; anything bigger is not our client.
+MAX_FIELD_BYTES = 1024
+
+
+@dataclass(frozen=True)
+class UploadSettings:
+    uploads_dir: str
+    chunk_size: int
+    max_file_bytes: int
+    enrollment_quota_bytes: int
+    partial_ttl_seconds: int
+    sweep_interval_seconds: int
+
+    @classmethod
+    def from_env(cls) -> "UploadSettings":
+        uploads_dir = os.getenv("HOMEGROWN_UPLOADS_DIR")
+        if not uploads_dir:
+            uploads_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uploads")
+            uploads_dir = os.path.abspath(uploads_dir)
+
+        return cls(
+            uploads_dir=uploads_dir,
+            chunk_size=int(os.getenv("HOMEGROWN_UPLOAD_CHUNK_BYTES", str(1024 * 1024))),
+            max_file_bytes=int(os.getenv("HOMEGROWN_UPLOAD_MAX_FILE_BYTES", str(50 * 1024 * 1024))),
+            enrollment_quota_bytes=int(os.getenv("HOMEGROWN_UPLOAD_ENROLLMENT_QUOTA_BYTES", str(500 * 1024 * 1024))),
+            partial_ttl_seconds=int(os.getenv("HOMEGROWN_UPLOAD_PARTIAL_TTL_SECONDS", str(24 * 3600))),
+            sweep_interval_seconds=int(os.getenv("HOMEGROWN_UPLOAD_SWEEP_SECONDS", "3600")),
+        )
+
+    @property
+    def blobs_dir(self) -> str:
+        return os.path.join(self.uploads_dir, "blobs")
+
+    @property
+    def partial_dir(self) -> str:
+        return os.path.join(self.uploads_dir, "partial")
+
+
+settings = UploadSettings.from_env()
+
+
+def blob_name(sha256: str) -> str:
+    """Where a blob lives, relative to the uploads directory; stored as `Upload.stored_name`."""
+    return f"blobs/{sha256[:2]}/{sha256}"
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(settings.blobs_dir, sha256[:2], sha256)
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    return os.path.basename(filename or "upload") or "upload"
+
+
+# --- Quotas ---
+
+def enrollment_usage(db: Session, enrollment_id: int) -> int:
+    used = (
+        db.query(func.coalesce(func.sum(models.Upload.size_bytes), 0))
+        .filter(models.Upload.enrollment_id == enrollment_id)
+        .scalar()
+    )
+    return int(used or 0)
+
+
+def upload_allowance(db: Session, enrollment_id: int) -> int:
+    """Largest file this enrollment may upload right now (per-file cap and remaining quota)."""
+    remaining = settings.enrollment_quota_bytes - enrollment_usage(db, enrollment_id)
+    if remaining <= 0:
+        raise HTTPException(status_code=413, detail="Upload quota for this enrollment is used up")
+    return min(settings.max_file_bytes, remaining)
+
+
+def _too_large(limit: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Upload exceeds the {limit} byte limit")
+
+
+# --- Blob storage ---
+
+def _append(path: str, chunk: bytes) -> None:
+    with open(path, "ab") as f:
+        f.write(chunk)
+
+
+async def write_stream(
+    chunks: AsyncIterator[bytes],
+    path: str,
+    limit: int,
+    hasher=None,
+    offset: int = 0,
+    discard_on_error: bool = True,
+) -> Tuple[int, "hashlib._Hash"]:
+    """Append chunks to `path`, hashing as we go and enforcing `limit` on the final size.
+
+    Disk writes run in the threadpool so a slow disk never stalls the event loop.
+    Returns the new file size and the hasher. A rejected one-shot upload removes `path`;
+    resumable sessions pass `discard_on_error=False` so their part file outlives a bad chunk.
+    """
+    hasher = hasher or hashlib.sha256()
+    size = offset
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            size += len(chunk)
+            if size > limit:
+                raise _too_large(limit)
+            hasher.update(chunk)
+            await asyncio.to_thread(_append, path, chunk)
+    except BaseException:
+        # Also on a client disconnect or cancellation, so one-shot temp files don't pile up.
+        if discard_on_error and os.path.exists(path):
+            os.remove(path)
+        raise
+    return size, hasher
+
+
+def _truncate(path: str, size: int) -> None:
+    with open(path, "r+b") as f:
+        f.truncate(size)
+
+
+def commit_blob(tmp_path: str, sha256: str) -> bool:
+    """Move a finished upload into content-addressed storage.
+
+    Returns True when an identical blob already existed and the new copy was discarded.
+    """
+    target = blob_path(sha256)
+    if os.path.exists(target):
+        os.remove(tmp_path)
+        return True
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(tmp_path, target)
+    return False
+
+
+def _hash_file(path: str, chunk_size: int) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def new_tmp_path() -> str:
+    os.makedirs(settings.partial_dir, exist_ok=True)
+    return os.path.join(settings.partial_dir, f"{uuid.uuid4().hex}.tmp")
+
+
+def _lock_enrollment_quota(db: Session, enrollment_id: int) -> None:
+    """Serialize quota checks for one enrollment until the caller commits.
+
+    A no-op UPDATE takes the row lock on Postgres and the database write lock on SQLite,
+    so two concurrent uploads cannot both fit into the same remaining quota.
+    """
+    enrollments = models.Enrollment.__table__
+    db.execute(update(enrollments).where(enrollments.c.id == enrollment_id).values(id=enrollments.c.id))
+
+
+def record_upload(
+    db: Session,
+    enrollment_id: int,
+    filename: str,
+    content_type: Optional[str],
+    size_bytes: int,
+    sha256: str,
+    tmp_path: str,
+) -> Tuple[models.Upload, bool]:
+    """Check the quota, move `tmp_path` into blob storage, add the Upload row and commit.
+
+    The quota lock is held from the check to the commit, which is why the blob move
+    (a rename) runs inline. On a quota rejection `tmp_path` is removed.
+    Returns the upload and whether an identical blob already existed.
+    """
+    _lock_enrollment_quota(db, enrollment_id)
+    if enrollment_usage(db, enrollment_id) + size_bytes > settings.enrollment_quota_bytes:
+        db.rollback()
+        os.remove(tmp_path)
+        raise HTTPException(status_code=413, detail="Upload quota for this enrollment is used up")
+
+    try:
+        deduplicated = commit_blob(tmp_path, sha256)
+        upload = models.Upload(
+            enrollment_id=enrollment_id,
+            filename=filename,
+            stored_name=blob_name(sha256),
+            content_type=content_type,
+            size_bytes=size_bytes,
+            sha256=sha256,
+            # Picked up by the offline grader (backend/grade_uploads.py).
+            grade_status="pending",
+        )
+        db.add(upload)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return upload, deduplicated
+
+
+# --- Streaming multipart ---
+#
+# POST /uploads is parsed as it arrives instead of through `request.form()`, which would
+# spool the whole body to a temp file first and then have it copied into blob storage.
+
+
+@dataclass
+class ReceivedUpload:
+    fields: Dict[str, str]
+    filename: str
+    content_type: Optional[str]
+    tmp_path: str
+    size: int
+    sha256: str
+
+
+async def _multipart_events(content_type: str, stream: AsyncIterator[bytes]):
+    """Yield `("part", headers)`, `("data", bytes)` and `("end", None)` as the body arrives."""
+    _, params = parse_options_header(content_type)
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body with a boundary")
+
+    events = []
+    headers: Dict[bytes, bytes] = {}
+    field, value = bytearray(), bytearray()
+
+    def on_header_end():
+        headers[bytes(field).lower()] = bytes(value)
+        field.clear()
+        value.clear()
+
+    def on_headers_finished():
+        events.append(("part", dict(headers)))
+        headers.clear()
+
+    parser = MultipartParser(
+        boundary,
+        {
+            "on_header_field": lambda data, start, end: field.extend(data[start:end]),
+            "on_header_value": lambda data, start, end: value.extend(data[start:end]),
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": lambda data, start, end: events.append(("data", bytes(data[start:end]))),
+            "on_part_end": lambda: events.append(("end", None)),
+        },
+    )
+    try:
+        async for chunk in stream:
+            parser.write(chunk)
+            pending, events[:] = list(events), []
+            for event in pending:
+                yield event
+        parser.finalize()
+    except MultipartParseError:
+        raise HTTPException(status_code=400, detail="Malformed multipart body")
+    for event in events:
+        yield event
+
+
+async def _part_data(events) -> AsyncIterator[bytes]:
+    async for kind, data in events:
+        if kind == "end":
+            return
+        yield data
+
+
+async def receive_multipart(
+    content_type: str, stream: AsyncIterator[bytes], file_limit: Callable[[Dict[str, str]], int]
+) -> ReceivedUpload:
+    """Stream the single `file` part of a multipart body into a temp file.
+
+    `file_limit` gets the form fields sent before the file and returns its byte limit,
+    so clients must send `enrollment_id` first (browsers keep FormData order).
+    """
+    fields: Dict[str, str] = {}
+    received: Optional[ReceivedUpload] = None
+    events = _multipart_events(content_type, stream)
+    try:
+        async for kind, headers in events:
+            if kind != "part":
+                continue
+            _, options = parse_options_header(headers.get(b"content-disposition", b""))
+            name = options.get(b"name", b"").decode("utf-8", "replace")
+
+            if b"filename" not in options:
+                value = bytearray()
+                async for data in _part_data(events):
+                    value.extend(data)
+                    if len(value) > MAX_FIELD_BYTES:
+                        raise HTTPException(status_code=422, detail=f"Form field '{name}' is too large")
+                fields[name] = value.decode("utf-8", "replace")
+                continue
+
+            if name != "file" or received is not None:
+                raise HTTPException(status_code=422, detail="Expected exactly one file field named 'file'")
+            limit = file_limit(fields)
+            tmp_path = new_tmp_path()
+            size, hasher = await write_stream(_part_data(events), tmp_path, limit)
+            if size == 0:
+                open(tmp_path, "wb").close()
+            received = ReceivedUpload(
+                fields=fields,
+                filename=safe_filename(options[b"filename"].decode("utf-8", "replace")),
+                content_type=headers[b"content-type"].decode("latin-1") if b"content-type" in headers else None,
+                tmp_path=tmp_path,
+                size=size,
+                sha256=hasher.hexdigest(),
+            )
+    except BaseException:
+        if received is not None and os.path.exists(received.tmp_path):
+            os.remove(received.tmp_path)
+        raise
+    finally:
+        await events.aclose()
+
+    if received is None:
+        raise HTTPException(status_code=422, detail="file must be a multipart file field")
+    return received
+
+
+# --- Resumable sessions ---
+#
+# A session is a `<id>.part` file plus a `<id>.json` sidecar in the partial directory,
+# so it survives worker restarts. Hash state is kept in memory while chunks arrive in
+# order; after a restart the part file is re-hashed on completion instead.
+
+_session_hashers: Dict[str, Tuple[int, "hashlib._Hash"]] = {}
+# One appender per session at a time, so two PUTs at the same offset cannot interleave:
+# an asyncio lock queues them within a worker, a flock on the part file across workers.
+# Locks are dropped once nobody holds or waits for them.
+_session_locks: Dict[str, asyncio.Lock] = {}
+_session_lock_users: Dict[str, int] = {}
+
+
+@asynccontextmanager
+async def _session_lock(upload_id: str):
+    lock = _session_locks.get(upload_id)
+    if lock is None:
+        lock = _session_locks[upload_id] = asyncio.Lock()
+    _session_lock_users[upload_id] = _session_lock_users.get(upload_id, 0) + 1
+    try:
+        async with lock:
+            yield
+    finally:
+        users = _session_lock_users[upload_id] - 1
+        if users:
+            _session_lock_users[upload_id] = users
+        else:
+            del _session_lock_users[upload_id]
+            del _session_locks[upload_id]
+
+
+def _session_paths(upload_id: str) -> Tuple[str, str]:
+    if not upload_id.isalnum():
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return (
+        os.path.join(settings.partial_dir, f"{upload_id}.part"),
+        os.path.join(settings.partial_dir, f"{upload_id}.json"),
+    )
+
+
+def create_session(enrollment_id: int, filename: str, content_type: Optional[str], total_bytes: int) -> dict:
+    os.makedirs(settings.partial_dir, exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    part_path, meta_path = _session_paths(upload_id)
+
+    meta = {
+        "upload_id": upload_id,
+        "enrollment_id": enrollment_id,
+        "filename": filename,
+        "content_type": content_type,
+        "total_bytes": total_bytes,
+    }
+    open(part_path, "wb").close()
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+    return meta
+
+
+def load_session(upload_id: str) -> dict:
+    part_path, meta_path = _session_paths(upload_id)
+    if not os.path.exists(meta_path) or not os.path.exists(part_path):
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    with open(meta_path) as f:
+        meta = json.load(f)
+    meta["offset"] = os.path.getsize(part_path)
+    return meta
+
+
+def _lock_part_file(part_path: str) -> Optional[int]:
+    """An fd holding an exclusive flock on the part file, or None if another worker holds it."""
+    try:
+        fd = os.open(part_path, os.O_RDONLY)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return None
+    return fd
+
+
+async def append_session_chunk(upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> dict:
+    part_path, _ = _session_paths(upload_id)
+    async with _session_lock(upload_id):
+        fd = _lock_part_file(part_path)
+        if fd is None:
+            raise HTTPException(
+                status_code=409,
+                detail={"message": "Another chunk for this upload is still being written", "offset": offset},
+            )
+        try:
+            return await _append_locked(upload_id, part_path, offset, chunks)
+        finally:
+            os.close(fd)
+
+
+async def _append_locked(upload_id: str, part_path: str, offset: int, chunks: AsyncIterator[bytes]) -> dict:
+    meta = load_session(upload_id)
+    if offset != meta["offset"]:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Offset does not match the bytes received so far", "offset": meta["offset"]},
+        )
+
+    hashed_to, hasher = _session_hashers.get(upload_id, (None, None))
+    if hashed_to != offset:
+        hasher = None
+
+    try:
+        size, hasher = await write_stream(
+            chunks, part_path, meta["total_bytes"], hasher=hasher, offset=offset, discard_on_error=False
+        )
+    except HTTPException:
+        # Bytes up to the rejected chunk may already be on disk; drop them so the
+        # client can resume from the offset it last saw acknowledged.
+        await asyncio.to_thread(_truncate, part_path, offset)
+        _session_hashers.pop(upload_id, None)
+        raise
+    if hashed_to == offset or offset == 0:
+        _session_hashers[upload_id] = (size, hasher)
+    meta["offset"] = size
+    return meta
+
+
+async def complete_session(db: Session, upload_id: str) -> Tuple[dict, models.Upload, bool]:
+    """Validate a fully received session and record it like a one-shot upload."""
+    part_path, _ = _session_paths(upload_id)
+    async with _session_lock(upload_id):
+        fd = _lock_part_file(part_path)
+        if fd is None:
+            raise HTTPException(status_code=409, detail="A chunk for this upload is still being written")
+        try:
+            return await _complete_locked(db, upload_id, part_path)
+        finally:
+            os.close(fd)
+
+
+async def _complete_locked(db: Session, upload_id: str, part_path: str) -> Tuple[dict, models.Upload, bool]:
+    meta = load_session(upload_id)
+    if meta["offset"] != meta["total_bytes"]:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "Upload is incomplete", "offset": meta["offset"], "total_bytes": meta["total_bytes"]},
+        )
+
+    hashed_to, hasher = _session_hashers.pop(upload_id, (None, None))
+    if hashed_to == meta["offset"] and hasher is not None:
+        digest = hasher.hexdigest()
+    else:
+        digest = await asyncio.to_thread(_hash_file, part_path, settings.chunk_size)
+
+    try:
+        upload, deduplicated = record_upload(
+            db, meta["enrollment_id"], meta["filename"], meta["content_type"], meta["total_bytes"], digest, part_path
+        )
+    except HTTPException:
+        # Over quota: the part file is gone, so the session is too.
+        discard_session(upload_id)
+        raise
+    discard_session(upload_id)
+    return meta, upload, deduplicated
+
+
+def discard_session(upload_id: str) -> None:
+    _session_hashers.pop(upload_id, None)
+    for path in _session_paths(upload_id):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# --- Cleanup ---
+
+def _try_lock(path: str) -> Optional[int]:
+    try:
+        return _lock_part_file(path)
+    except HTTPException:
+        return None
+
+
+def sweep_partial(config: UploadSettings = settings, now: Optional[float] = None) -> dict:
+    """Delete one-shot temp files and resumable sessions untouched for `partial_ttl_seconds`.
+
+    Sessions something is still appending to (here or, via the flock, in another worker)
+    are left alone.
+    """
+    cutoff = (now or time.time()) - config.partial_ttl_seconds
+    removed = {"tmp_files": 0, "sessions": 0}
+    try:
+        names = os.listdir(config.partial_dir)
+    except FileNotFoundError:
+        return removed
+
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        path = os.path.join(config.partial_dir, name)
+        try:
+            if ext == ".tmp" and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed["tmp_files"] += 1
+            elif ext == ".json" and stem.isalnum() and stem not in _session_lock_users:
+                part_path = os.path.join(config.partial_dir, f"{stem}.part")
+                touched = max(os.path.getmtime(p) for p in (path, part_path) if os.path.exists(p))
+                if touched >= cutoff:
+                    continue
+                fd = _try_lock(part_path) if os.path.exists(part_path) else None
+                if os.path.exists(part_path) and fd is None:
+                    continue
+                try:
+                    discard_session(stem)
+                finally:
+                    if fd is not None:
+                        os.close(fd)
+                removed["sessions"] += 1
+        except FileNotFoundError:
+            continue  # finished or swept by another worker meanwhile
+    return removed
+
+
+async def sweep_partial_forever(config: UploadSettings = settings) -> None:
+    while True:
+        try:
+            removed = await asyncio.to_thread(sweep_partial, config)
+            if removed["tmp_files"] or removed["sessions"]:
+                logger.info("Swept abandoned uploads: %s", removed)
+        except Exception:
+            logger.exception("Sweeping abandoned uploads failed")
+        await asyncio.sleep(config.sweep_interval_seconds)
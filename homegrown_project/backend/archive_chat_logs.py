@@ -0,0 +1,56 @@
+"""Move old chat logs into compressed cold-storage segments.
+
+Rows older than --older-than-days leave `chat_logs` for `chat_log_segments`, except the
+newest --keep-recent rows of each enrollment, which always stay hot. History paging and
+chat search read through to the segments, so nothing disappears from the API.
+
+    python backend/archive_chat_logs.py --dry-run
+    python backend/archive_chat_logs.py --older-than-days 180
+
+Safe to run repeatedly (e.g. nightly); each segment is written and its rows deleted in
+one transaction.
+"""
+
+import argparse
+import os
+import sys
+from dataclasses import replace
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from backend import seed_db
+from backend.app import database
+from backend.app.services import archive_service
+
+
+def main(argv=None):
+    defaults = archive_service.settings
+    parser = argparse.ArgumentParser(description="Archive old chat logs into compressed segments.")
+    parser.add_argument("--older-than-days", type=int, default=defaults.archive_after_days)
+    parser.add_argument("--keep-recent", type=int, default=defaults.keep_recent, help="rows per enrollment that stay hot")
+    parser.add_argument("--segment-rows", type=int, default=defaults.segment_rows)
+    parser.add_argument("--dry-run", action="store_true", help="only report which enrollments would be archived")
+    args = parser.parse_args(argv)
+
+    seed_db.create_tables()
+
+    config = replace(
+        defaults,
+        archive_after_days=args.older_than_days,
+        keep_recent=args.keep_recent,
+        segment_rows=max(1, args.segment_rows),
+    )
+    report = archive_service.compact(database.engine, config, dry_run=args.dry_run)
+    if args.dry_run:
+        print(f"{report['enrollments']} enrollments have rows to archive (cutoff {report['cutoff']}).")
+    else:
+        print(
+            f"Archived {report['rows']} rows into {report['segments']} segments "
+            f"for {report['enrollments']} enrollments (cutoff {report['cutoff']})."
+        )
+
+
+if __name__ == "__main__":
+    main()
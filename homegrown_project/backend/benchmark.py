@@ -0,0 +1,341 @@
+"""Load test for the Homegrown API.
+
+By default this starts the app in-process on a throwaway SQLite database, seeds it, and
+points it at the fake LLM provider (simulated latency, streaming speed and 429s; see
+`FakeLLMSettings` in app/services/llm_service.py). Then it drives a weighted mix of
+/api/chat, /api/chat/history, /api/enrollments and /api/uploads from concurrent clients.
+
+    python backend/benchmark.py --students 200 --concurrency 50 --duration 30
+    HOMEGROWN_FAKE_LLM_LATENCY=lognormal:1500:0.6 HOMEGROWN_FAKE_LLM_429_RATE=0.05 \\
+        python backend/benchmark.py --stream --json run.json --baseline last.json
+
+With --base-url it targets an already running server instead (seed it first with
+`seed_db.py --students N`); DB lock figures are only available in-process.
+
+Note: main.py loads backend/.env with override=True, so keys set there (e.g.
+HOMEGROWN_DEV_FALLBACK=1) win over the defaults chosen here.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+import httpx
+
+
+QUESTIONS = [
+    "What is the difference between a tag and an element?",
+    "Can you explain this again with an example?",
+    "Why does my page look blank?",
+    "How should I start this exercise?",
+    "What does the objective mean?",
+    "Here is my attempt, what should I fix next?",
+]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def parse_mix(raw):
+    mix = {}
+    for part in raw.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"chat", "history", "enrollments", "uploads"}
+    if unknown:
+        raise SystemExit(f"Unknown operations in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+class LockMonitor:
+    """Counts SQLite lock errors and times write statements on the app's engine."""
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+
+        self.lock_errors = 0
+        self.write_seconds = []
+        self._lock = threading.Lock()
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("_bench_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info["_bench_started"].pop()
+            if statement.lstrip()[:6].upper() in ("INSERT", "UPDATE", "DELETE"):
+                with self._lock:
+                    self.write_seconds.append(time.perf_counter() - started)
+
+        @event.listens_for(engine, "handle_error")
+        def _error(context):
+            message = str(context.original_exception).lower()
+            if "locked" in message or "busy" in message:
+                with self._lock:
+                    self.lock_errors += 1
+
+    def report(self):
+        writes = sorted(self.write_seconds)
+        return {
+            "lock_errors": self.lock_errors,
+            "write_statements": len(writes),
+            "write_p95_ms": round(percentile(writes, 95) * 1000, 2),
+            "write_max_ms": round((writes[-1] if writes else 0.0) * 1000, 2),
+        }
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_in_process(args):
+    """Seed a scratch database, start uvicorn on a background thread."""
+    scratch = tempfile.mkdtemp(prefix="homegrown-bench-")
+    os.environ.setdefault("HOMEGROWN_DATABASE_URL", f"sqlite:///{os.path.join(scratch, 'bench.db')}")
+    os.environ.setdefault("HOMEGROWN_UPLOADS_DIR", os.path.join(scratch, "uploads"))
+    os.environ.setdefault("HOMEGROWN_LLM_PROVIDER", "fake")
+    os.environ.setdefault("HOMEGROWN_FAKE_LLM_SEED", str(args.seed))
+
+    import uvicorn
+
+    from backend import seed_db
+    from backend.app import database, models
+    from backend.app.main import app
+
+    seed_db.create_tables()
+    db = database.SessionLocal()
+    try:
+        courses = seed_db.seed_courses(db)
+        seed_db.seed_students(db, courses, args.students)
+        db.commit()
+        targets = [
+            {"enrollment_id": enrollment_id, "student_id": student_id}
+            for enrollment_id, student_id in db.query(models.Enrollment.id, models.Enrollment.student_id)
+        ]
+    finally:
+        db.close()
+
+    monitor = LockMonitor(database.engine)
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="bench-server", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise SystemExit("The API server failed to start; see the log above.")
+        time.sleep(0.05)
+
+    return f"http://127.0.0.1:{port}", targets, monitor, server
+
+
+async def discover_targets(client):
+    targets, after = [], None
+    while True:
+        params = {"limit": 200}
+        if after is not None:
+            params["after"] = after
+        data = (await client.get("/api/enrollments", params=params)).json()
+        targets.extend({"enrollment_id": item["enrollment_id"], "student_id": None} for item in data["items"])
+        if not data.get("has_more"):
+            return targets
+        after = data["next_cursor"]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.first_token = []
+        self.statuses = defaultdict(Counter)
+
+    def record(self, op, status, seconds):
+        self.statuses[op][status] += 1
+        if isinstance(status, int) and status < 400:
+            self.latencies[op].append(seconds)
+
+
+async def run_op(client, op, target, rng, args, recorder):
+    started = time.perf_counter()
+    status = "error"
+    try:
+        if op == "chat" and args.stream:
+            payload = {"enrollment_id": target["enrollment_id"], "message": rng.choice(QUESTIONS)}
+            async with client.stream("POST", "/api/chat/stream", json=payload) as response:
+                status = response.status_code
+                first = None
+                async for line in response.aiter_lines():
+                    if first is None and line.startswith("event: token"):
+                        first = time.perf_counter() - started
+                if first is not None:
+                    recorder.first_token.append(first)
+        elif op == "chat":
+            payload = {"enrollment_id": target["enrollment_id"], "message": rng.choice(QUESTIONS)}
+            status = (await client.post("/api/chat", json=payload)).status_code
+        elif op == "history":
+            params = {"enrollment_id": target["enrollment_id"], "limit": 50}
+            status = (await client.get("/api/chat/history", params=params)).status_code
+        elif op == "enrollments":
+            params = {"limit": 50}
+            if target["student_id"] is not None:
+                params["student_id"] = target["student_id"]
+            status = (await client.get("/api/enrollments", params=params)).status_code
+        elif op == "uploads":
+            body = rng.randbytes(args.upload_bytes)
+            files = {"file": ("bench.bin", body, "application/octet-stream")}
+            data = {"enrollment_id": str(target["enrollment_id"])}
+            status = (await client.post("/api/uploads", data=data, files=files)).status_code
+    except httpx.HTTPError:
+        status = "error"
+    recorder.record(op, status, time.perf_counter() - started)
+
+
+async def drive(base_url, targets, args):
+    mix = parse_mix(args.mix)
+    ops, weights = list(mix), list(mix.values())
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        if not targets:
+            targets = await discover_targets(client)
+        if not targets:
+            raise SystemExit("No enrollments to benchmark; seed the database first.")
+
+        deadline = time.perf_counter() + args.duration
+
+        async def worker(index):
+            rng = random.Random(args.seed + index)
+            while time.perf_counter() < deadline:
+                await run_op(client, rng.choices(ops, weights)[0], rng.choice(targets), rng, args, recorder)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return recorder, elapsed
+
+
+def summarize(recorder, elapsed):
+    report = {"elapsed_seconds": round(elapsed, 2), "operations": {}}
+    total = 0
+    for op in sorted(recorder.statuses):
+        latencies = sorted(recorder.latencies[op])
+        count = sum(recorder.statuses[op].values())
+        total += count
+        report["operations"][op] = {
+            "requests": count,
+            "rps": round(count / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            "statuses": {str(k): v for k, v in recorder.statuses[op].items()},
+        }
+    if recorder.first_token:
+        first = sorted(recorder.first_token)
+        report["chat_first_token"] = {
+            "p50_ms": round(percentile(first, 50) * 1000, 1),
+            "p95_ms": round(percentile(first, 95) * 1000, 1),
+            "p99_ms": round(percentile(first, 99) * 1000, 1),
+        }
+    report["total_requests"] = total
+    report["total_rps"] = round(total / elapsed, 2)
+    return report
+
+
+def print_report(report):
+    print(f"\n{'operation':<12}{'requests':>10}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  statuses")
+    for op, row in report["operations"].items():
+        statuses = " ".join(f"{k}:{v}" for k, v in sorted(row["statuses"].items()))
+        print(
+            f"{op:<12}{row['requests']:>10}{row['rps']:>9}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}  {statuses}"
+        )
+    print(f"\ntotal: {report['total_requests']} requests in {report['elapsed_seconds']}s ({report['total_rps']} rps)")
+    if "chat_first_token" in report:
+        ft = report["chat_first_token"]
+        print(f"chat first token: p50 {ft['p50_ms']} ms, p95 {ft['p95_ms']} ms, p99 {ft['p99_ms']} ms")
+    if "database" in report:
+        print(f"database: {report['database']}")
+    if "llm" in report:
+        print(f"llm scheduler: {report['llm']}")
+
+
+def compare_to_baseline(report, baseline_path, tolerance):
+    """Return the operations whose p95 regressed by more than `tolerance` (a fraction)."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for op, row in report["operations"].items():
+        before = baseline.get("operations", {}).get(op)
+        if before and before["p95_ms"] > 0 and row["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{op}: p95 {before['p95_ms']} -> {row['p95_ms']} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Homegrown API against a fake LLM provider.")
+    parser.add_argument("--base-url", help="benchmark a running server instead of starting one in-process")
+    parser.add_argument("--students", type=int, default=100, help="synthetic students to seed (in-process only)")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds to run")
+    parser.add_argument("--mix", default="chat=50,history=30,enrollments=15,uploads=5")
+    parser.add_argument("--stream", action="store_true", help="use /api/chat/stream and report time to first token")
+    parser.add_argument("--upload-bytes", type=int, default=64 * 1024)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="previous --json report; exit 1 if any p95 regresses")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 regression vs baseline (fraction)")
+    args = parser.parse_args(argv)
+
+    monitor = server = None
+    targets = []
+    if args.base_url:
+        base_url = args.base_url.rstrip("/")
+    else:
+        base_url, targets, monitor, server = start_in_process(args)
+
+    recorder, elapsed = asyncio.run(drive(base_url, targets, args))
+    report = summarize(recorder, elapsed)
+
+    if monitor is not None:
+        from backend.app.services.llm_service import scheduler
+
+        report["database"] = monitor.report()
+        report["llm"] = scheduler.snapshot()
+    if server is not None:
+        server.should_exit = True
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+
+    if args.baseline:
+        regressions = compare_to_baseline(report, args.baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions vs baseline:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
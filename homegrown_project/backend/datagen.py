@@ -0,0 +1,270 @@
+"""Generate large synthetic datasets without touching existing data.
+
+Unlike seed_db.py this never deletes anything. Counts are targets, so re-running with a
+bigger number only tops up what is missing. Every synthetic row is derived from --seed and
+the row's own index, so two runs with the same arguments produce the same data.
+
+    python backend/datagen.py --students 5000 --messages-per-enrollment 200
+    python backend/datagen.py --students 8000 --messages-per-enrollment 400   # top-up
+    python backend/datagen.py --personas --teacherbots ../TeacherBots --students 100
+
+Rows go in through Core multi-row inserts, `--batch-size` rows per transaction.
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from sqlalchemy import func, insert, select
+
+from backend import seed_db
+from backend.app import database, models
+from backend.app.instructors import persona_registry
+
+
+EMAIL_PATTERN = "student{n}@example.com"
+BASE_TIME = datetime(2025, 1, 1)
+
+STUDENT_LINES = [
+    "I'm stuck on this part, can you give me a hint?",
+    "What does {topic} actually mean?",
+    "Here's what I tried for {topic}. Is it right?",
+    "Can you explain {topic} with an example?",
+    "I think I'm done with {topic}!",
+    "Why do we need {topic} at all?",
+]
+AGENT_LINES = [
+    "Great question! Think about {topic} like building blocks. What would you try first?",
+    "Close! Re-read your work on {topic} and check the first line again.",
+    "Nice progress on {topic}. Can you explain it back to me in your own words?",
+    "Let's break {topic} into smaller steps. What's step one?",
+]
+INTERESTS = ["gaming", "music", "soccer", "art", "robots", "cooking", "animals", "space"]
+
+
+# --- Personas and prompt files ---
+
+MODULE_RE = re.compile(r"^\W*Module (\d+): (.+?)[\s*]*$", re.MULTILINE)
+GOAL_RE = re.compile(r"^\W*Goal:\W*(.+?)\s*$", re.MULTILINE)
+COURSE_NAME_RE = re.compile(r"\*\*Course Name:\*\*\s*(.+)")
+ROLE_RE = re.compile(r"### ROLE: ([^(\n]+)")
+
+
+def slugify(text):
+    return re.sub(r"[^a-z0-9]+", "_", text.lower()).strip("_")[:48]
+
+
+def parse_persona_prompt(text):
+    """Pull (agent_name, course_title, modules) out of a persona prompt; modules may be empty."""
+    role = ROLE_RE.search(text)
+    course = COURSE_NAME_RE.search(text)
+    modules = []
+    matches = list(MODULE_RE.finditer(text))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        goal = GOAL_RE.search(text, match.end(), end)
+        title = match.group(2).strip()
+        modules.append(
+            {
+                "id": f"mod_{match.group(1)}",
+                "title": title,
+                "objective": goal.group(1).strip() if goal else title,
+                "success_criteria": goal.group(1).strip() if goal else None,
+            }
+        )
+    return (
+        role.group(1).strip() if role else None,
+        course.group(1).strip().rstrip(".") if course else None,
+        modules,
+    )
+
+
+def _persona_sources(teacherbots_dir):
+    for persona in persona_registry.all():
+        yield (persona.agent_ids or (persona.id,))[0], persona.system_instructions
+
+    if teacherbots_dir:
+        for root, _, files in os.walk(teacherbots_dir):
+            for name in sorted(files):
+                if name.endswith((".txt", ".md")):
+                    with open(os.path.join(root, name), encoding="utf-8") as f:
+                        yield None, f.read()
+
+
+def ensure_persona_courses(db, teacherbots_dir=None):
+    """Create agents/courses for every persona prompt that defines modules; existing ids are left alone."""
+    created = 0
+    for agent_id, text in _persona_sources(teacherbots_dir):
+        agent_name, course_title, modules = parse_persona_prompt(text)
+        if not modules or not course_title:
+            continue
+
+        agent_id = agent_id or slugify(agent_name or course_title)
+        if db.get(models.Agent, agent_id) is None:
+            db.add(models.Agent(id=agent_id, name=agent_name or agent_id, system_prompt_core=f"You are {agent_name}."))
+            db.flush()
+
+        course_id = slugify(course_title)
+        if db.get(models.Course, course_id) is None:
+            db.add(models.Course(id=course_id, title=course_title, agent_id=agent_id, curriculum_json={"modules": modules}))
+            db.flush()
+            created += 1
+    db.commit()
+    return created
+
+
+# --- Bulk generation ---
+
+def _batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def top_up_students(seed, target, enrollments_per_student, courses, batch_size):
+    """Insert synthetic students (and their enrollments) until `target` exist; returns how many were added."""
+    users = models.User.__table__
+    enrollments = models.Enrollment.__table__
+
+    with database.engine.connect() as conn:
+        existing = conn.execute(
+            select(func.count()).select_from(users).where(users.c.email.like(EMAIL_PATTERN.format(n="%")))
+        ).scalar_one()
+
+    added = 0
+    for batch in _batched(range(existing, target), batch_size):
+        user_rows = [
+            {"email": EMAIL_PATTERN.format(n=n), "role": "student", "display_name": f"Student {n}"} for n in batch
+        ]
+        with database.engine.begin() as conn:
+            ids = conn.execute(
+                insert(users).returning(users.c.id, sort_by_parameter_order=True), user_rows
+            ).scalars().all()
+
+            enrollment_rows = []
+            for n, user_id in zip(batch, ids):
+                rng = random.Random(f"{seed}:student:{n}")
+                picked = rng.sample(courses, min(enrollments_per_student, len(courses)))
+                for course in picked:
+                    modules = (course.curriculum_json or {}).get("modules") or [None]
+                    enrollment_rows.append(
+                        {
+                            "student_id": user_id,
+                            "course_id": course.id,
+                            "current_module_index": rng.randrange(len(modules)),
+                            "student_facts": {"interests": rng.sample(INTERESTS, 2), "grade": rng.randint(5, 12)},
+                            "conversation_summary": "",
+                            "summary_through_log_id": 0,
+                        }
+                    )
+            if enrollment_rows:
+                conn.execute(insert(enrollments), enrollment_rows)
+        added += len(batch)
+        print(f"  students: {existing + added}/{target}")
+    return added
+
+
+def _topics(course):
+    modules = (course.curriculum_json or {}).get("modules") or []
+    return [m.get("title", "this module") for m in modules if isinstance(m, dict)] or [course.title or "this course"]
+
+
+def top_up_messages(seed, per_enrollment, courses, batch_size):
+    """Give every synthetic student's enrollments `per_enrollment` chat messages; returns rows added."""
+    users = models.User.__table__
+    enrollments = models.Enrollment.__table__
+    chat_logs = models.ChatLog.__table__
+    topics = {course.id: _topics(course) for course in courses}
+
+    with database.engine.connect() as conn:
+        counts = dict(
+            conn.execute(
+                select(chat_logs.c.enrollment_id, func.count()).group_by(chat_logs.c.enrollment_id)
+            ).all()
+        )
+        targets = conn.execute(
+            select(enrollments.c.id, enrollments.c.course_id)
+            .join(users, users.c.id == enrollments.c.student_id)
+            .where(users.c.email.like(EMAIL_PATTERN.format(n="%")))
+            .order_by(enrollments.c.id)
+        ).all()
+
+    def rows():
+        for enrollment_id, course_id in targets:
+            have = counts.get(enrollment_id, 0)
+            course_topics = topics.get(course_id) or ["this course"]
+            for i in range(have, per_enrollment):
+                rng = random.Random(f"{seed}:message:{enrollment_id}:{i}")
+                from_student = i % 2 == 0
+                template = rng.choice(STUDENT_LINES if from_student else AGENT_LINES)
+                yield {
+                    "enrollment_id": enrollment_id,
+                    "sender": "student" if from_student else "agent",
+                    "content": template.format(topic=rng.choice(course_topics)),
+                    # Deterministic, strictly increasing per enrollment: a turn every ~minute.
+                    "timestamp": BASE_TIME + timedelta(days=enrollment_id % 365, seconds=i * 60 + rng.randrange(30)),
+                }
+
+    added = 0
+    started = time.monotonic()
+    for batch in _batched(rows(), batch_size):
+        with database.engine.begin() as conn:
+            conn.execute(insert(chat_logs), batch)
+        added += len(batch)
+        rate = added / max(time.monotonic() - started, 1e-6)
+        print(f"  chat logs: +{added} ({rate:,.0f} rows/s)")
+    return added
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Top up the database with deterministic synthetic data.")
+    parser.add_argument("--students", type=int, default=0, help="target number of synthetic students")
+    parser.add_argument("--enrollments-per-student", type=int, default=2)
+    parser.add_argument("--messages-per-enrollment", type=int, default=0, help="target chat messages per synthetic enrollment")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--personas", action="store_true", help="create courses from the persona registry (app/personas)")
+    parser.add_argument("--teacherbots", help="also create courses from persona prompt files under this directory")
+    args = parser.parse_args(argv)
+
+    seed_db.create_tables()
+
+    db = database.SessionLocal()
+    try:
+        if args.personas or args.teacherbots:
+            created = ensure_persona_courses(db, args.teacherbots)
+            print(f"Persona courses created: {created}")
+        if db.query(models.Course).count() == 0:
+            seed_db.seed_courses(db)
+            db.commit()
+        courses = db.query(models.Course).order_by(models.Course.id).all()
+        db.expunge_all()
+    finally:
+        db.close()
+
+    if args.students:
+        print(f"Topping up students to {args.students}...")
+        added = top_up_students(args.seed, args.students, args.enrollments_per_student, courses, args.batch_size)
+        print(f"Added {added} students.")
+
+    if args.messages_per_enrollment:
+        print(f"Topping up chat logs to {args.messages_per_enrollment} per enrollment...")
+        added = top_up_messages(args.seed, args.messages_per_enrollment, courses, args.batch_size)
+        print(f"Added {added} chat log rows.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Grade uploaded deliverables offline, outside the API workers.
+
+New uploads are queued as `grade_status="pending"`. This worker claims them in batches,
+runs the cheap local checks in a process pool and sends only the files that need a
+rubric judgement to the LLM, several per request (see app/services/grading_service.py).
+
+    python backend/grade_uploads.py            # keep polling for new uploads
+    python backend/grade_uploads.py --once     # drain the queue, then exit
+
+Several workers may run side by side; each claimed upload is leased for
+HOMEGROWN_GRADING_LEASE_SECONDS, after which a crashed worker's batch is picked up again.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from dataclasses import replace
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from dotenv import load_dotenv
+
+# Before the app imports: the LLM provider and grading settings are read from the environment at import.
+load_dotenv(override=True)
+
+from backend.app import database
+from backend.app.migrations import pending_migrations
+from backend.app.services import grading_service
+
+
+async def run(config: grading_service.GradingSettings, once: bool) -> dict:
+    worker = grading_service.GradingWorker(config)
+    try:
+        if once:
+            while await worker.run_once():
+                pass
+        else:
+            await worker.run_forever()
+    finally:
+        worker.close()
+    return worker.snapshot()
+
+
+def main(argv=None):
+    defaults = grading_service.settings
+    parser = argparse.ArgumentParser(description="Grade uploaded deliverables in the background.")
+    parser.add_argument("--once", action="store_true", help="grade everything pending, then exit")
+    parser.add_argument("--batch-size", type=int, default=defaults.batch_size, help="uploads claimed per pass")
+    parser.add_argument("--llm-batch-size", type=int, default=defaults.llm_batch_size, help="submissions per LLM request")
+    parser.add_argument("--processes", type=int, default=defaults.processes, help="local check processes (0: inline)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if pending_migrations(database.engine):
+        sys.exit("Database schema is behind; run backend/migrate.py first.")
+
+    config = replace(
+        defaults,
+        batch_size=max(1, args.batch_size),
+        llm_batch_size=max(1, args.llm_batch_size),
+        processes=max(0, args.processes),
+    )
+    try:
+        report = asyncio.run(run(config, args.once))
+    except KeyboardInterrupt:
+        return
+    print(
+        f"Graded {report['graded']} uploads ({report['failed_locally']} failed the local checks, "
+        f"{report['sent_to_llm']} went to the LLM in {report['llm_requests']} requests); "
+        f"{report['skipped']} skipped, {report['needs_review']} need review, {report['released']} requeued."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Apply database schema changes. Run once per deploy, before starting the workers.
+
+    python backend/migrate.py            # create missing tables, apply pending migrations
+    python backend/migrate.py --status   # list pending migrations without changing anything
+
+Workers no longer touch the schema on boot; they refuse to start when this has not been
+run (HOMEGROWN_MIGRATE_ON_STARTUP=run restores the old behaviour for local dev).
+"""
+
+import argparse
+import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from dotenv import load_dotenv
+
+# Before the app imports: the database URL is read from the environment at import.
+load_dotenv(override=True)
+
+from backend.app import database
+from backend.app.migrations import migrate, pending_migrations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create missing tables and apply pending schema migrations.")
+    parser.add_argument("--status", action="store_true", help="only list pending migrations")
+    args = parser.parse_args(argv)
+
+    pending = pending_migrations(database.engine)
+    if args.status:
+        for version, description, _ in pending:
+            print(f"pending {version}: {description}")
+        print(f"{len(pending)} pending migrations.")
+        return
+
+    applied = migrate(database.engine)
+    print(f"Applied migrations: {', '.join(map(str, applied)) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import argparse
 import sys
 import os
 
@@ -6,103 +7,164 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.dirname(current_dir)
 sys.path.append(project_root)
 
-from backend.app.database import SessionLocal, engine, Base
+from backend.app.database import SessionLocal, engine
 from backend.app import models
-
-# 2. THE NUCLEAR OPTION: Auto-delete the old DB to prevent conflicts
-db_path = os.path.join(current_dir, "app", "homegrown.db")
-if os.path.exists(db_path):
-    print(f"Removing old database at {db_path}...")
-    os.remove(db_path)
-
-# 3. Create Tables
-print("Creating new database tables...")
-Base.metadata.create_all(bind=engine)
-
-db = SessionLocal()
-
-print("Seeding Agents & Courses...")
-
-# --- AGENT 1: DAISY (Finance) ---
-daisy = models.Agent(
-    id="daisy_dollars",
-    name="Daisy Dollars", 
-    system_prompt_core="You are Daisy Dollars. You are a strict but encouraging finance teacher."
-)
-
-daisy_course = models.Course(
-    id="finance_101", 
-    title="Personal Finance 101", 
-    agent_id="daisy_dollars",
-    curriculum_json={
-        "modules": [{
-            "id": "mod_1", 
-            "title": "Income", 
-            "objective": "Categorize transactions.",
-            "success_criteria": "Identify Rent as fixed."
-        }]
-    }
-)
-
-# --- AGENT 2: TERA BYTE (Coding) ---
-tera = models.Agent(
-    id="tera_byte",
-    name="Tera Byte",
-    system_prompt_core="You are Tera Byte, an energetic and precise coding tutor. You love clean code and explaining HTML tags like they are building blocks. You use emojis often 🧱🚀."
-)
-
-tera_course = models.Course(
-    id="html_hero",
-    title="HTML Hero: Building the Web",
-    agent_id="tera_byte",
-    curriculum_json={
-        "modules": [
-            {
-                "id": "html_1",
-                "title": "The Skeleton of the Web",
-                "objective": "Write a basic HTML structure with <html>, <head>, and <body> tags.",
-                "success_criteria": "Student writes valid boilerplate."
-            },
-            {
-                "id": "html_2",
-                "title": "Tags & Elements",
-                "objective": "Create a paragraph <p> and a heading <h1>.",
-                "success_criteria": "Student uses tags correctly."
-            }
-        ]
-    }
-)
-
-# --- STUDENT ---
-student = models.User(
-    email="lydia@homegrown.com", 
-    role="student", 
-    display_name="Lydia"
-)
-
-# --- ENROLLMENTS ---
-# Enroll Lydia in BOTH classes
-enrollment_daisy = models.Enrollment(
-    student=student, 
-    course=daisy_course, 
-    current_module_index=0
-)
-
-enrollment_tera = models.Enrollment(
-    student=student, 
-    course=tera_course, 
-    current_module_index=0
-)
-
-db.add(daisy)
-db.add(daisy_course)
-db.add(tera)
-db.add(tera_course)
-db.add(student)
-db.add(enrollment_daisy)
-db.add(enrollment_tera)
-
-db.commit()
-
-print("Seed Complete! Daisy AND Tera are ready.")
-db.close()
\ No newline at end of file
+from backend.app.migrations import migrate
+
+
+def reset_database():
+    # THE NUCLEAR OPTION: Auto-delete the old DB to prevent conflicts
+    db_path = os.path.join(current_dir, "app", "homegrown.db")
+    if os.path.exists(db_path):
+        print(f"Removing old database at {db_path}...")
+        os.remove(db_path)
+
+
+def create_tables():
+    print("Creating new database tables...")
+    migrate(engine)
+
+
+def seed_courses(db):
+    """Add the demo agents and courses; returns the courses."""
+    print("Seeding Agents & Courses...")
+
+    # --- AGENT 1: DAISY (Finance) ---
+    daisy = models.Agent(
+        id="daisy_dollars",
+        name="Daisy Dollars", 
+        system_prompt_core="You are Daisy Dollars. You are a strict but encouraging finance teacher."
+    )
+
+    daisy_course = models.Course(
+        id="finance_101", 
+        title="Personal Finance 101", 
+        agent_id="daisy_dollars",
+        curriculum_json={
+            "modules": [{
+                "id": "mod_1", 
+                "title": "Income", 
+                "objective": "Categorize transactions.",
+                "success_criteria": "Identify Rent as fixed.",
+                # The post-module exam: 17 of 20 unlocks the next module.
+                "pass_score": "17/20"
+            }]
+        }
+    )
+
+    # --- AGENT 2: TERA BYTE (Coding) ---
+    tera = models.Agent(
+        id="tera_byte",
+        name="Tera Byte",
+        system_prompt_core="You are Tera Byte, an energetic and precise coding tutor. You love clean code and explaining HTML tags like they are building blocks. You use emojis often 🧱🚀."
+    )
+
+    tera_course = models.Course(
+        id="html_hero",
+        title="HTML Hero: Building the Web",
+        agent_id="tera_byte",
+        curriculum_json={
+            "modules": [
+                {
+                    "id": "html_1",
+                    "title": "The Skeleton of the Web",
+                    "objective": "Write a basic HTML structure with <html>, <head>, and <body> tags.",
+                    "success_criteria": "Student writes valid boilerplate.",
+                    "completion_patterns": ["(?i)<html", "(?i)<head", "(?i)<body", "(?i)</html>"]
+                },
+                {
+                    "id": "html_2",
+                    "title": "Tags & Elements",
+                    "objective": "Create a paragraph <p> and a heading <h1>.",
+                    "success_criteria": "Student uses tags correctly."
+                },
+                {
+                    "id": "html_3",
+                    "title": "The Image",
+                    "objective": "Build a 'Digital Business Card' page with your name, a bio and a funny picture.",
+                    "success_criteria": "Student uploads a working business card page.",
+                    # Uploaded index.html files are graded offline by backend/grade_uploads.py.
+                    "deliverable": {
+                        "accept": ["html"],
+                        "required_tags": ["h1", "p", "img"],
+                        "rubric": "A digital business card: the student's name as a heading, a short bio paragraph and an image with a src."
+                    }
+                }
+            ]
+        }
+    )
+
+    db.add_all([daisy, daisy_course, tera, tera_course])
+    db.flush()
+    return [daisy_course, tera_course]
+
+
+def seed_students(db, courses, count, start=0):
+    """Add `count` synthetic students (student{n}@example.com), each enrolled in every course."""
+    users = [
+        models.User(email=f"student{n}@example.com", role="student", display_name=f"Student {n}")
+        for n in range(start, start + count)
+    ]
+    db.add_all(users)
+    db.flush()
+
+    db.bulk_insert_mappings(
+        models.Enrollment,
+        [
+            {"student_id": user.id, "course_id": course.id, "current_module_index": 0, "student_facts": {}}
+            for user in users
+            for course in courses
+        ],
+    )
+    return users
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reset the local database and load demo data.")
+    parser.add_argument("--students", type=int, default=0, help="extra synthetic students to enroll in every course")
+    args = parser.parse_args(argv)
+
+    reset_database()
+    create_tables()
+
+    db = SessionLocal()
+    courses = seed_courses(db)
+    daisy_course, tera_course = courses
+
+    # --- STUDENT ---
+    student = models.User(
+        email="lydia@homegrown.com", 
+        role="student", 
+        display_name="Lydia"
+    )
+
+    # --- ENROLLMENTS ---
+    # Enroll Lydia in BOTH classes
+    enrollment_daisy = models.Enrollment(
+        student=student, 
+        course=daisy_course, 
+        current_module_index=0
+    )
+
+    enrollment_tera = models.Enrollment(
+        student=student, 
+        course=tera_course, 
+        current_module_index=0
+    )
+
+    db.add(student)
+    db.add(enrollment_daisy)
+    db.add(enrollment_tera)
+
+    if args.students:
+        print(f"Seeding {args.students} synthetic students...")
+        seed_students(db, courses, args.students)
+
+    db.commit()
+
+    print("Seed Complete! Daisy AND Tera are ready.")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
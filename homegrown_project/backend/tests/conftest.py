@@ -0,0 +1,95 @@
+"""Shared fixtures. The app reads its settings at import time, so the environment is set first.
+
+    cd backend && python -m pytest -q tests
+"""
+
+import os
+import sys
+import tempfile
+import uuid
+from dataclasses import replace
+from datetime import datetime, timedelta
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="homegrown-tests-")
+os.environ["HOMEGROWN_DATABASE_URL"] = f"sqlite:///{_tmp}/test.db"
+os.environ["HOMEGROWN_UPLOADS_DIR"] = os.path.join(_tmp, "uploads")
+os.environ["HOMEGROWN_RESPONSE_CACHE"] = "1"
+os.environ.pop("HOMEGROWN_DEV_FALLBACK", None)
+# A developer's .env is loaded with override=True and would point the tests at their database.
+os.environ["PYTHON_DOTENV_DISABLED"] = "1"
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from backend.app import database, models  # noqa: E402
+from backend.app.migrations import migrate  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    migrate(database.engine)
+
+
+@pytest.fixture
+def db():
+    session = database.SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def enrollment(db):
+    """A fresh student enrolled in a fresh one-module course taught by Tera Byte."""
+    if db.get(models.Agent, "tera_byte") is None:
+        db.add(models.Agent(id="tera_byte", name="Tera Byte", system_prompt_core="You are Tera Byte."))
+    course = models.Course(
+        id=f"course_{uuid.uuid4().hex[:8]}",
+        title="Test Course",
+        agent_id="tera_byte",
+        curriculum_json={"modules": [{"id": "m1", "title": "Tags", "objective": "Learn what a tag is."}]},
+    )
+    student = models.User(email=f"{uuid.uuid4().hex[:8]}@example.com", role="student", display_name="Test")
+    row = models.Enrollment(student=student, course=course, current_module_index=0)
+    db.add_all([course, student, row])
+    db.commit()
+    return row
+
+
+@pytest.fixture
+def add_logs(db):
+    """Insert `count` alternating student/agent turns ("turn 0", "turn 1", ...); returns their ids."""
+
+    def add(enrollment, count, start=None, step=timedelta(seconds=1), first=0):
+        start = start or datetime.utcnow() - count * step
+        rows = [
+            models.ChatLog(
+                enrollment_id=enrollment.id,
+                sender="student" if i % 2 == 0 else "agent",
+                content=f"turn {i}.",
+                timestamp=start + (i - first) * step,
+            )
+            for i in range(first, first + count)
+        ]
+        db.add_all(rows)
+        db.commit()
+        return [row.id for row in rows]
+
+    return add
+
+
+@pytest.fixture
+def configure_fake(monkeypatch):
+    """Install a fake provider built from the given env overrides; restores the previous one."""
+    from backend.app.services import llm_service
+
+    previous = llm_service.providers.get().config
+
+    def configure(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        config = replace(llm_service.LLMConfig.from_env(), provider="fake", fallback_deadline_seconds=0.3)
+        return llm_service.providers.configure(config)
+
+    yield configure
+    llm_service.providers.configure(previous)
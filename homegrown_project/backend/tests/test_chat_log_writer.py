@@ -0,0 +1,73 @@
+import threading
+
+from backend.app import models
+from backend.app.services.chat_log_writer import ChatLogWriter
+
+
+class _GatedWriter(ChatLogWriter):
+    """Holds each batch between taking it off the queue and committing it."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+    def _write(self, batch):
+        self.writing.set()
+        assert self.release.wait(5)
+        super()._write(batch)
+
+
+def _rows(enrollment_id, *contents):
+    return [{"enrollment_id": enrollment_id, "sender": "student", "content": c} for c in contents]
+
+
+def _logged(db, enrollment_id):
+    db.expire_all()
+    return [
+        row.content
+        for row in db.query(models.ChatLog).filter(models.ChatLog.enrollment_id == enrollment_id).order_by(models.ChatLog.id)
+    ]
+
+
+def test_flush_waits_for_the_batch_being_written(db, enrollment):
+    writer = _GatedWriter(batch_size=10, flush_interval=0)
+    try:
+        written = writer.submit(_rows(enrollment.id, "hello", "again"))
+        assert writer.writing.wait(5)
+
+        # The batch is off the queue but not committed: a flush must not report it visible.
+        flushed = writer.request_flush()
+        assert writer.has_pending(enrollment.id)
+        assert not flushed.done()
+        assert _logged(db, enrollment.id) == []
+
+        writer.release.set()
+        flushed.result(timeout=5)
+        assert written.done()
+        assert not writer.has_pending(enrollment.id)
+        assert _logged(db, enrollment.id) == ["hello", "again"]
+    finally:
+        writer.release.set()
+        writer.close()
+
+
+def test_flush_covers_rows_queued_behind_the_batch_being_written(db, enrollment):
+    writer = _GatedWriter(batch_size=1, flush_interval=0)
+    try:
+        writer.submit(_rows(enrollment.id, "first"))
+        assert writer.writing.wait(5)
+        writer.submit(_rows(enrollment.id, "second"))
+
+        flushed = writer.request_flush()
+        writer.release.set()
+        flushed.result(timeout=5)
+        assert _logged(db, enrollment.id) == ["first", "second"]
+    finally:
+        writer.release.set()
+        writer.close()
+
+
+def test_flush_with_nothing_queued_is_already_done():
+    writer = ChatLogWriter(batch_size=10, flush_interval=0)
+    assert writer.request_flush().done()
@@ -0,0 +1,23 @@
+import asyncio
+
+from backend.app.services.chat_service import handle_chat
+from backend.app.services.llm_service import FallbackReply
+
+
+def test_deadline_fallback_reply_is_not_cached(db, enrollment, configure_fake):
+    question = "What is a tag?"
+
+    # Every call is rate limited, so the scheduler gives up at the deadline.
+    configure_fake(HOMEGROWN_FAKE_LLM_429_RATE="1", HOMEGROWN_FAKE_LLM_LATENCY="fixed:0")
+    _, first, _ = asyncio.run(handle_chat(db, enrollment.id, question))
+    assert isinstance(first, FallbackReply)
+
+    # Once the provider recovers, the same question gets a real reply, not the canned one.
+    configure_fake(HOMEGROWN_FAKE_LLM_429_RATE="0", HOMEGROWN_FAKE_LLM_LATENCY="fixed:0")
+    _, second, _ = asyncio.run(handle_chat(db, enrollment.id, question))
+    assert not isinstance(second, FallbackReply)
+    assert second != first
+
+    # ...and that real reply is what the cache replays.
+    _, third, _ = asyncio.run(handle_chat(db, enrollment.id, question))
+    assert third == second
@@ -0,0 +1,21 @@
+from fastapi.testclient import TestClient
+
+from backend.app.main import app
+from backend.app.routers import chat
+
+
+def test_stream_failure_ends_with_an_error_event(enrollment, monkeypatch):
+    def failing_stream(db, enrollment_id, user_message):
+        async def events():
+            yield "token", "Hel"
+            raise RuntimeError("provider exploded")
+
+        return db.get(chat.models.Enrollment, enrollment_id), events()
+
+    monkeypatch.setattr(chat, "stream_chat", failing_stream)
+    r = TestClient(app).post("/api/chat/stream", json={"enrollment_id": enrollment.id, "message": "hello"})
+
+    assert r.status_code == 200
+    events = [block.split("\n")[0] for block in r.text.strip().split("\n\n")]
+    assert events == ["event: token", "event: error"]
+    assert "please retry" in r.text
@@ -0,0 +1,32 @@
+import pytest
+
+from backend.app.services.fact_service import extract_facts_rules
+
+
+def _values(message: str, kind: str):
+    return [fact["value"] for fact in extract_facts_rules(message) if fact["kind"] == kind]
+
+
+@pytest.mark.parametrize(
+    "message",
+    ["My name is Sam.", "Call me Sam", "hi! my name is Sam", "ok so call me Sam please"],
+)
+def test_name_cue_matches_at_sentence_start_and_mid_sentence(message):
+    assert _values(message, "name") == ["Sam"]
+
+
+def test_name_must_be_capitalized():
+    assert _values("my name is not important", "name") == []
+
+
+@pytest.mark.parametrize(
+    "message, interest",
+    [
+        ("I'm into robotics.", "robotics"),
+        ("Honestly I am into robotics", "robotics"),
+        ("I really love drawing comics!", "drawing comics"),
+        ("I enjoy chess, mostly", "chess"),
+    ],
+)
+def test_interest_forms(message, interest):
+    assert _values(message, "interest") == [interest]
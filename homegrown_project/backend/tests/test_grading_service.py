@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import uuid
+from dataclasses import replace
+
+import pytest
+
+from backend.app import database, models
+from backend.app.services import grading_service, upload_service
+
+GOOD = (
+    b"<!DOCTYPE html><html><head><title>Me</title></head>"
+    b"<body><h1>Lydia</h1><p>I like cats<img src='cat.png' alt='cat'></p></body></html>"
+)
+BROKEN = b"<html><body><h1>Me</h2></body></html>"
+
+CONFIG = replace(grading_service.settings, processes=0, batch_size=10, max_attempts=2, lease_seconds=600)
+
+
+@pytest.fixture(autouse=True)
+def empty_queue():
+    # Uploads from other tests would otherwise be claimed here.
+    with database.engine.begin() as conn:
+        conn.execute(models.Upload.__table__.update().values(grade_status=None))
+
+
+@pytest.fixture
+def card_enrollment(db):
+    if db.get(models.Agent, "tera_byte") is None:
+        db.add(models.Agent(id="tera_byte", name="Tera Byte", system_prompt_core="You are Tera Byte."))
+    course = models.Course(
+        id=f"cards_{uuid.uuid4().hex[:8]}",
+        title="Cards",
+        agent_id="tera_byte",
+        curriculum_json={
+            "modules": [
+                {
+                    "id": "card",
+                    "title": "Card",
+                    "objective": "Make a profile card.",
+                    "deliverable": {"required_tags": ["h1", "p", "img"], "rubric": "name, bio and a picture"},
+                },
+                {"id": "next", "title": "Next", "objective": "Keep going."},
+            ]
+        },
+    )
+    student = models.User(email=f"{uuid.uuid4().hex[:8]}@example.com", role="student", display_name="G")
+    row = models.Enrollment(student=student, course=course, current_module_index=0)
+    db.add_all([course, student, row])
+    db.commit()
+    return row
+
+
+def _upload(db, enrollment, filename, content):
+    tmp_path = upload_service.new_tmp_path()
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    sha256 = hashlib.sha256(content).hexdigest()
+    upload, _ = upload_service.record_upload(db, enrollment.id, filename, "text/html", len(content), sha256, tmp_path)
+    return upload.id
+
+
+@pytest.fixture
+def grader(configure_fake, monkeypatch):
+    """The fake provider, answering grading requests with `verdict(upload_id)` (None: leave it out)."""
+    provider = configure_fake(HOMEGROWN_FAKE_LLM_429_RATE="0", HOMEGROWN_FAKE_LLM_LATENCY="fixed:0")
+    requests = []
+
+    def install(verdict):
+        async def agenerate_json(prompt, message):
+            ids = [int(i) for i in re.findall(r"## Submission (\d+)", message)]
+            requests.append(ids)
+            grades = [
+                {"id": i, "passed": verdict(i), "score": 0.9 if verdict(i) else 0.2, "feedback": "Nice card."}
+                for i in ids
+                if verdict(i) is not None
+            ]
+            return json.dumps({"grades": grades})
+
+        monkeypatch.setattr(provider, "agenerate_json", agenerate_json)
+        return requests
+
+    return install
+
+
+def _run(worker):
+    try:
+        return asyncio.run(worker.run_once())
+    finally:
+        worker.close()
+
+
+def test_claims_are_leased_and_expire(db, card_enrollment):
+    ids = [_upload(db, card_enrollment, f"{i}.html", GOOD + bytes([i])) for i in range(3)]
+    config = replace(CONFIG, batch_size=2)
+
+    first = grading_service.claim_uploads(config)
+    second = grading_service.claim_uploads(config)
+    assert [job.upload_id for job in first + second] == ids
+    assert grading_service.claim_uploads(config) == []
+
+    # Once the lease runs out, a crashed worker's uploads are claimed again.
+    reclaimed = grading_service.claim_uploads(replace(config, lease_seconds=0, batch_size=10))
+    assert [job.upload_id for job in reclaimed] == ids
+    assert {job.attempts for job in reclaimed} == {2}
+
+
+def test_concurrent_claims_never_share_an_upload(db, card_enrollment):
+    ids = [_upload(db, card_enrollment, f"{i}.html", GOOD + bytes([i])) for i in range(12)]
+    config = replace(CONFIG, batch_size=5)
+    claimed, start = [], threading.Barrier(3)
+
+    def claim():
+        start.wait()
+        while True:
+            jobs = grading_service.claim_uploads(config)
+            if not jobs:
+                return
+            claimed.extend(job.upload_id for job in jobs)
+
+    threads = [threading.Thread(target=claim) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    assert sorted(claimed) == ids
+
+
+def test_grading_advances_the_module_and_reports_in_chat(db, card_enrollment, grader):
+    requests = grader(lambda upload_id: True)
+    good = _upload(db, card_enrollment, "index.html", GOOD)
+    broken = _upload(db, card_enrollment, "broken.html", BROKEN)
+
+    worker = grading_service.GradingWorker(CONFIG)
+    assert _run(worker) == 2
+    # The broken file fails the local checks and never reaches the LLM.
+    assert requests == [[good]]
+    assert worker.snapshot()["graded"] == 2 and worker.snapshot()["failed_locally"] == 1
+
+    db.expire_all()
+    assert db.get(models.Upload, good).grade["passed"] is True
+    assert db.get(models.Upload, broken).grade["passed"] is False
+    assert db.get(models.Enrollment, card_enrollment.id).current_module_index == 1
+    graded = [
+        log.content
+        for log in db.query(models.ChatLog).filter(models.ChatLog.enrollment_id == card_enrollment.id)
+        if log.content.startswith("[FILE_GRADED]")
+    ]
+    assert sorted(line.split(":")[0] for line in graded) == ["[FILE_GRADED] broken.html", "[FILE_GRADED] index.html"]
+
+
+def test_ungraded_uploads_are_retried_then_left_for_review(db, card_enrollment, grader):
+    grader(lambda upload_id: None)
+    upload_id = _upload(db, card_enrollment, "index.html", GOOD)
+
+    first = grading_service.GradingWorker(CONFIG)
+    _run(first)
+    assert first.snapshot()["released"] == 1
+    db.expire_all()
+    assert db.get(models.Upload, upload_id).grade_status == "pending"
+
+    second = grading_service.GradingWorker(CONFIG)
+    _run(second)
+    db.expire_all()
+    upload = db.get(models.Upload, upload_id)
+    assert upload.grade_status == "needs_review" and upload.grade["passed"] is None
+    assert db.get(models.Enrollment, card_enrollment.id).current_module_index == 0
@@ -0,0 +1,60 @@
+from dataclasses import replace
+from datetime import datetime, timedelta
+
+from backend.app import database, models
+from backend.app.services import archive_service
+from backend.app.services.history_service import fetch_history_page
+
+
+def _history_with_ties(db, enrollment, add_logs, count=99):
+    """`count` old turns, two per timestamp, partly archived so one tie straddles the boundary."""
+    start = datetime.utcnow() - timedelta(days=400)
+    ids = []
+    for pair in range(0, count, 2):
+        ids += add_logs(enrollment, min(2, count - pair), start=start + timedelta(seconds=pair), step=timedelta(0), first=pair)
+
+    config = replace(archive_service.settings, keep_recent=1, segment_rows=7)
+    _, archived = archive_service.compact_enrollment(
+        database.engine, enrollment.id, datetime.utcnow() - timedelta(days=90), config
+    )
+    hot = db.query(models.ChatLog.id).filter(models.ChatLog.enrollment_id == enrollment.id).count()
+    # Keyset order puts the tie's first row in a segment and its twin in the hot table.
+    assert archived % 2 == 1 and archived + hot == count
+    return ids
+
+
+def test_scrolling_back_crosses_into_the_archive_without_gaps(db, enrollment, add_logs):
+    ids = _history_with_ties(db, enrollment, add_logs)
+
+    seen, before = [], None
+    while True:
+        page = fetch_history_page(db, enrollment.id, limit=4, before=before)
+        seen = [item["id"] for item in page["items"]] + seen
+        if not page["has_more"]:
+            break
+        before = page["before_cursor"]
+    assert seen == ids
+
+
+def test_scrolling_forward_and_polling_cross_out_of_the_archive(db, enrollment, add_logs):
+    ids = _history_with_ties(db, enrollment, add_logs)
+    everything = fetch_history_page(db, enrollment.id, limit=len(ids))
+    assert not everything["has_more"]
+
+    seen, after = [ids[0]], everything["before_cursor"]
+    while True:
+        page = fetch_history_page(db, enrollment.id, limit=5, after=after)
+        seen += [item["id"] for item in page["items"]]
+        if not page["has_more"]:
+            break
+        after = page["after_cursor"]
+    assert seen == ids
+
+    polled, since_id = [], 0
+    while True:
+        page = fetch_history_page(db, enrollment.id, limit=6, since_id=since_id)
+        polled += [item["id"] for item in page["items"]]
+        if not page["has_more"]:
+            break
+        since_id = page["last_id"]
+    assert polled == ids
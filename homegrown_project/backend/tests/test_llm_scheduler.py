@@ -0,0 +1,183 @@
+import asyncio
+import time
+
+import pytest
+
+from backend.app.services.llm_scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    LLMDeadlineExceeded,
+    LLMOverloadedError,
+    LLMScheduler,
+    RateLimit,
+)
+
+UNLIMITED = RateLimit(key="test", per_minute=0, burst=1)
+
+
+class RateLimited(Exception):
+    pass
+
+
+def _scheduler(**kwargs):
+    options = dict(
+        max_concurrency=1,
+        max_pending=100,
+        is_retryable=lambda e: isinstance(e, RateLimited),
+        backoff_base_seconds=0.01,
+        backoff_max_seconds=0.02,
+    )
+    options.update(kwargs)
+    return LLMScheduler(**options)
+
+
+def _deadline(seconds=5.0):
+    return time.monotonic() + seconds
+
+
+def test_waiting_calls_rotate_across_courses_and_enrollments():
+    async def scenario():
+        scheduler = _scheduler()
+        gate = asyncio.Event()
+        order = []
+
+        async def hold():
+            await gate.wait()
+
+        def call(name):
+            async def run():
+                order.append(name)
+            return run
+
+        blocker = asyncio.create_task(
+            scheduler.run(hold, limit=UNLIMITED, tenant=("x", "x"), priority=PRIORITY_INTERACTIVE, deadline=_deadline())
+        )
+        await asyncio.sleep(0)
+
+        waiting = []
+        for name, tenant, priority in [
+            ("bg", ("A", "a1"), PRIORITY_BACKGROUND),
+            ("a1", ("A", "a1"), PRIORITY_INTERACTIVE),
+            ("a1", ("A", "a1"), PRIORITY_INTERACTIVE),
+            ("a1", ("A", "a1"), PRIORITY_INTERACTIVE),
+            ("a2", ("A", "a2"), PRIORITY_INTERACTIVE),
+            ("b1", ("B", "b1"), PRIORITY_INTERACTIVE),
+            ("b1", ("B", "b1"), PRIORITY_INTERACTIVE),
+        ]:
+            waiting.append(
+                asyncio.create_task(
+                    scheduler.run(call(name), limit=UNLIMITED, tenant=tenant, priority=priority, deadline=_deadline())
+                )
+            )
+            await asyncio.sleep(0)
+        assert scheduler.pending == 7
+
+        gate.set()
+        await asyncio.gather(blocker, *waiting)
+        return order
+
+    # A busy student (a1) and a busy course (A) do not crowd out the others; background goes last.
+    assert asyncio.run(scenario()) == ["a1", "b1", "a2", "b1", "a1", "a1", "bg"]
+
+
+def test_rate_limited_calls_are_retried_until_they_succeed():
+    async def scenario():
+        scheduler = _scheduler()
+        attempts = []
+
+        async def flaky():
+            attempts.append(time.monotonic())
+            if len(attempts) < 3:
+                raise RateLimited()
+            return "ok"
+
+        result = await scheduler.run(
+            flaky, limit=UNLIMITED, tenant=("A", "a1"), priority=PRIORITY_INTERACTIVE, deadline=_deadline()
+        )
+        return scheduler, result, attempts
+
+    scheduler, result, attempts = asyncio.run(scenario())
+    assert result == "ok" and len(attempts) == 3
+    assert scheduler.stats.retries == 2 and scheduler.stats.rate_limited == 2
+    assert scheduler.in_flight == 0
+
+
+def test_other_errors_are_not_retried():
+    async def broken():
+        raise ValueError("bad request")
+
+    scheduler = _scheduler()
+    with pytest.raises(ValueError):
+        asyncio.run(
+            scheduler.run(broken, limit=UNLIMITED, tenant=("A", "a1"), priority=PRIORITY_INTERACTIVE, deadline=_deadline())
+        )
+    assert scheduler.stats.retries == 0 and scheduler.in_flight == 0
+
+
+def test_retries_stop_at_the_deadline():
+    async def always_limited():
+        raise RateLimited()
+
+    scheduler = _scheduler(backoff_base_seconds=0.05)
+    started = time.monotonic()
+    with pytest.raises(LLMDeadlineExceeded):
+        asyncio.run(
+            scheduler.run(
+                always_limited, limit=UNLIMITED, tenant=("A", "a1"), priority=PRIORITY_INTERACTIVE, deadline=_deadline(0.3)
+            )
+        )
+    assert time.monotonic() - started < 0.5
+    assert scheduler.stats.deadline_exceeded == 1 and scheduler.in_flight == 0
+
+
+def test_queued_call_gives_up_at_its_deadline_and_leaves_the_queue():
+    async def scenario():
+        scheduler = _scheduler()
+        gate = asyncio.Event()
+
+        async def hold():
+            await gate.wait()
+
+        async def never():
+            raise AssertionError("ran after its deadline")
+
+        blocker = asyncio.create_task(
+            scheduler.run(hold, limit=UNLIMITED, tenant=("A", "a1"), priority=PRIORITY_INTERACTIVE, deadline=_deadline())
+        )
+        await asyncio.sleep(0)
+        with pytest.raises(LLMDeadlineExceeded):
+            await scheduler.run(
+                never, limit=UNLIMITED, tenant=("B", "b1"), priority=PRIORITY_INTERACTIVE, deadline=_deadline(0.05)
+            )
+        assert scheduler.pending == 0
+        gate.set()
+        await blocker
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.in_flight == 0
+
+
+def test_full_queue_sheds_load():
+    async def scenario():
+        scheduler = _scheduler(max_pending=0)
+        gate = asyncio.Event()
+
+        async def hold():
+            await gate.wait()
+
+        blocker = asyncio.create_task(
+            scheduler.run(hold, limit=UNLIMITED, tenant=("A", "a1"), priority=PRIORITY_INTERACTIVE, deadline=_deadline())
+        )
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(LLMOverloadedError):
+                await scheduler.run(
+                    hold, limit=UNLIMITED, tenant=("B", "b1"), priority=PRIORITY_INTERACTIVE, deadline=_deadline()
+                )
+        finally:
+            gate.set()
+            await blocker
+        return scheduler
+
+    assert asyncio.run(scenario()).stats.rejected == 1
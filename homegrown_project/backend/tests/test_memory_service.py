@@ -0,0 +1,61 @@
+import re
+from dataclasses import replace
+from datetime import datetime, timedelta
+
+from backend.app import database
+from backend.app.services import archive_service
+from backend.app.services.memory_service import MemorySettings, load_memory
+
+
+CONFIG = MemorySettings(
+    history_token_budget=40,
+    summary_token_budget=100_000,
+    max_loaded_turns=10,
+    summary_line_chars=160,
+    catchup_chunks=2,
+)
+
+
+def _summarized(enrollment):
+    return [int(n) for n in re.findall(r"turn (\d+)", enrollment.conversation_summary or "")]
+
+
+def test_existing_history_is_summarized_forward_from_the_cursor(db, enrollment, add_logs):
+    ids = add_logs(enrollment, 55)
+
+    memory = load_memory(db, enrollment, CONFIG)
+    # Two chunks caught up from the start; the recent window's overflow waits until then.
+    assert _summarized(enrollment) == list(range(20))
+    assert enrollment.summary_through_log_id == ids[19]
+    assert memory.turns[-1] == ("student", "turn 54.")
+
+    for _ in range(5):
+        memory = load_memory(db, enrollment, CONFIG)
+    window_start = int(memory.turns[0][1].split()[1].rstrip("."))
+    # Every row before the window was summarized exactly once, in order.
+    assert _summarized(enrollment) == list(range(window_start))
+    assert enrollment.summary_through_log_id == ids[window_start - 1]
+
+
+def test_short_history_rolls_overflow_directly(db, enrollment, add_logs):
+    ids = add_logs(enrollment, 8)
+    memory = load_memory(db, enrollment, CONFIG)
+    summarized = _summarized(enrollment)
+    assert summarized == list(range(len(summarized)))
+    assert len(summarized) + len(memory.turns) == 8
+    assert enrollment.summary_through_log_id == (ids[len(summarized) - 1] if summarized else 0)
+
+
+def test_compaction_summarizes_rows_memory_never_read(db, enrollment, add_logs):
+    old = datetime.utcnow() - timedelta(days=400)
+    ids = add_logs(enrollment, 100, start=old)
+    config = replace(archive_service.settings, keep_recent=1, segment_rows=30)
+
+    segments, archived = archive_service.compact_enrollment(
+        database.engine, enrollment.id, datetime.utcnow() - timedelta(days=90), config
+    )
+    assert archived > 0
+    db.refresh(enrollment)
+    # Archived rows left the hot table memory reads from, so the cursor covers them.
+    assert enrollment.summary_through_log_id == ids[archived - 1]
+    assert _summarized(enrollment)[-1] == archived - 1
@@ -0,0 +1,40 @@
+from dataclasses import replace
+from types import SimpleNamespace
+
+import pytest
+
+from backend.app.services import progress_service
+from backend.app.services.progress_service import ProgressRules, precheck
+
+MODULE = SimpleNamespace(
+    title="Tags",
+    objective="Write a page with a heading.",
+    success_criteria="The page has an <h1>.",
+    progress=ProgressRules(),
+)
+
+
+@pytest.mark.parametrize(
+    "message, needs_llm",
+    [
+        ("ok thanks", False),
+        ("what about tables?", False),
+        ("that was fun, tell me more", False),
+        ("I'm done", True),
+        ("Here is my page", True),
+        ("<h1>Hello</h1>", True),
+        ("I think " + "the heading element marks the title of a page and " * 5, True),
+    ],
+)
+def test_auto_evaluator_only_asks_about_claims_and_work(message, needs_llm):
+    verdict = precheck(MODULE, message)
+    assert (verdict is None) == needs_llm
+    if verdict is not None:
+        assert verdict.source == "rules" and not verdict.complete
+
+
+def test_llm_and_rules_modes():
+    chatter = "that was fun, tell me more"
+    assert precheck(MODULE, chatter, replace(progress_service.settings, evaluator="llm")) is None
+    rules_only = replace(progress_service.settings, evaluator="rules")
+    assert precheck(MODULE, "I'm done", rules_only).complete is False
@@ -0,0 +1,85 @@
+from dataclasses import replace
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+from backend.app import database, models
+from backend.app.main import app
+from backend.app.services import archive_service
+from backend.app.services.memory_service import settings as memory_settings
+from backend.app.services.search_service import search_chat_logs
+
+TOPICS = ["loops", "variables", "tables", "forms"]
+
+
+def _transcript(db, enrollment, count, start):
+    rows = [
+        models.ChatLog(
+            enrollment_id=enrollment.id,
+            sender="student" if i % 2 == 0 else "agent",
+            content=f"message {i} about {TOPICS[i % 4]}",
+            timestamp=start + timedelta(minutes=i),
+        )
+        for i in range(count)
+    ]
+    db.add_all(rows)
+    db.commit()
+    return [row.id for row in rows]
+
+
+def _compact(enrollment, segment_rows=25):
+    config = replace(archive_service.settings, keep_recent=1, segment_rows=segment_rows)
+    cutoff = datetime.utcnow() - timedelta(days=config.archive_after_days)
+    return archive_service.compact_enrollment(database.engine, enrollment.id, cutoff, config)
+
+
+def test_search_is_scoped_and_filtered(db, enrollment):
+    _transcript(db, enrollment, 8, datetime.utcnow() - timedelta(hours=1))
+
+    hits = search_chat_logs(db, "tab", enrollment_id=enrollment.id)["items"]
+    # The last term matches as a prefix.
+    assert sorted(hit["snippet"] for hit in hits) == ["message 2 about tables", "message 6 about tables"]
+    assert all(hit["enrollment_id"] == enrollment.id and not hit["archived"] for hit in hits)
+
+    # "loops" is only ever said by the student.
+    assert len(search_chat_logs(db, "loops", enrollment_id=enrollment.id, sender="student")["items"]) == 2
+    assert search_chat_logs(db, "loops", enrollment_id=enrollment.id, sender="agent")["items"] == []
+    assert search_chat_logs(db, "loops", enrollment_id=enrollment.id + 10_000)["items"] == []
+
+    # FTS5 syntax in the query is treated as words, not operators.
+    assert search_chat_logs(db, 'NEAR(loops) OR "*', enrollment_id=enrollment.id)["items"] == []
+
+
+def test_compaction_keeps_the_recent_tail_hot(db, enrollment):
+    ids = _transcript(db, enrollment, 130, datetime.utcnow() - timedelta(days=400))
+    keep = max(1, memory_settings.max_loaded_turns)
+
+    segments, archived = _compact(enrollment)
+    assert archived == len(ids) - keep
+    assert segments == -(-archived // 25)
+    hot = [row.id for row in db.query(models.ChatLog.id).filter(models.ChatLog.enrollment_id == enrollment.id)]
+    assert sorted(hot) == ids[archived:]
+
+    stored = db.query(models.ChatLogSegment).filter(models.ChatLogSegment.enrollment_id == enrollment.id).all()
+    assert sum(segment.row_count for segment in stored) == archived
+    # Nothing left that is old enough and outside the tail.
+    assert _compact(enrollment) == (0, 0)
+
+
+def test_archived_hits_are_resolved_from_segments(db, enrollment):
+    ids = _transcript(db, enrollment, 100, datetime.utcnow() - timedelta(days=400))
+    _, archived = _compact(enrollment)
+
+    page = search_chat_logs(db, "forms", enrollment_id=enrollment.id, limit=100)
+    hits = {hit["id"]: hit for hit in page["items"]}
+    assert set(hits) == {log_id for i, log_id in enumerate(ids) if i % 4 == 3}
+    for i, log_id in enumerate(ids):
+        if log_id in hits:
+            assert hits[log_id]["archived"] == (i < archived)
+            assert hits[log_id]["snippet"] == f"message {i} about forms"
+
+
+def test_search_endpoint_requires_an_enrollment(enrollment):
+    client = TestClient(app)
+    assert client.get("/api/chat/search", params={"q": "loops"}).status_code == 422
+    assert client.get("/api/chat/search", params={"q": "loops", "enrollment_id": enrollment.id}).status_code == 200
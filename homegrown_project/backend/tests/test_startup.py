@@ -0,0 +1,95 @@
+"""Worker boot-time budget.
+
+Boots the app in fresh interpreters, the way a new uvicorn worker does (import
+`backend.app.main`, run the startup hooks), and fails if the median boot time exceeds
+HOMEGROWN_STARTUP_BUDGET_MS or if a provider SDK got imported during boot.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+from types import SimpleNamespace
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_ROOT = os.path.dirname(BACKEND_DIR)
+
+BUDGET_MS = float(os.getenv("HOMEGROWN_STARTUP_BUDGET_MS", "1500"))
+RUNS = 3
+
+# Modules that must stay out of the boot path; they load lazily or via warmup.
+LAZY_MODULES = ("google.generativeai",)
+
+BOOT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+from backend.app.main import app
+imported = time.perf_counter() - started
+from fastapi.testclient import TestClient
+with TestClient(app):
+    ready = time.perf_counter() - started
+print(json.dumps({
+    "import_seconds": imported,
+    "ready_seconds": ready,
+    "lazy_loaded": [m for m in %r if m in sys.modules],
+}))
+"""
+
+
+def _boot(**env):
+    return subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", BOOT_SCRIPT % (LAZY_MODULES,)],
+        cwd=PROJECT_ROOT,
+        env=dict(os.environ, HOMEGROWN_LLM_WARMUP="off", **env),
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+
+
+def _boot_once() -> dict:
+    result = _boot()
+    assert result.returncode == 0, f"Worker failed to boot:\n{result.stderr}"
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_worker_boots_within_budget():
+    _boot_once()  # Prime the bytecode cache so the first run does not skew the median.
+    runs = [_boot_once() for _ in range(RUNS)]
+
+    ready_ms = statistics.median(r["ready_seconds"] for r in runs) * 1000
+    assert ready_ms <= BUDGET_MS, f"boot took {ready_ms:.0f} ms, over the {BUDGET_MS:.0f} ms budget"
+    assert not {m for r in runs for m in r["lazy_loaded"]}, "provider SDK imported during boot"
+
+
+def test_worker_refuses_to_start_on_an_unmigrated_database(tmp_path):
+    result = _boot(HOMEGROWN_DATABASE_URL=f"sqlite:///{tmp_path}/empty.db", HOMEGROWN_MIGRATE_ON_STARTUP="check")
+    assert result.returncode != 0
+    assert "run `python backend/migrate.py`" in result.stderr
+
+
+def test_background_warmup_failure_is_logged(caplog, monkeypatch):
+    from backend.app import main
+
+    def warmup():
+        raise ImportError("No module named 'google.generativeai'")
+
+    provider = SimpleNamespace(config=SimpleNamespace(warmup="background"), warmup=warmup)
+    monkeypatch.setattr(main.providers, "configure", lambda config: provider)
+    # Keep the test's event loop free of the SIGHUP reload handler.
+    monkeypatch.delattr(main.signal, "SIGHUP", raising=False)
+
+    async def boot():
+        await main.start_llm_providers()
+        for _ in range(100):
+            if "warmup failed" in caplog.text:
+                return
+            await asyncio.sleep(0.01)
+
+    with caplog.at_level(logging.ERROR, logger="backend.app.main"):
+        asyncio.run(boot())
+    assert "LLM provider warmup failed" in caplog.text
+    assert "google.generativeai" in caplog.text
@@ -0,0 +1,153 @@
+import asyncio
+import gc
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from backend.app import database, models
+from backend.app.main import app
+from backend.app.services import chat_service
+from backend.app.services.chat_log_writer import ensure_logs_visible
+from backend.app.services.turn_coordinator import TurnCoordinator, TurnSettings
+
+
+def test_stale_retry_keeps_the_memory_summary(db, enrollment, add_logs, configure_fake, monkeypatch):
+    configure_fake(HOMEGROWN_FAKE_LLM_429_RATE="0", HOMEGROWN_FAKE_LLM_LATENCY="fixed:0")
+    # Enough history that this turn's load_memory has to roll turns into the summary.
+    add_logs(enrollment, 90)
+
+    record_progress = chat_service.record_progress
+    bumped = []
+
+    def record_progress_racing(enrollment_row, module, verdict):
+        if not bumped:
+            # Another worker commits to the same enrollment between our read and our write.
+            with database.engine.begin() as conn:
+                conn.execute(text("UPDATE enrollments SET version = version + 1 WHERE id = :id"), {"id": enrollment.id})
+            bumped.append(True)
+        return record_progress(enrollment_row, module, verdict)
+
+    monkeypatch.setattr(chat_service, "record_progress", record_progress_racing)
+    asyncio.run(chat_service.handle_chat(db, enrollment.id, "Why is the sky blue?"))
+    assert bumped
+
+    with database.SessionLocal() as fresh:
+        row = fresh.get(models.Enrollment, enrollment.id)
+        assert row.summary_through_log_id > 0
+        assert "turn 0" in row.conversation_summary
+
+
+def test_failed_turn_without_followers_logs_nothing():
+    coordinator = TurnCoordinator(TurnSettings(idempotency_ttl_seconds=60, max_idempotency_keys=10))
+    unhandled = []
+
+    async def main():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: unhandled.append(context))
+        with pytest.raises(RuntimeError):
+            async with coordinator.turn(1, "hello"):
+                raise RuntimeError("provider blew up")
+        gc.collect()
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+    assert unhandled == []
+
+
+def _coordinator(ttl=60.0):
+    return TurnCoordinator(TurnSettings(idempotency_ttl_seconds=ttl, max_idempotency_keys=10))
+
+
+async def _answer(coordinator, enrollment_id, message, reply, calls, key=None, gate=None):
+    async with coordinator.turn(enrollment_id, message, key) as flight:
+        if not flight.leader:
+            return await flight.result()
+        calls.append(message)
+        if gate is not None:
+            await gate.wait()
+        flight.resolve(reply)
+        return reply
+
+
+def test_repeated_message_joins_the_turn_in_flight():
+    coordinator = _coordinator()
+    calls = []
+
+    async def main():
+        gate = asyncio.Event()
+        first = asyncio.create_task(_answer(coordinator, 1, "What is a tag?", "first", calls, gate=gate))
+        await asyncio.sleep(0)
+        # Same text modulo whitespace is the same turn; other messages queue behind it.
+        second = asyncio.create_task(_answer(coordinator, 1, " What is a tag? ", "second", calls))
+        other = asyncio.create_task(_answer(coordinator, 1, "And a table?", "other", calls))
+        await asyncio.sleep(0.01)
+        assert calls == ["What is a tag?"]
+        gate.set()
+        return await asyncio.gather(first, second, other)
+
+    assert asyncio.run(main()) == ["first", "first", "other"]
+    assert calls == ["What is a tag?", "And a table?"]
+    assert coordinator.snapshot()["joined"] == 1 and coordinator.snapshot()["in_flight"] == 0
+
+
+def test_follower_of_an_interrupted_turn_is_told_to_retry():
+    coordinator = _coordinator()
+
+    async def main():
+        gate = asyncio.Event()
+        leader = asyncio.create_task(_answer(coordinator, 1, "hello", "hi", [], gate=gate))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(_answer(coordinator, 1, "hello", "hi", []))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(HTTPException) as interrupted:
+            await follower
+        return interrupted.value.status_code
+
+    assert asyncio.run(main()) == 409
+
+
+def test_idempotency_key_replays_the_reply():
+    coordinator = _coordinator()
+    calls = []
+
+    async def main():
+        first = await _answer(coordinator, 1, "hello", "first", calls, key="k1")
+        replay = await _answer(coordinator, 1, "hello", "second", calls, key="k1")
+        # The key is per enrollment.
+        elsewhere = await _answer(coordinator, 2, "hello", "third", calls, key="k1")
+        with pytest.raises(HTTPException) as reused:
+            await _answer(coordinator, 1, "something else", "fourth", calls, key="k1")
+        return first, replay, elsewhere, reused.value.status_code
+
+    assert asyncio.run(main()) == ("first", "first", "third", 409)
+    assert calls == ["hello", "hello"]
+    assert coordinator.snapshot()["replayed"] == 1
+
+
+def test_idempotency_replays_expire():
+    coordinator = _coordinator(ttl=0)
+    calls = []
+
+    async def main():
+        await _answer(coordinator, 1, "hello", "first", calls, key="k1")
+        return await _answer(coordinator, 1, "hello", "second", calls, key="k1")
+
+    assert asyncio.run(main()) == "second"
+    assert len(calls) == 2
+
+
+def test_chat_retry_with_the_same_key_is_answered_once(db, enrollment, configure_fake):
+    configure_fake(HOMEGROWN_FAKE_LLM_429_RATE="0", HOMEGROWN_FAKE_LLM_LATENCY="fixed:0")
+    client = TestClient(app)
+    request = {"enrollment_id": enrollment.id, "message": "What is a tag?", "idempotency_key": "retry-1"}
+
+    first = client.post("/api/chat", json=request)
+    again = client.post("/api/chat", json=request)
+    assert first.status_code == again.status_code == 200
+    assert again.json() == first.json()
+
+    asyncio.run(ensure_logs_visible(enrollment.id))
+    logged = db.query(models.ChatLog).filter(models.ChatLog.enrollment_id == enrollment.id).count()
+    assert logged == 2
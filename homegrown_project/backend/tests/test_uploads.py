@@ -0,0 +1,139 @@
+import hashlib
+import os
+import time
+from dataclasses import replace
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app import models
+from backend.app.main import app
+from backend.app.services import upload_service
+
+
+@pytest.fixture
+def client():
+    # No `with`: startup hooks (catalog warm-up, provider, sweeper) are not needed here.
+    return TestClient(app)
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    def set_limits(**overrides):
+        monkeypatch.setattr(upload_service, "settings", replace(upload_service.settings, **overrides))
+
+    return set_limits
+
+
+def _upload(client, enrollment_id, content, filename="page.html"):
+    return client.post(
+        "/api/uploads",
+        data={"enrollment_id": str(enrollment_id)},
+        files={"file": (filename, content, "text/html")},
+    )
+
+
+def _leftovers():
+    return sorted(os.listdir(upload_service.settings.partial_dir))
+
+
+def test_upload_streams_into_blob_storage(db, client, enrollment):
+    content = os.urandom(3 * 1024 * 1024 + 17)
+    sha256 = hashlib.sha256(content).hexdigest()
+
+    r = _upload(client, enrollment.id, content)
+    assert r.status_code == 200, r.text
+    body = r.json()
+    assert body["sha256"] == sha256
+    assert body["stored_name"] == f"blobs/{sha256[:2]}/{sha256}"
+    with open(os.path.join(upload_service.settings.uploads_dir, body["stored_name"]), "rb") as f:
+        assert f.read() == content
+
+    logged = db.query(models.ChatLog).filter(models.ChatLog.enrollment_id == enrollment.id).one()
+    assert logged.content.startswith(f"[FILE_UPLOADED] page.html stored at {body['stored_name']} ")
+
+    again = _upload(client, enrollment.id, content, filename="copy.html").json()
+    assert again["deduplicated"] and again["stored_name"] == body["stored_name"]
+
+
+def test_oversized_upload_is_rejected_without_leftovers(client, enrollment, limits):
+    limits(max_file_bytes=1024)
+    before = _leftovers()
+
+    r = _upload(client, enrollment.id, b"x" * (200 * 1024))
+    assert r.status_code == 413
+    # Within the Content-Length slack for multipart framing, so only the streamed count catches it.
+    r = _upload(client, enrollment.id, b"x" * 2048)
+    assert r.status_code == 413
+    assert _leftovers() == before
+
+
+def test_enrollment_id_must_precede_the_file(client, enrollment):
+    r = client.post(
+        "/api/uploads",
+        files=[("file", ("a.html", b"<p></p>", "text/html")), ("enrollment_id", (None, str(enrollment.id)))],
+    )
+    assert r.status_code == 422
+
+
+def test_quota_is_rechecked_when_the_upload_is_recorded(db, client, enrollment, limits):
+    limits(enrollment_quota_bytes=10)
+    # Both uploads pass the allowance check up front; only one fits once the first is recorded.
+    first = upload_service.new_tmp_path()
+    second = upload_service.new_tmp_path()
+    for path, data in ((first, b"a" * 6), (second, b"b" * 6)):
+        with open(path, "wb") as f:
+            f.write(data)
+
+    upload_service.record_upload(db, enrollment.id, "a", None, 6, hashlib.sha256(b"a" * 6).hexdigest(), first)
+    with pytest.raises(Exception) as rejected:
+        upload_service.record_upload(db, enrollment.id, "b", None, 6, hashlib.sha256(b"b" * 6).hexdigest(), second)
+    assert rejected.value.status_code == 413
+    assert not os.path.exists(second)
+    assert upload_service.enrollment_usage(db, enrollment.id) == 6
+
+
+def test_resumable_upload_recovers_from_an_oversized_chunk(client, enrollment):
+    r = client.post(
+        "/api/uploads/sessions", json={"enrollment_id": enrollment.id, "filename": "site.zip", "total_bytes": 6}
+    )
+    upload_id = r.json()["upload_id"]
+
+    assert client.put(f"/api/uploads/sessions/{upload_id}", params={"offset": 0}, content=b"abc").json()["offset"] == 3
+    assert client.post(f"/api/uploads/sessions/{upload_id}/complete").status_code == 409
+    assert client.put(f"/api/uploads/sessions/{upload_id}", params={"offset": 3}, content=b"defgh").status_code == 413
+    assert client.get(f"/api/uploads/sessions/{upload_id}").json()["offset"] == 3
+    assert client.put(f"/api/uploads/sessions/{upload_id}", params={"offset": 0}, content=b"abc").status_code == 409
+    assert client.put(f"/api/uploads/sessions/{upload_id}", params={"offset": 3}, content=b"def").json()["offset"] == 6
+
+    r = client.post(f"/api/uploads/sessions/{upload_id}/complete")
+    assert r.status_code == 200
+    assert r.json()["sha256"] == hashlib.sha256(b"abcdef").hexdigest()
+    # The session is gone, and so is its lock.
+    assert client.get(f"/api/uploads/sessions/{upload_id}").status_code == 404
+    assert upload_id not in upload_service._session_locks
+
+
+def test_session_larger_than_the_allowance_is_refused(client, enrollment, limits):
+    limits(max_file_bytes=100)
+    r = client.post(
+        "/api/uploads/sessions", json={"enrollment_id": enrollment.id, "filename": "big.zip", "total_bytes": 101}
+    )
+    assert r.status_code == 413
+
+
+def test_sweep_removes_only_abandoned_partials(enrollment):
+    stale_session = upload_service.create_session(enrollment.id, "old.zip", "application/zip", 10)["upload_id"]
+    fresh_session = upload_service.create_session(enrollment.id, "new.zip", "application/zip", 10)["upload_id"]
+    stale_tmp = upload_service.new_tmp_path()
+    open(stale_tmp, "wb").close()
+
+    day_ago = time.time() - 2 * upload_service.settings.partial_ttl_seconds
+    for path in (*upload_service._session_paths(stale_session), stale_tmp):
+        os.utime(path, (day_ago, day_ago))
+
+    removed = upload_service.sweep_partial()
+    assert removed["sessions"] >= 1 and removed["tmp_files"] >= 1
+    assert not os.path.exists(stale_tmp)
+    assert not any(os.path.exists(p) for p in upload_service._session_paths(stale_session))
+    assert all(os.path.exists(p) for p in upload_service._session_paths(fresh_session))
@@ -5,3 +5,67 @@ export const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://127.0.0
 export const api = axios.create({
   baseURL: API_BASE_URL,
 })
+
+// crypto.randomUUID is only available in secure contexts (https or localhost).
+export function newIdempotencyKey() {
+  if (globalThis.crypto?.randomUUID) return globalThis.crypto.randomUUID()
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
+}
+
+// POST /chat/stream and dispatch server-sent events as they arrive.
+// EventSource only supports GET, so the stream is read manually via fetch.
+// Pass the same `idempotencyKey` when retrying a send so the server replays the first reply.
+export async function streamChat({
+  enrollmentId,
+  message,
+  idempotencyKey = newIdempotencyKey(),
+  onToken,
+  onWorkspaceUpdate,
+  signal,
+}) {
+  const res = await fetch(`${API_BASE_URL}/chat/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ enrollment_id: enrollmentId, message, idempotency_key: idempotencyKey }),
+    signal,
+  })
+
+  if (!res.ok || !res.body) {
+    throw new Error(`Chat stream failed (${res.status})`)
+  }
+
+  const reader = res.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  let done = null
+
+  const dispatch = (raw) => {
+    let event = 'message'
+    const dataLines = []
+    for (const line of raw.split('\n')) {
+      if (line.startsWith('event:')) event = line.slice(6).trim()
+      else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim())
+    }
+    if (dataLines.length === 0) return
+
+    const data = JSON.parse(dataLines.join('\n'))
+    if (event === 'token') onToken?.(data.text)
+    else if (event === 'workspace_update') onWorkspaceUpdate?.(data)
+    else if (event === 'done') done = data
+    else if (event === 'error') throw new Error(data.detail || 'Chat stream error')
+  }
+
+  for (;;) {
+    const { value, done: finished } = await reader.read()
+    if (finished) break
+    buffer += decoder.decode(value, { stream: true })
+
+    let idx
+    while ((idx = buffer.indexOf('\n\n')) !== -1) {
+      dispatch(buffer.slice(0, idx))
+      buffer = buffer.slice(idx + 2)
+    }
+  }
+
+  return done
+}
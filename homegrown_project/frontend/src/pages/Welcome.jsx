@@ -20,6 +20,10 @@ function EnrollmentOption({ enrollment }) {
   )
 }
 
+// Scope the picker to one student (until there is a login) via VITE_STUDENT_ID.
+// Unscoped, GET /enrollments lists every student's enrollments: fine for admins and local dev only.
+const STUDENT_ID = import.meta.env.VITE_STUDENT_ID || null
+
 export default function Welcome({ onSelectEnrollment }) {
   const [enrollments, setEnrollments] = useState([])
   const [selectedId, setSelectedId] = useState('')
@@ -40,9 +44,19 @@ export default function Welcome({ onSelectEnrollment }) {
       setIsLoading(true)
       setError(null)
       try {
-        const res = await api.get('/enrollments')
-        if (cancelled) return
-        const list = res.data || []
+        // The API pages by enrollment id; follow next_cursor until every page is in.
+        const list = []
+        let after = null
+        for (;;) {
+          const params = { limit: 200 }
+          if (STUDENT_ID) params.student_id = STUDENT_ID
+          if (after !== null) params.after = after
+          const res = await api.get('/enrollments', { params })
+          if (cancelled) return
+          list.push(...(res.data?.items || []))
+          if (!res.data?.has_more || res.data?.next_cursor == null) break
+          after = res.data.next_cursor
+        }
         setEnrollments(list)
 
         if (list.length > 0) {
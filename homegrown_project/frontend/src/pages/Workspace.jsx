@@ -11,7 +11,7 @@ import {
   Save,
   ArrowLeft,
 } from 'lucide-react'
-import { api } from '../lib/api'
+import { api, streamChat } from '../lib/api'
 
 function cx(...args) {
   return args.filter(Boolean).join(' ')
@@ -131,6 +131,7 @@ function UploadPanel({ enrollmentId, onUploaded }) {
         {result?.ok && (
           <div className="mt-3 rounded-xl border border-emerald-500/20 bg-emerald-500/5 p-3 text-xs text-emerald-100">
             Uploaded <span className="font-semibold">{result.filename}</span>
+            {result.grade_status === 'pending' && ' – queued for grading, results will appear in the chat.'}
           </div>
         )}
 
@@ -156,9 +157,20 @@ export default function Workspace({ enrollment, onBack }) {
   }))
 
   const scrollRef = useRef(null)
+  // Keyset cursors from /chat/history: the oldest loaded page and the newest id seen.
+  const beforeCursorRef = useRef(null)
+  const lastIdRef = useRef(null)
+  const skipAutoScrollRef = useRef(false)
+  const sendingRef = useRef(false)
+  const [hasOlder, setHasOlder] = useState(false)
+  const [isLoadingOlder, setIsLoadingOlder] = useState(false)
+
+  const toMessage = (item) => ({ id: item.id, sender: item.sender, text: item.content })
 
   useEffect(() => {
     let cancelled = false
+    beforeCursorRef.current = null
+    lastIdRef.current = null
 
     async function loadHistory() {
       try {
@@ -168,9 +180,13 @@ export default function Workspace({ enrollment, onBack }) {
 
         if (cancelled) return
 
-        const items = res.data?.items || []
+        const data = res.data || {}
+        const items = data.items || []
+        beforeCursorRef.current = data.before_cursor ?? null
+        lastIdRef.current = data.last_id ?? null
+        setHasOlder(Boolean(data.has_more))
         if (items.length > 0) {
-          setMessages(items.map((i) => ({ sender: i.sender, text: i.content })))
+          setMessages(items.map(toMessage))
           return
         }
       } catch {
@@ -191,9 +207,75 @@ export default function Workspace({ enrollment, onBack }) {
     }
   }, [enrollment.enrollment_id, enrollment.course_title])
 
+  // Fetch only messages newer than the last one we have, and swap them in for the
+  // optimistic (pending) copies added while sending.
+  const syncNewMessages = async () => {
+    const params = { enrollment_id: enrollment.enrollment_id, limit: 100 }
+    if (lastIdRef.current != null) params.since_id = lastIdRef.current
+
+    try {
+      const fresh = []
+      for (;;) {
+        const res = await api.get('/chat/history', { params })
+        const data = res.data || {}
+        fresh.push(...(data.items || []))
+        if (data.last_id != null) lastIdRef.current = data.last_id
+        if (beforeCursorRef.current == null) beforeCursorRef.current = data.before_cursor ?? null
+        if (params.since_id == null || !data.has_more) break
+        params.since_id = lastIdRef.current
+      }
+      if (fresh.length === 0) return
+
+      setMessages((prev) => {
+        const known = new Set(prev.filter((m) => m.id != null).map((m) => m.id))
+        const kept = prev.filter((m) => !m.pending)
+        return [...kept, ...fresh.filter((i) => !known.has(i.id)).map(toMessage)]
+      })
+    } catch {
+      // Polling is best-effort; the next sync picks up where this one stopped.
+    }
+  }
+
+  const syncRef = useRef(syncNewMessages)
+  syncRef.current = syncNewMessages
+
+  useEffect(() => {
+    const timer = setInterval(() => {
+      // Never sync mid-stream: it would swap out the reply tokens are being appended to.
+      if (document.visibilityState === 'visible' && !sendingRef.current) syncRef.current()
+    }, 15000)
+    return () => clearInterval(timer)
+  }, [enrollment.enrollment_id])
+
+  const loadOlder = async () => {
+    if (!beforeCursorRef.current || isLoadingOlder) return
+    setIsLoadingOlder(true)
+    try {
+      const res = await api.get('/chat/history', {
+        params: { enrollment_id: enrollment.enrollment_id, limit: 100, before: beforeCursorRef.current },
+      })
+      const data = res.data || {}
+      beforeCursorRef.current = data.before_cursor ?? beforeCursorRef.current
+      setHasOlder(Boolean(data.has_more))
+      const older = (data.items || []).map(toMessage)
+      if (older.length > 0) {
+        skipAutoScrollRef.current = true
+        setMessages((prev) => [...older, ...prev])
+      }
+    } catch {
+      // ignore; the button stays available for another try
+    } finally {
+      setIsLoadingOlder(false)
+    }
+  }
+
   useEffect(() => {
     const el = scrollRef.current
     if (!el) return
+    if (skipAutoScrollRef.current) {
+      skipAutoScrollRef.current = false
+      return
+    }
     el.scrollTop = el.scrollHeight
   }, [messages, isLoading])
 
@@ -208,34 +290,51 @@ export default function Workspace({ enrollment, onBack }) {
     const msg = input.trim()
     if (!msg || isLoading) return
 
-    setMessages((prev) => [...prev, { sender: 'student', text: msg }])
+    setMessages((prev) => [...prev, { sender: 'student', text: msg, pending: true }])
     setInput('')
     setIsLoading(true)
+    sendingRef.current = true
+
+    let started = false
+    const appendToken = (text) => {
+      if (!started) {
+        started = true
+        setMessages((prev) => [...prev, { sender: 'agent', text, pending: true }])
+        setIsLoading(false)
+        return
+      }
+      setMessages((prev) => {
+        const next = prev.slice()
+        const last = next[next.length - 1]
+        next[next.length - 1] = { ...last, text: last.text + text }
+        return next
+      })
+    }
 
     try {
-      const res = await api.post('/chat', {
-        enrollment_id: enrollment.enrollment_id,
+      await streamChat({
+        enrollmentId: enrollment.enrollment_id,
         message: msg,
+        onToken: appendToken,
+        onWorkspaceUpdate: (update) => {
+          setWorkspace((prev) => ({
+            ...prev,
+            status: update.status || prev.status,
+            title: update.next_module || prev.title,
+            objective: update.objective || prev.objective,
+            moduleIndex: typeof prev.moduleIndex === 'number' ? prev.moduleIndex + 1 : prev.moduleIndex,
+          }))
+        },
       })
-
-      const agentText = res.data?.agent_response || ''
-      setMessages((prev) => [...prev, { sender: 'agent', text: agentText }])
-
-      if (res.data?.workspace_update) {
-        setWorkspace((prev) => ({
-          ...prev,
-          status: res.data.workspace_update.status || prev.status,
-          title: res.data.workspace_update.next_module || prev.title,
-          objective: res.data.workspace_update.objective || prev.objective,
-          moduleIndex: typeof prev.moduleIndex === 'number' ? prev.moduleIndex + 1 : prev.moduleIndex,
-        }))
-      }
+      sendingRef.current = false
+      await syncNewMessages()
     } catch {
       setMessages((prev) => [
         ...prev,
         { sender: 'system', text: 'Connection error. Is the backend running?' },
       ])
     } finally {
+      sendingRef.current = false
       setIsLoading(false)
     }
   }
@@ -264,9 +363,22 @@ export default function Workspace({ enrollment, onBack }) {
           </div>
 
           <div ref={scrollRef} className="h-[calc(100vh-160px)] overflow-y-auto px-4 py-5 space-y-4">
+            {hasOlder && (
+              <div className="flex justify-center">
+                <button
+                  onClick={loadOlder}
+                  disabled={isLoadingOlder}
+                  className="inline-flex items-center gap-2 rounded-full border border-white/10 bg-white/5 px-3 py-1 text-xs text-emerald-200/70 hover:bg-white/10 disabled:opacity-50"
+                >
+                  {isLoadingOlder && <Loader2 size={12} className="animate-spin" />}
+                  Load earlier messages
+                </button>
+              </div>
+            )}
+
             {messages.map((m, idx) => (
               <div
-                key={idx}
+                key={m.id ?? `local-${idx}`}
                 className={cx('flex', m.sender === 'student' ? 'justify-end' : 'justify-start')}
               >
                 <div
@@ -344,7 +456,7 @@ export default function Workspace({ enrollment, onBack }) {
                 </div>
 
                 <div className="mt-6 grid grid-cols-1 lg:grid-cols-2 gap-6">
-                  <UploadPanel enrollmentId={enrollment.enrollment_id} />
+                  <UploadPanel enrollmentId={enrollment.enrollment_id} onUploaded={syncNewMessages} />
                   <NotesPanel key={enrollment.enrollment_id} enrollmentId={enrollment.enrollment_id} />
                 </div>
 